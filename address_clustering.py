@@ -0,0 +1,253 @@
+import json
+import os
+import sys
+from array import array
+from collections import Counter
+import numpy as np
+from config import CLUSTER_DIR, CLUSTER_WRITE_BATCH_SIZE
+
+# Union-find arrays, one int64 per address id, each persisted as a flat binary file
+ARRAYS = ("parent", "size", "min_id", "written")
+
+CYPHER_SET_ENTITY = """
+    UNWIND $rows AS row
+    MATCH (w:Wallet {address: row.address})
+    SET w.entity = row.entity
+    RETURN w.address AS address
+"""
+
+def _looks_like_coinjoin(tx, input_addresses):
+    """CoinJoins spend many owners' coins together; several equal-valued outputs give them away"""
+    values = [entry.get("value") for entry in tx.get("vout", []) if entry.get("value") is not None]
+    if len(input_addresses) < 3 or len(values) < 3:
+        return False
+    return Counter(values).most_common(1)[0][1] >= 3
+
+class AddressClusters:
+    """Common-input-ownership clusters over every address the loader has seen.
+
+    Addresses get dense integer ids in first-seen order (`addresses.txt`). The
+    union-find lives in flat int64 arrays with union by size and path halving.
+    A cluster's entity id is the smallest address id in it, so an existing
+    entity id only changes when its cluster merges into an older one.
+    """
+
+    def __init__(self, directory=CLUSTER_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.meta = self._load_meta()
+        self.ids = {}
+        self.addresses = []
+        path = os.path.join(directory, "addresses.txt")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    address = line.rstrip("\n")
+                    self.ids[address] = len(self.addresses)
+                    self.addresses.append(address)
+        self._saved_addresses = len(self.addresses)
+
+        for name in ARRAYS:
+            values = array("q")
+            path = os.path.join(directory, f"{name}.bin")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    values.frombytes(f.read())
+            setattr(self, name, values)
+        # Addresses appended before a crash but never saved in the arrays become singletons
+        for address_id in range(len(self.parent), len(self.addresses)):
+            self._append_singleton(address_id)
+
+    def _load_meta(self):
+        path = os.path.join(self.directory, "meta.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _append_singleton(self, address_id):
+        self.parent.append(address_id)
+        self.size.append(1)
+        self.min_id.append(address_id)
+        self.written.append(-1)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def add(self, address):
+        address_id = self.ids.get(address)
+        if address_id is None:
+            address_id = self.ids[address] = len(self.addresses)
+            self.addresses.append(address)
+            self._append_singleton(address_id)
+        return address_id
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        self.min_id[a] = min(self.min_id[a], self.min_id[b])
+        return a
+
+    def add_transaction(self, tx):
+        """Register every address of `tx` and merge its input addresses into one cluster"""
+        inputs = list(dict.fromkeys(
+            entry.get("prevout", {}).get("scriptpubkey_address")
+            for entry in tx.get("vin", [])
+            if (entry.get("prevout") or {}).get("scriptpubkey_address")
+        ))
+        for entry in tx.get("vout", []):
+            if entry.get("scriptpubkey_address"):
+                self.add(entry["scriptpubkey_address"])
+        ids = [self.add(address) for address in inputs]
+        if len(ids) > 1 and not _looks_like_coinjoin(tx, inputs):
+            for other in ids[1:]:
+                self.union(ids[0], other)
+
+    def entity_of(self, address):
+        address_id = self.ids.get(address)
+        return None if address_id is None else self.min_id[self.find(address_id)]
+
+    def entities(self):
+        """Entity id of every address id, resolved with vectorized pointer jumping"""
+        roots = np.frombuffer(self.parent, dtype=np.int64).copy()
+        while True:
+            jumped = roots[roots]
+            if np.array_equal(jumped, roots):
+                break
+            roots = jumped
+        return np.frombuffer(self.min_id, dtype=np.int64)[roots]
+
+    def stale(self):
+        """Address ids whose entity differs from the one last written to the graph, with their entities"""
+        entities = self.entities()
+        changed = np.flatnonzero(entities != np.frombuffer(self.written, dtype=np.int64))
+        return changed, entities[changed]
+
+    def forget_written(self):
+        """Treat every entity id as unwritten (e.g. the graph was reloaded from scratch)"""
+        self.written = array("q", [-1]) * len(self.written)
+
+    def mark_written(self, address_ids, entities):
+        for address_id, entity in zip(address_ids, entities):
+            self.written[int(address_id)] = int(entity)
+
+    def stats(self):
+        entities = self.entities()
+        if not len(entities):
+            return {"addresses": 0, "entities": 0, "largest": 0, "multi_address_entities": 0}
+        counts = np.bincount(entities)
+        counts = counts[counts > 0]
+        return {
+            "addresses": len(entities),
+            "entities": int(len(counts)),
+            "largest": int(counts.max()),
+            "multi_address_entities": int((counts > 1).sum()),
+        }
+
+    def save(self, **meta):
+        """Persist new addresses, then the arrays, then the watermark (in that order)"""
+        with open(os.path.join(self.directory, "addresses.txt"), "a", encoding="utf-8") as f:
+            for address in self.addresses[self._saved_addresses:]:
+                f.write(address + "\n")
+        self._saved_addresses = len(self.addresses)
+        for name in ARRAYS:
+            path = os.path.join(self.directory, f"{name}.bin")
+            with open(path + ".tmp", "wb") as f:
+                getattr(self, name).tofile(f)
+            os.replace(path + ".tmp", path)
+        self.meta.update(meta)
+        path = os.path.join(self.directory, "meta.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(path + ".tmp", path)
+
+def reset_clusters(directory=CLUSTER_DIR):
+    for name in ARRAYS + ("addresses",):
+        for suffix in (".bin", ".txt"):
+            path = os.path.join(directory, f"{name}{suffix}")
+            if os.path.exists(path):
+                os.remove(path)
+    meta = os.path.join(directory, "meta.json")
+    if os.path.exists(meta):
+        os.remove(meta)
+
+def update_clusters(store, directory=CLUSTER_DIR):
+    """Feed master-store records appended since the last run into the clusters"""
+    clusters = AddressClusters(directory)
+    offset = int(clusters.meta.get("store_offset", 0))
+    if offset and store.fingerprint(offset) != clusters.meta.get("store_hash"):
+        print("[CLUSTERS] Master store changed since the last run; rebuilding clusters")
+        reset_clusters(directory)
+        clusters, offset = AddressClusters(directory), 0
+
+    processed = 0
+    end = offset
+    for _, end_offset, tx in store.iter_records(offset):
+        clusters.add_transaction(tx)
+        end = end_offset
+        processed += 1
+    clusters.save(store_offset=end, store_hash=store.fingerprint(end))
+    print(f"[CLUSTERS] Processed {processed} new records; {clusters.stats()}")
+    return clusters
+
+def _write_entities(tx, rows):
+    return [record["address"] for record in tx.run(CYPHER_SET_ENTITY, rows=rows)]
+
+def write_entities(clusters, batch_size=CLUSTER_WRITE_BATCH_SIZE):
+    """Write changed entity ids onto Wallet nodes, one transaction per batch"""
+    from neo4j_connection import get_session
+    address_ids, entities = clusters.stale()
+    written = 0
+    for start in range(0, len(address_ids), batch_size):
+        ids = address_ids[start:start + batch_size]
+        rows = [
+            {"address": clusters.addresses[int(address_id)], "entity": int(entity)}
+            for address_id, entity in zip(ids, entities[start:start + batch_size])
+        ]
+        # Addresses whose Wallet node is not in the graph yet stay stale and are retried next run
+        with get_session() as session:
+            matched = set(session.execute_write(_write_entities, rows))
+        done = [i for i, row in enumerate(rows) if row["address"] in matched]
+        clusters.mark_written(ids[done], entities[start:start + batch_size][done])
+        written += len(done)
+    clusters.save()
+    print(f"[CLUSTERS] Wrote entity ids to {written} wallets ({len(address_ids) - written} not in the graph yet)")
+    return written
+
+def cluster_and_write(store, rewrite_all=False):
+    clusters = update_clusters(store)
+    if rewrite_all:
+        clusters.forget_written()
+    return write_entities(clusters)
+
+if __name__ == "__main__":
+    usage = "Usage: python address_clustering.py [update|rebuild|stats]"
+    command = sys.argv[1] if len(sys.argv) > 1 else "update"
+    if command == "stats":
+        print(AddressClusters().stats())
+    elif command in ("update", "rebuild"):
+        from master_store import open_master_store
+        from neo4j_connection import close_connections
+        if command == "rebuild":
+            reset_clusters()
+        store = open_master_store()
+        try:
+            cluster_and_write(store)
+        finally:
+            store.close()
+            close_connections()
+    else:
+        print(usage)
+        sys.exit(1)
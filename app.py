@@ -5,7 +5,12 @@ from langchain.chains import GraphCypherQAChain
 from langchain.chains.summarize import load_summarize_chain
 from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
-from config import NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, GROQ_API_KEY
+from config import (
+    NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, GROQ_API_KEY, SPOOL_DIR,
+    CYCLE_MAX_HOPS, CYCLE_MIN_VALUE, CYCLE_WINDOW_BLOCKS, CYCLE_LIMIT
+)
+from master_store import merge_spool_to_master
+from cycle_finder import circular_patterns
 from llm_prompt_templates import CYPHER_GENERATION_TEMPLATE,SUMMARY_GENERATION_TEMPLATE
 import subprocess
 import threading
@@ -13,11 +18,9 @@ import time
 import os
 import sys
 import psutil
-import json
+import re
 
 # Define file paths for real-time data ingestion
-TMP_JSONL_PATH = "bitcoin_transactions_realtime_tmp.jsonl"
-FINAL_JSON_PATH = "bitcoin_transactions_backup.json"
 TRACKING_FILE = ".realtime_ingestion_pid"
 
 # Page configuration
@@ -41,49 +44,13 @@ def is_ingestion_running():
             return False
     return False
 
-# Import the merge function directly from realtime_data_ingestion
-def merge_jsonl_to_master(jsonl_path=TMP_JSONL_PATH, master_path=FINAL_JSON_PATH):
-    """Merge temporary transaction data into master file."""
-    # Load existing master file (list of dicts)
-    if os.path.exists(master_path):
-        with open(master_path, "r", encoding="utf-8") as f:
-            try:
-                master_list = json.load(f)
-            except Exception:
-                master_list = []
-    else:
-        master_list = []
-    
-    master_txids = set(tx["txid"] for tx in master_list if "txid" in tx)
-
-    # Read all new transactions from the temp JSONL file
-    new_txs = []
-    if os.path.exists(jsonl_path):
-        with open(jsonl_path, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    tx = json.loads(line)
-                    if tx.get("txid") not in master_txids:
-                        new_txs.append(tx)
-                        master_txids.add(tx.get("txid"))
-                except Exception:
-                    continue
-
-    # Merge and save
-    if new_txs:
-        master_list.extend(new_txs)
-        with open(master_path, "w", encoding="utf-8") as f:
-            json.dump(master_list, f, indent=2)
-        print(f"Merged {len(new_txs)} new transactions into {master_path}")
-
-        # Remove temp file
-        if os.path.exists(jsonl_path):
-            os.remove(jsonl_path)
-        return f"Merged {len(new_txs)} new transactions"
-    else:
-        print("No new transactions to merge.")
-        return "No new transactions to merge"
-   
+# Merge the realtime spool into the master store (shared with realtime_data_ingestion)
+def merge_jsonl_to_master(spool_dir=SPOOL_DIR):
+    """Merge spooled transaction data into the master store."""
+    merged = merge_spool_to_master(spool_dir)
+    if merged:
+        return f"Merged {merged} new transactions"
+    return "No new transactions to merge"
 
 # Function to start real-time data ingestion in a separate process
 def start_realtime_ingestion():
@@ -135,7 +102,7 @@ def stop_realtime_ingestion():
             # Execute merge function after stopping
             try:
                 # Call the merge function with the correct parameters
-                result = merge_jsonl_to_master(TMP_JSONL_PATH, FINAL_JSON_PATH)
+                result = merge_jsonl_to_master(SPOOL_DIR)
                 st.success(f"Successfully merged data: {result}")
             except Exception as e:
                 st.error(f"Error merging data: {str(e)}")
@@ -146,6 +113,25 @@ def stop_realtime_ingestion():
             return False
     return True  # Already stopped
 
+# Questions answered by a purpose-built search instead of generated Cypher
+# Whole words only, so e.g. "recycled" or "bicycle" do not trigger the cycle search
+CIRCULAR_QUERY_PATTERN = re.compile(r"\b(?:cycles?|circular)\b", re.IGNORECASE)
+
+def is_circular_pattern_query(query):
+    return CIRCULAR_QUERY_PATTERN.search(query) is not None
+
+def run_circular_pattern_search():
+    """Stream bounded-depth wallet cycles into the page; returns (description, results) like the Cypher chain"""
+    description = (f"// cycle_finder.circular_patterns(max_hops={CYCLE_MAX_HOPS}, min_value={CYCLE_MIN_VALUE}, "
+                   f"window_blocks={CYCLE_WINDOW_BLOCKS}, limit={CYCLE_LIMIT})")
+    progress = st.empty()
+    results = []
+    for cycle in circular_patterns():
+        results.append(cycle)
+        progress.markdown(f"Found {len(results)} circular flows so far...")
+    progress.empty()
+    return description, results
+
 # Initialize Neo4j connection directly
 @st.cache_resource
 def get_graph():
@@ -299,16 +285,21 @@ if user_query:
     # Process query and display response
     with st.chat_message("assistant"):
         try:
-            with st.spinner("Converting to Cypher query..."):
-                # Process query with GraphCypherQAChain
-                result = chain.invoke({"query": user_query})
-                
-                # Extract generated Cypher query and results
-                cypher_query = result["intermediate_steps"][0]
-                query_results = result["intermediate_steps"][1]
-                
-                st.markdown("### Cypher Query:")
-                st.code(cypher_query, language="cypher")
+            if is_circular_pattern_query(user_query):
+                # Unbounded variable-length Cypher would time out; use the bounded cycle finder
+                with st.spinner("Searching for circular flows..."):
+                    cypher_query, query_results = run_circular_pattern_search()
+            else:
+                with st.spinner("Converting to Cypher query..."):
+                    # Process query with GraphCypherQAChain
+                    result = chain.invoke({"query": user_query})
+
+                    # Extract generated Cypher query and results
+                    cypher_query = result["intermediate_steps"][0]
+                    query_results = result["intermediate_steps"][1]
+
+            st.markdown("### Cypher Query:")
+            st.code(cypher_query, language="cypher")
             
             with st.spinner("Processing results..."):
                 if query_results:
@@ -1,10 +1,27 @@
-from flask import Flask, render_template, jsonify, request
-from nlp_analysis import generate_summary_high_value_bitcoin_transactions, analyze_smurfing_patterns
+import json
+from flask import Flask, Response, render_template, jsonify, request
+from langchain_groq import ChatGroq
+from nlp_analysis import generate_summary_high_value_bitcoin_transactions, analyze_smurfing_patterns, analyze_peel_chains
 from graph_utils import query_Neo4j_database  # Import the utility function
-from config import high_value_query, smurfing_query
+from neo4j_connection import get_driver
+from cycle_finder import circular_patterns
+from flow_tracer import Neo4jFlowBackend, trace_page
+from peel_chains import peel_chain_results
+from config import (
+    GROQ_API_KEY, high_value_query, smurfing_query, CYCLE_MAX_HOPS, CYCLE_MIN_VALUE, CYCLE_WINDOW_BLOCKS, CYCLE_LIMIT,
+    TRACE_MAX_DEPTH, TRACE_MIN_VALUE, TRACE_MAX_FANOUT, TRACE_POLICY, TRACE_PAGE_SIZE
+)
 
 app = Flask(__name__)
 
+def get_llm():
+    """Same model and settings as the chat app (app.py); a failure surfaces as the route's error"""
+    return ChatGroq(
+        model="llama-3.1-8b-instant",
+        temperature=0.3,
+        api_key=GROQ_API_KEY
+    )
+
 @app.route('/')
 def index():
     """Home page with analysis buttons"""
@@ -28,15 +45,72 @@ def smurfing_analysis():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
+@app.route('/api/peel-chain-analysis', methods=['POST'])
+def peel_chain_analysis():
+    """Generate peel chain analysis"""
+    try:
+        summary = analyze_peel_chains(get_llm())
+        return jsonify({"success": True, "summary": summary})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+@app.route('/api/circular-patterns', methods=['GET'])
+def circular_pattern_search():
+    """Stream bounded-depth wallet cycles as newline-delimited JSON, one cycle per line as it is found"""
+    params = {
+        "max_hops": request.args.get('max_hops', CYCLE_MAX_HOPS, type=int),
+        "min_value": request.args.get('min_value', CYCLE_MIN_VALUE, type=int),
+        "window_blocks": request.args.get('window_blocks', CYCLE_WINDOW_BLOCKS, type=int),
+        "limit": request.args.get('limit', CYCLE_LIMIT, type=int),
+        "min_height": request.args.get('min_height', type=int),
+        "max_height": request.args.get('max_height', type=int),
+    }
+
+    def generate():
+        try:
+            for cycle in circular_patterns(**params):
+                yield json.dumps(cycle) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/api/trace', methods=['GET'])
+def trace_flow():
+    """One page of a value trace from ?txid= or ?address= (forward or backward, haircut or fifo)"""
+    try:
+        page = request.args.get('page', 0, type=int)
+        page_size = request.args.get('page_size', TRACE_PAGE_SIZE, type=int)
+        options = {
+            "direction": request.args.get('direction', 'forward'),
+            "policy": request.args.get('policy', TRACE_POLICY),
+            "max_depth": request.args.get('max_depth', TRACE_MAX_DEPTH, type=int),
+            "min_value": request.args.get('min_value', TRACE_MIN_VALUE, type=int),
+            "max_fanout": request.args.get('max_fanout', TRACE_MAX_FANOUT, type=int),
+        }
+        for key in ("txid", "address"):
+            if request.args.get(key):
+                options[key] = request.args[key]
+        if request.args.get('amount'):
+            options["amount"] = request.args.get('amount', type=int)
+        records = trace_page(Neo4jFlowBackend(), page=page, page_size=page_size, **options)
+        return jsonify({"success": True, "page": page, "records": records,
+                        "next_page": page + 1 if len(records) == page_size else None})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
 @app.route('/api/graph-data', methods=['GET'])
 def get_graph_data():
     """Fetch graph data for visualization using the utils.py function"""
     analysis_type = request.args.get('type', 'high-value')
     
     try:
-        # Use the query_Neo4j_database function with the appropriate query
-        query = high_value_query if analysis_type == 'high-value' else smurfing_query
-        results = query_Neo4j_database(query)
+        # Peel chains come from the cached detector; the other analyses are single queries
+        if analysis_type == 'peel-chain':
+            results = peel_chain_results()
+        else:
+            query = high_value_query if analysis_type == 'high-value' else smurfing_query
+            results = query_Neo4j_database(query)
         
         # Format data for visualization
         nodes = []
@@ -116,6 +190,39 @@ def get_graph_data():
                                 "target": receiver_idx,
                                 "type": "RECEIVED"
                             })
+        elif analysis_type == 'peel-chain':
+            # Each chain is a path of transactions linked by their change outputs
+            for chain in results:
+                previous = None
+                for tx_id, peel_address, peeled in zip(chain['txids'], chain['peel_addresses'], chain['peeled']):
+                    if tx_id not in node_map:
+                        node_map[tx_id] = len(nodes)
+                        nodes.append({
+                            "id": tx_id,
+                            "label": tx_id[:8] + "...",
+                            "type": "transaction",
+                            "chain": chain['start_txid']
+                        })
+                    if previous is not None:
+                        links.append({
+                            "source": node_map[previous],
+                            "target": node_map[tx_id],
+                            "type": "CHANGE"
+                        })
+                    if peel_address not in node_map:
+                        node_map[peel_address] = len(nodes)
+                        nodes.append({
+                            "id": peel_address,
+                            "label": peel_address[:10] + "...",
+                            "type": "wallet"
+                        })
+                    links.append({
+                        "source": node_map[tx_id],
+                        "target": node_map[peel_address],
+                        "type": "RECEIVED",
+                        "value": peeled
+                    })
+                    previous = tx_id
         else:
             # Process smurfing pattern results
             for pattern in results:
@@ -156,4 +263,6 @@ def get_graph_data():
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
+    # Warm up the shared connection pool once; it is closed at interpreter exit
+    get_driver()
     app.run(debug=True)
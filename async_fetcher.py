@@ -0,0 +1,179 @@
+import asyncio
+import random
+import time
+import aiohttp
+from config import (
+    BLOCKSTREAM_API, BLOCKSTREAM_RATE_LIMIT, BLOCKSTREAM_BURST,
+    BLOCKSTREAM_MIN_CONCURRENCY, BLOCKSTREAM_MAX_CONCURRENCY
+)
+
+class TokenBucket:
+    """Global request-rate limiter shared by every in-flight request"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: grows slowly on success, halves on 429/5xx"""
+
+    def __init__(self, initial, minimum, maximum):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            while self.in_flight >= int(self.limit):
+                await self._cond.wait()
+            self.in_flight += 1
+
+    async def release(self, throttled=False):
+        async with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+class FetchStats:
+    """Request counters plus a fixed-size uniform reservoir sample of latencies for the percentiles"""
+
+    def __init__(self, sample_size=10_000):
+        self.started = time.monotonic()
+        self.sample_size = sample_size
+        self.latencies = []
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+
+    def record(self, seconds):
+        self.requests += 1
+        if len(self.latencies) < self.sample_size:
+            self.latencies.append(seconds)
+        else:
+            # Reservoir sampling: every request so far is kept with equal probability
+            slot = random.randrange(self.requests)
+            if slot < self.sample_size:
+                self.latencies[slot] = seconds
+
+    def requests_per_second(self):
+        elapsed = time.monotonic() - self.started
+        return self.requests / elapsed if elapsed > 0 else 0.0
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self):
+        return (f"{self.requests} requests, {self.requests_per_second():.1f} req/s, "
+                f"p50 {self.percentile(50) * 1000:.0f} ms, p99 {self.percentile(99) * 1000:.0f} ms, "
+                f"{self.throttled} throttled, {self.errors} failed")
+
+class AsyncTxFetcher:
+    """Fetch many /tx/{txid} documents over one pooled keep-alive client.
+
+    A token bucket caps the global request rate, an AIMD limiter adapts
+    concurrency to 429/5xx responses, and failed requests are retried with
+    jittered exponential backoff. Results are yielded as they complete.
+    """
+
+    def __init__(self, api_base=BLOCKSTREAM_API, rate=BLOCKSTREAM_RATE_LIMIT, burst=BLOCKSTREAM_BURST,
+                 min_concurrency=BLOCKSTREAM_MIN_CONCURRENCY, max_concurrency=BLOCKSTREAM_MAX_CONCURRENCY,
+                 max_retries=4, backoff_base=0.5, backoff_cap=30, timeout=10):
+        self.api_base = api_base.rstrip("/")
+        self.rate = rate
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.stats = FetchStats()
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    async def _fetch_one(self, session, bucket, limiter, txid):
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            await limiter.acquire()
+            throttled = False
+            retry_after = None
+            started = time.monotonic()
+            try:
+                async with session.get(f"{self.api_base}/tx/{txid}") as response:
+                    self.stats.record(time.monotonic() - started)
+                    if response.status == 200:
+                        return await response.json(content_type=None)
+                    if response.status == 404:
+                        return None
+                    if response.status == 429 or response.status >= 500:
+                        throttled = True
+                        self.stats.throttled += 1
+                        header = response.headers.get("Retry-After")
+                        if header and header.isdigit():
+                            retry_after = int(header)
+                    else:
+                        print(f"[STATUS CHECK] Transaction {txid} | Unexpected HTTP status {response.status}")
+                        self.stats.errors += 1
+                        return None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.stats.record(time.monotonic() - started)
+                print(f"[STATUS CHECK] Transaction {txid} | Connection error: {e}")
+            finally:
+                await limiter.release(throttled=throttled)
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+        self.stats.errors += 1
+        print(f"[STATUS CHECK] Transaction {txid} | Giving up after {self.max_retries + 1} attempts")
+        return None
+
+    async def fetch_many(self, txids):
+        """Async generator of (txid, tx or None), in completion order"""
+        bucket = TokenBucket(self.rate, self.burst)
+        limiter = AdaptiveLimiter(self.min_concurrency, self.min_concurrency, self.max_concurrency)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            async def fetch(txid):
+                return txid, await self._fetch_one(session, bucket, limiter, txid)
+
+            # Keep a bounded number of tasks alive so huge backlogs don't create millions at once
+            pending = set()
+            txids = iter(txids)
+            window = self.max_concurrency * 4
+            for txid in txids:
+                pending.add(asyncio.ensure_future(fetch(txid)))
+                if len(pending) >= window:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
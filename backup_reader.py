@@ -0,0 +1,102 @@
+import json
+import os
+from itertools import islice
+
+def iter_json_array(path, chunk_size=1 << 20):
+    """Yield the elements of a top-level JSON array one at a time without loading the whole file"""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(chunk_size)
+        pos = 0
+        eof = not buf
+
+        def fill():
+            nonlocal buf, pos, eof
+            more = f.read(chunk_size)
+            if not more:
+                eof = True
+                return False
+            buf = buf[pos:] + more
+            pos = 0
+            return True
+
+        # Skip to the opening bracket
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf):
+                break
+            if not fill():
+                return
+        if buf[pos] != "[":
+            raise ValueError(f"{path} does not contain a JSON array")
+        pos += 1
+
+        while True:
+            # Skip separators between elements
+            while True:
+                while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ","):
+                    pos += 1
+                if pos < len(buf) or not fill():
+                    break
+            if pos >= len(buf):
+                raise ValueError(f"{path} ended before the JSON array was closed")
+            if buf[pos] == "]":
+                return
+
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Element straddles the chunk boundary; read more and retry
+                if eof or not fill():
+                    raise
+                continue
+            yield item
+            pos = end
+
+            # Drop consumed text so the buffer stays around one chunk
+            if pos > chunk_size:
+                buf = buf[pos:]
+                pos = 0
+
+def iter_jsonl(path):
+    """Yield one record per line from a JSONL file, skipping blank or torn lines"""
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+def _is_json_array(path):
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            ch = f.read(1)
+            if not ch:
+                return True  # empty file: treat as an empty array
+            if not ch.isspace():
+                return ch == "["
+
+def iter_backup_transactions(path):
+    """Stream transactions from a JSON array backup, a JSONL file or a spool directory"""
+    if os.path.isdir(path):
+        from spool import iter_spool
+        records = iter_spool(path)
+    elif _is_json_array(path):
+        records = iter_json_array(path)
+    else:
+        records = iter_jsonl(path)
+    for tx in records:
+        if isinstance(tx, dict) and tx.get("txid"):
+            yield tx
+
+def iter_chunks(iterable, size):
+    """Group any iterable into lists of at most `size` items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
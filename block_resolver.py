@@ -0,0 +1,194 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from config import BLOCKSTREAM_API, CONFIRMATION_STATE_PATH, CONFIRMATION_LOOKBACK_BLOCKS
+
+class BlockConfirmationResolver:
+    """Confirm spooled transactions by walking new blocks instead of polling each txid.
+
+    For every block mined since the stored tip height, the block's txid list
+    is fetched once (`/block/{hash}/txids`) and intersected in memory with the
+    unconfirmed set; full details are fetched only for the matches. The tip is
+    persisted after every block so an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, api_base=BLOCKSTREAM_API, state_path=CONFIRMATION_STATE_PATH,
+                 lookback_blocks=CONFIRMATION_LOOKBACK_BLOCKS, session=None, timeout=10, max_retries=3):
+        self.api_base = api_base.rstrip("/")
+        self.state_path = state_path
+        self.lookback_blocks = lookback_blocks
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+    def _get(self, path):
+        last_error = None
+        for attempt in range(self.max_retries):
+            try:
+                response = self.session.get(f"{self.api_base}{path}", timeout=self.timeout)
+                if response.status_code == 404:
+                    return None
+                response.raise_for_status()
+                return response
+            except requests.exceptions.RequestException as e:
+                last_error = e
+                time.sleep(2 ** attempt)
+        raise RuntimeError(f"GET {path} failed after {self.max_retries} attempts: {last_error}")
+
+    def tip_height(self):
+        return int(self._get("/blocks/tip/height").text)
+
+    def block_hash(self, height):
+        response = self._get(f"/block-height/{height}")
+        return response.text.strip() if response is not None else None
+
+    def block_txids(self, block_hash):
+        response = self._get(f"/block/{block_hash}/txids")
+        return response.json() if response is not None else []
+
+    def fetch_tx(self, txid):
+        response = self._get(f"/tx/{txid}")
+        return response.json() if response is not None else None
+
+    def load_tip(self):
+        """Last block height already scanned, or None on the first run"""
+        if not os.path.exists(self.state_path):
+            return None
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return int(json.load(f)["height"])
+        except (ValueError, KeyError, OSError):
+            return None
+
+    def save_tip(self, height):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"height": height}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def resolve(self, unconfirmed_txids, fetch_tx=None):
+        """Return full details of every txid in `unconfirmed_txids` mined since the stored tip"""
+        fetch_tx = fetch_tx or self.fetch_tx
+        pending = set(unconfirmed_txids)
+        tip = self.tip_height()
+        if not pending:
+            # Nothing to look for: move the tip so the next run does not replay these blocks
+            self.save_tip(tip)
+            return []
+        stored = self.load_tip()
+        if stored is None or stored > tip:
+            # First run (or a reorg past our tip): only look back a bounded window
+            stored = max(tip - self.lookback_blocks, 0)
+        elif tip - stored > self.lookback_blocks:
+            # After an outage the whole gap is walked; skipping part of it would lose confirmations
+            print(f"[DOCKER LOG] Walking {tip - stored} blocks missed since height {stored}")
+
+        confirmed = []
+        scanned = 0
+        # Set once a block's matched txid fails to resolve: the tip then stays before that block
+        unresolved_at = None
+        for height in range(stored + 1, tip + 1):
+            if not pending:
+                break
+            block_hash = self.block_hash(height)
+            if block_hash is None:
+                break
+            matches = pending.intersection(self.block_txids(block_hash))
+            for txid in matches:
+                details = fetch_tx(txid)
+                if details and details.get("status", {}).get("confirmed", False):
+                    confirmed.append(details)
+                    pending.discard(txid)
+                elif unresolved_at is None:
+                    unresolved_at = height
+            scanned += 1
+            if unresolved_at is None:
+                self.save_tip(height)
+
+        if unresolved_at is not None:
+            print(f"[DOCKER LOG] A transaction in block {unresolved_at} did not resolve; the next run rescans from there")
+        elif not pending:
+            # Nothing left to look for: later runs can start from the current tip
+            self.save_tip(tip)
+        print(f"[DOCKER LOG] Scanned {scanned} blocks up to height {tip}; {len(confirmed)} transactions confirmed")
+        return confirmed
+
+def _stand_in_server(blocks, transactions):
+    """Local Blockstream stand-in: `blocks` maps height -> txids, `transactions` maps txid -> document"""
+    routes = {"/blocks/tip/height": str(max(blocks))}
+    for height, txids in blocks.items():
+        routes[f"/block-height/{height}"] = f"hash{height}"
+        routes[f"/block/hash{height}/txids"] = json.dumps(txids)
+    for txid, tx in transactions.items():
+        routes[f"/tx/{txid}"] = json.dumps(tx)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = routes.get(self.path)
+            self.send_response(200 if body is not None else 404)
+            self.end_headers()
+            if body is not None:
+                self.wfile.write(body.encode("utf-8"))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def check_against_stand_in():
+    """Resolve fixture blocks served by a local HTTP stand-in; returns the number of failed checks"""
+    blocks = {height: [f"{height:064x}"] for height in range(100, 111)}
+    transactions = {txids[0]: {"txid": txids[0], "status": {"confirmed": True, "block_height": height}}
+                    for height, txids in blocks.items()}
+    server = _stand_in_server(blocks, transactions)
+    failures = 0
+
+    def expect(label, condition):
+        nonlocal failures
+        if not condition:
+            failures += 1
+            print(f"[RESOLVER] FAILED: {label}")
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            resolver = BlockConfirmationResolver(api_base=f"http://127.0.0.1:{server.server_port}",
+                                                 state_path=os.path.join(tmp, "tip.json"), lookback_blocks=3)
+            # First run: only the lookback window (108..110) is scanned
+            found = {tx["txid"] for tx in resolver.resolve([blocks[101][0], blocks[109][0]])}
+            expect("first run finds a txid inside the lookback window", found == {blocks[109][0]})
+            expect("first run stores the tip", resolver.load_tip() == 110)
+
+            # Outage longer than the lookback window: 101..110 must all be walked
+            resolver.save_tip(100)
+            found = {tx["txid"] for tx in resolver.resolve([blocks[102][0], blocks[110][0]])}
+            expect("a txid mined in the outage gap is confirmed", found == {blocks[102][0], blocks[110][0]})
+
+            # A matched txid whose details do not resolve keeps the tip before its block
+            resolver.save_tip(104)
+            stale = {blocks[106][0]: {"status": {"confirmed": False}}}
+            found = resolver.resolve([blocks[106][0], blocks[108][0]], fetch_tx=lambda txid: stale.get(txid) or
+                                     resolver.fetch_tx(txid))
+            expect("the other txid is still confirmed", {tx["txid"] for tx in found} == {blocks[108][0]})
+            expect("the tip stays before the unresolved block", resolver.load_tip() == 105)
+
+            # No pending txids still moves the tip
+            resolver.save_tip(104)
+            expect("empty set returns nothing", resolver.resolve([]) == [])
+            expect("empty set advances the tip", resolver.load_tip() == 110)
+    finally:
+        server.shutdown()
+    print(f"[RESOLVER] Block resolver check finished with {failures} failures")
+    return failures
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["check"]:
+        sys.exit(1 if check_against_stand_in() else 0)
+    print("Usage: python block_resolver.py check")
+    sys.exit(1)
@@ -0,0 +1,171 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import zlib
+from graph_utils import flatten_transactions
+from config import CSV_EXPORT_MEMORY_MB, CSV_EXPORT_MAX_PARTITIONS
+
+# Deduplicating a bucket keeps its raw lines in a dict; Python needs roughly this many bytes per input byte
+DEDUP_MEMORY_FACTOR = 3
+
+# Header rows in the format `neo4j-admin database import` expects.
+# ID spaces keep txids, addresses and block heights from colliding.
+CSV_HEADERS = {
+    "wallets": ["address:ID(Wallet)"],
+    "transactions": ["txid:ID(Transaction)", "value:long", "fee:long", "size:long", "vsize:long", "fee_rate:double",
+                     "seen_time:long", "confirmed:boolean", "block_height:long", "block_time:long", "name"],
+    "blocks": [":ID(Block)", "height:long", "hash", "name"],
+    "sent": [":START_ID(Wallet)", ":END_ID(Transaction)", "value:long"],
+    "received": [":START_ID(Transaction)", ":END_ID(Wallet)", "value:long"],
+    "included_in": [":START_ID(Transaction)", ":END_ID(Block)"],
+}
+
+# (option, label or type, file stem) for the import command
+IMPORT_FILES = [
+    ("--nodes", "Wallet", "wallets"),
+    ("--nodes", "Transaction", "transactions"),
+    ("--nodes", "Block", "blocks"),
+    ("--relationships", "SENT", "sent"),
+    ("--relationships", "RECEIVED", "received"),
+    ("--relationships", "INCLUDED_IN", "included_in"),
+]
+
+def _partition(key, partitions):
+    return zlib.crc32(str(key).encode("utf-8")) % partitions
+
+def _open_partitions(directory, prefix, partitions):
+    return [
+        open(os.path.join(directory, f"{prefix}-{i:04d}.tmp"), "w", encoding="utf-8")
+        for i in range(partitions)
+    ]
+
+def _close_all(files):
+    for f in files:
+        f.close()
+
+def _open_csv(out_dir, stem):
+    f = open(os.path.join(out_dir, f"{stem}.csv"), "w", encoding="utf-8", newline="")
+    return f, csv.writer(f)
+
+def import_command(out_dir, database="neo4j"):
+    """Build the neo4j-admin command that imports the generated files"""
+    parts = ["neo4j-admin database import full"]
+    for option, name, stem in IMPORT_FILES:
+        header = os.path.join(out_dir, f"{stem}_header.csv")
+        data = os.path.join(out_dir, f"{stem}.csv")
+        parts.append(f"{option}={name}={header},{data}")
+    parts.append(database)
+    return " \\\n    ".join(parts)
+
+def partition_count(input_bytes, memory_mb=CSV_EXPORT_MEMORY_MB, max_partitions=CSV_EXPORT_MAX_PARTITIONS):
+    """Enough buckets for one bucket's dedup set to fit in `memory_mb` (capped by open-file limits)"""
+    budget = max(1, memory_mb) * 1024 * 1024
+    needed = -(-input_bytes * DEDUP_MEMORY_FACTOR // budget)
+    if needed > max_partitions:
+        print(f"[CSV EXPORT] {input_bytes} input bytes need {needed} buckets for {memory_mb} MB; "
+              f"capped at {max_partitions}, so buckets will exceed the budget")
+    return max(1, min(needed, max_partitions))
+
+def export_backup_to_csv(transactions, out_dir, partitions=None, input_bytes=None):
+    """Stream transactions into deduplicated neo4j-admin import CSV files.
+
+    Records are hash-partitioned into temporary bucket files on disk and each
+    bucket is deduplicated on its own, so peak memory is bounded by the largest
+    bucket rather than by the size of the backup. The bucket count follows
+    `input_bytes` (the size of the source) and CSV_EXPORT_MEMORY_MB.
+    """
+    if partitions is None:
+        partitions = partition_count(input_bytes) if input_bytes is not None else 64
+    print(f"[CSV EXPORT] Using {partitions} buckets")
+    os.makedirs(out_dir, exist_ok=True)
+    scratch = tempfile.mkdtemp(prefix="csv-import-", dir=out_dir)
+    counts = {stem: 0 for stem in CSV_HEADERS}
+
+    try:
+        # Pass 1: spread raw transactions over buckets by txid
+        tx_parts = _open_partitions(scratch, "tx", partitions)
+        try:
+            for tx in transactions:
+                line = json.dumps(tx, separators=(",", ":"))
+                tx_parts[_partition(tx["txid"], partitions)].write(line + "\n")
+        finally:
+            _close_all(tx_parts)
+
+        # Pass 2: keep the last record per txid, emit transaction and relationship rows,
+        # and spill wallet and block keys into their own buckets
+        wallet_parts = _open_partitions(scratch, "wallet", partitions)
+        block_parts = _open_partitions(scratch, "block", partitions)
+        outputs = {stem: _open_csv(out_dir, stem) for stem in ("transactions", "sent", "received", "included_in")}
+        try:
+            for i in range(partitions):
+                latest = {}
+                with open(os.path.join(scratch, f"tx-{i:04d}.tmp"), "r", encoding="utf-8") as f:
+                    for line in f:
+                        latest[json.loads(line)["txid"]] = line
+
+                for txid, line in latest.items():
+                    rows = flatten_transactions([json.loads(line)])
+                    for row in rows["transactions"]:
+                        outputs["transactions"][1].writerow(
+                            [row["txid"], row["total_sent"], row["fee"], row["size"], row["vsize"], row["fee_rate"],
+                             row["seen_time"], str(row["confirmed"]).lower(),
+                             row["block_height"], row["block_time"], row["txid"]]
+                        )
+                        counts["transactions"] += 1
+                    for row in rows["blocks"]:
+                        outputs["included_in"][1].writerow([row["txid"], row["block_height"]])
+                        counts["included_in"] += 1
+                        block_parts[_partition(row["block_height"], partitions)].write(
+                            f"{row['block_height']}\t{row['block_hash'] or ''}\n"
+                        )
+                    # MERGE collapses repeated (wallet, tx) pairs with the last value winning
+                    for stem in ("sent", "received"):
+                        edges = {row["address"]: row["value"] for row in rows[stem]}
+                        for address, value in edges.items():
+                            if stem == "sent":
+                                outputs[stem][1].writerow([address, txid, value])
+                            else:
+                                outputs[stem][1].writerow([txid, address, value])
+                            counts[stem] += 1
+                    for address in rows["addresses"]:
+                        wallet_parts[_partition(address, partitions)].write(address + "\n")
+        finally:
+            _close_all(wallet_parts)
+            _close_all(block_parts)
+            for f, _ in outputs.values():
+                f.close()
+
+        # Pass 3: deduplicate wallets and blocks one bucket at a time
+        wallets_file, wallets_csv = _open_csv(out_dir, "wallets")
+        blocks_file, blocks_csv = _open_csv(out_dir, "blocks")
+        try:
+            for i in range(partitions):
+                with open(os.path.join(scratch, f"wallet-{i:04d}.tmp"), "r", encoding="utf-8") as f:
+                    addresses = {line.rstrip("\n") for line in f}
+                for address in addresses:
+                    wallets_csv.writerow([address])
+                counts["wallets"] += len(addresses)
+
+                blocks = {}
+                with open(os.path.join(scratch, f"block-{i:04d}.tmp"), "r", encoding="utf-8") as f:
+                    for line in f:
+                        height, block_hash = line.rstrip("\n").split("\t")
+                        blocks[int(height)] = block_hash or blocks.get(int(height), "")
+                for height, block_hash in blocks.items():
+                    blocks_csv.writerow([height, height, block_hash, str(height)])
+                counts["blocks"] += len(blocks)
+        finally:
+            wallets_file.close()
+            blocks_file.close()
+
+        for stem, header in CSV_HEADERS.items():
+            with open(os.path.join(out_dir, f"{stem}_header.csv"), "w", encoding="utf-8", newline="") as f:
+                csv.writer(f).writerow(header)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    with open(os.path.join(out_dir, "import_command.sh"), "w", encoding="utf-8") as f:
+        f.write(import_command(out_dir) + "\n")
+    return counts
@@ -0,0 +1,242 @@
+import json
+import os
+import sys
+from array import array
+import numpy as np
+from backup_reader import iter_backup_transactions
+
+# Sentinel for missing integer fields (no block yet, no prevout value, ...)
+MISSING = np.iinfo(np.int64).min
+
+# Every column is a plain .npy file so each can be memory-mapped on its own
+# Top-level record fields carried through as-is; absent from directories written before they were added
+RECORD_COLUMNS = ("size", "vsize", "seen_time")
+INT_COLUMNS = ("value", "fee", "block_height", "block_time") + RECORD_COLUMNS
+COLUMN_FILES = INT_COLUMNS + (
+    "confirmed", "txid_sid", "block_hash_sid",
+    "vin_offsets", "vin_has_prevout", "vin_address_sid", "vin_value",
+    "vout_offsets", "vout_address_sid", "vout_value",
+    "string_offsets", "txid_sorted", "txid_order",
+)
+
+class _StringTable:
+    """Interns txids, block hashes and addresses into one UTF-8 blob with offsets"""
+
+    def __init__(self):
+        self.ids = {}
+        self.blob = bytearray()
+        self.offsets = array("q", [0])
+
+    def add(self, value):
+        if value is None:
+            return -1
+        sid = self.ids.get(value)
+        if sid is None:
+            sid = len(self.ids)
+            self.ids[value] = sid
+            self.blob += value.encode("utf-8")
+            self.offsets.append(len(self.blob))
+        return sid
+
+def _int_or_missing(value):
+    return MISSING if value is None else int(value)
+
+def json_to_compact(transactions, out_dir):
+    """Convert an iterable of transaction dicts into the compact columnar format"""
+    os.makedirs(out_dir, exist_ok=True)
+    strings = _StringTable()
+    cols = {name: array("q") for name in INT_COLUMNS}
+    confirmed = array("b")
+    txid_sid, block_hash_sid = array("q"), array("q")
+    vin_offsets, vin_has_prevout, vin_address_sid, vin_value = array("q", [0]), array("b"), array("q"), array("q")
+    vout_offsets, vout_address_sid, vout_value = array("q", [0]), array("q"), array("q")
+
+    for tx in transactions:
+        status = tx.get("status", {}) or {}
+        vin = tx.get("vin", [])
+        vout = tx.get("vout", [])
+        total_sent = sum(entry.get("prevout", {}).get("value", 0) or 0 for entry in vin)
+        total_received = sum(entry.get("value", 0) or 0 for entry in vout)
+
+        txid_sid.append(strings.add(tx["txid"]))
+        cols["value"].append(total_sent)
+        cols["fee"].append(total_sent - total_received)
+        cols["block_height"].append(_int_or_missing(status.get("block_height")))
+        cols["block_time"].append(_int_or_missing(status.get("block_time")))
+        for name in RECORD_COLUMNS:
+            cols[name].append(_int_or_missing(tx.get(name)))
+        confirmed.append(1 if status.get("confirmed", False) else 0)
+        block_hash_sid.append(strings.add(status.get("block_hash")))
+
+        for entry in vin:
+            prevout = entry.get("prevout")
+            vin_has_prevout.append(1 if prevout else 0)
+            prevout = prevout or {}
+            vin_address_sid.append(strings.add(prevout.get("scriptpubkey_address")))
+            vin_value.append(_int_or_missing(prevout.get("value")))
+        vin_offsets.append(len(vin_value))
+
+        for entry in vout:
+            vout_address_sid.append(strings.add(entry.get("scriptpubkey_address")))
+            vout_value.append(_int_or_missing(entry.get("value")))
+        vout_offsets.append(len(vout_value))
+
+    arrays = {name: np.asarray(col, dtype=np.int64) for name, col in cols.items()}
+    arrays.update({
+        "confirmed": np.asarray(confirmed, dtype=np.bool_),
+        "txid_sid": np.asarray(txid_sid, dtype=np.int64),
+        "block_hash_sid": np.asarray(block_hash_sid, dtype=np.int64),
+        "vin_offsets": np.asarray(vin_offsets, dtype=np.int64),
+        "vin_has_prevout": np.asarray(vin_has_prevout, dtype=np.bool_),
+        "vin_address_sid": np.asarray(vin_address_sid, dtype=np.int64),
+        "vin_value": np.asarray(vin_value, dtype=np.int64),
+        "vout_offsets": np.asarray(vout_offsets, dtype=np.int64),
+        "vout_address_sid": np.asarray(vout_address_sid, dtype=np.int64),
+        "vout_value": np.asarray(vout_value, dtype=np.int64),
+        "string_offsets": np.asarray(strings.offsets, dtype=np.int64),
+    })
+
+    # Sorted fixed-width txid index for binary search straight off the memory map
+    blob = bytes(strings.blob)
+    offsets = arrays["string_offsets"]
+    txids = [blob[offsets[sid]:offsets[sid + 1]] for sid in arrays["txid_sid"]]
+    width = max((len(t) for t in txids), default=1)
+    txid_fixed = np.array(txids, dtype=f"S{width}")
+    order = np.argsort(txid_fixed, kind="stable")
+    arrays["txid_sorted"] = txid_fixed[order]
+    arrays["txid_order"] = order.astype(np.int64)
+
+    for name, values in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), values)
+    with open(os.path.join(out_dir, "strings.bin"), "wb") as f:
+        f.write(blob)
+    return len(txids)
+
+class CompactBackup:
+    """Read-only view over a compact backup directory; columns are memory-mapped"""
+
+    def __init__(self, directory, mmap=True):
+        self.directory = directory
+        mode = "r" if mmap else None
+        for name in COLUMN_FILES:
+            path = os.path.join(directory, f"{name}.npy")
+            if name in RECORD_COLUMNS and not os.path.exists(path):
+                setattr(self, name, None)
+                continue
+            setattr(self, name, np.load(path, mmap_mode=mode))
+        for name in RECORD_COLUMNS:
+            if getattr(self, name) is None:
+                setattr(self, name, np.full(len(self.txid_sid), MISSING, dtype=np.int64))
+        blob_path = os.path.join(directory, "strings.bin")
+        if mmap and os.path.getsize(blob_path):
+            self.strings = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            self.strings = np.fromfile(blob_path, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.txid_sid)
+
+    def string(self, sid):
+        if sid < 0:
+            return None
+        start, end = self.string_offsets[sid], self.string_offsets[sid + 1]
+        return self.strings[start:end].tobytes().decode("utf-8")
+
+    def txid(self, row):
+        return self.string(int(self.txid_sid[row]))
+
+    def find(self, txid):
+        """Row number of `txid`, or None, via binary search on the sorted index"""
+        encoded = txid.encode("utf-8")
+        # A wider query would be truncated to the index width and could match a different txid
+        if len(encoded) > self.txid_sorted.dtype.itemsize:
+            return None
+        key = np.array(encoded, dtype=self.txid_sorted.dtype)
+        pos = int(np.searchsorted(self.txid_sorted, key))
+        if pos < len(self.txid_sorted) and self.txid_sorted[pos] == key:
+            return int(self.txid_order[pos])
+        return None
+
+    def unconfirmed_mask(self):
+        return ~np.asarray(self.confirmed)
+
+    def unconfirmed_txids(self):
+        return [self.txid(row) for row in np.flatnonzero(self.unconfirmed_mask())]
+
+    def transaction(self, row):
+        """Rebuild the dict form of one row (status always carries all four keys; size, vsize
+        and seen_time only appear when the source record had them)"""
+        def opt(value):
+            value = int(value)
+            return None if value == MISSING else value
+
+        vin = []
+        for i in range(self.vin_offsets[row], self.vin_offsets[row + 1]):
+            if self.vin_has_prevout[i]:
+                vin.append({"prevout": {
+                    "scriptpubkey_address": self.string(int(self.vin_address_sid[i])),
+                    "value": opt(self.vin_value[i])
+                }})
+            else:
+                vin.append({})
+        vout = [
+            {"scriptpubkey_address": self.string(int(self.vout_address_sid[i])), "value": opt(self.vout_value[i])}
+            for i in range(self.vout_offsets[row], self.vout_offsets[row + 1])
+        ]
+        tx = {"txid": self.txid(row)}
+        for name in RECORD_COLUMNS:
+            value = opt(getattr(self, name)[row])
+            if value is not None:
+                tx[name] = value
+        tx.update({
+            "status": {
+                "confirmed": bool(self.confirmed[row]),
+                "block_height": opt(self.block_height[row]),
+                "block_hash": self.string(int(self.block_hash_sid[row])),
+                "block_time": opt(self.block_time[row])
+            },
+            "vin": vin,
+            "vout": vout
+        })
+        return tx
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self.transaction(row)
+
+def compact_to_json(directory, out_path, indent=2):
+    """Write a compact backup back out as the pretty-printed JSON array"""
+    backup = CompactBackup(directory)
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i, tx in enumerate(backup):
+            f.write(",\n" if i else "\n")
+            f.write(json.dumps(tx, indent=indent))
+        f.write("\n]\n" if len(backup) else "]\n")
+    return len(backup)
+
+if __name__ == "__main__":
+    usage = ("Usage: python compact_backup.py "
+             "[from-json JSON DIR | from-store DIR | to-json DIR JSON | unconfirmed DIR]")
+    if len(sys.argv) < 3:
+        print(usage)
+        sys.exit(1)
+    command = sys.argv[1]
+    if command == "from-json" and len(sys.argv) == 4:
+        print(f"Wrote {json_to_compact(iter_backup_transactions(sys.argv[2]), sys.argv[3])} transactions to {sys.argv[3]}")
+    elif command == "from-store":
+        from master_store import open_master_store
+        store = open_master_store()
+        try:
+            print(f"Wrote {json_to_compact(store.iter_latest(), sys.argv[2])} transactions to {sys.argv[2]}")
+        finally:
+            store.close()
+    elif command == "to-json" and len(sys.argv) == 4:
+        print(f"Wrote {compact_to_json(sys.argv[2], sys.argv[3])} transactions to {sys.argv[3]}")
+    elif command == "unconfirmed":
+        backup = CompactBackup(sys.argv[2])
+        mask = backup.unconfirmed_mask()
+        print(f"{int(mask.sum())} of {len(backup)} transactions are unconfirmed")
+    else:
+        print(usage)
+        sys.exit(1)
@@ -7,61 +7,171 @@ load_dotenv()
 NEO4J_URI = "bolt://neo4j:7687"
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "neo4j")
+
+#Neo4j connection pool (shared by every module through neo4j_connection.py)
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "60"))
+NEO4J_REFRESH_SCHEMA = os.getenv("NEO4J_REFRESH_SCHEMA", "false").lower() == "true"
+NEO4J_MAX_RETRY_TIME = float(os.getenv("NEO4J_MAX_RETRY_TIME", "30"))  # driver-level retry budget per write
+
+#Parallel graph writer (backfill)
+GRAPH_WRITER_WORKERS = int(os.getenv("GRAPH_WRITER_WORKERS", "4"))
+GRAPH_WRITER_RETRIES = int(os.getenv("GRAPH_WRITER_RETRIES", "5"))
 
 #Groq API key
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
 #APIs
-BLOCKCHAIN_WS_URL = "wss://ws.blockchain.info/inv"
-BLOCKSTREAM_API = "https://blockstream.info/api"
+BLOCKCHAIN_WS_URL = os.getenv("BLOCKCHAIN_WS_URL", "wss://ws.blockchain.info/inv")
+BLOCKSTREAM_API = os.getenv("BLOCKSTREAM_API", "https://blockstream.info/api")
+
+#Blockstream request limits for the async status fetcher
+BLOCKSTREAM_RATE_LIMIT = float(os.getenv("BLOCKSTREAM_RATE_LIMIT", "10"))  # requests per second
+BLOCKSTREAM_BURST = int(os.getenv("BLOCKSTREAM_BURST", "20"))
+BLOCKSTREAM_MIN_CONCURRENCY = int(os.getenv("BLOCKSTREAM_MIN_CONCURRENCY", "2"))
+BLOCKSTREAM_MAX_CONCURRENCY = int(os.getenv("BLOCKSTREAM_MAX_CONCURRENCY", "16"))
+
+#Persistent cache of Blockstream /tx lookups
+TX_CACHE_PATH = os.getenv("TX_CACHE_PATH", ".tx_status_cache.sqlite")
+TX_CACHE_MAX_ENTRIES = int(os.getenv("TX_CACHE_MAX_ENTRIES", "2000000"))
+TX_CACHE_UNCONFIRMED_TTL = float(os.getenv("TX_CACHE_UNCONFIRMED_TTL", "600"))  # seconds
+TX_CACHE_NEGATIVE_TTL = float(os.getenv("TX_CACHE_NEGATIVE_TTL", "120"))  # seconds
+
+#Block-driven confirmation resolver
+CONFIRMATION_STATE_PATH = os.getenv("CONFIRMATION_STATE_PATH", ".confirmation_tip.json")
+CONFIRMATION_LOOKBACK_BLOCKS = int(os.getenv("CONFIRMATION_LOOKBACK_BLOCKS", "144"))
+
+#Realtime ingest pipeline
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "1.0"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+INGEST_OVERFLOW_POLICY = os.getenv("INGEST_OVERFLOW_POLICY", "spill")  # block | spill | drop_oldest
+INGEST_SPILL_PATH = os.getenv("INGEST_SPILL_PATH", "bitcoin_transactions_overflow.jsonl")
+INGEST_METRICS_INTERVAL = float(os.getenv("INGEST_METRICS_INTERVAL", "30"))
+INGEST_RETRY_BACKOFF = float(os.getenv("INGEST_RETRY_BACKOFF", "0.5"))  # first pause after a failed write, doubled per failure
+INGEST_MAX_RETRY_BACKOFF = float(os.getenv("INGEST_MAX_RETRY_BACKOFF", "30"))
+
+#Append-only master store of all transactions (legacy JSON backup is now an export format)
+MASTER_STORE_PATH = os.getenv("MASTER_STORE_PATH", "bitcoin_transactions_master.jsonl")
+
+#Loader checkpoint (the same watermark is also stored on a LoaderCheckpoint node)
+LOADER_CHECKPOINT_PATH = os.getenv("LOADER_CHECKPOINT_PATH", ".loader_checkpoint.json")
+
+#Offline CSV export (python load_backup_to_db.py --export-csv DIR); buckets are sized so one fits the budget
+CSV_EXPORT_MEMORY_MB = int(os.getenv("CSV_EXPORT_MEMORY_MB", "512"))
+CSV_EXPORT_MAX_PARTITIONS = int(os.getenv("CSV_EXPORT_MAX_PARTITIONS", "256"))  # two sets are open at once
+
+#Realtime spool (buffered, rotating JSONL segments)
+SPOOL_DIR = os.getenv("SPOOL_DIR", "bitcoin_transactions_spool")
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+SPOOL_FLUSH_INTERVAL = float(os.getenv("SPOOL_FLUSH_INTERVAL", "1.0"))
+SPOOL_FLUSH_BYTES = int(os.getenv("SPOOL_FLUSH_BYTES", str(1024 * 1024)))
+SPOOL_FSYNC = os.getenv("SPOOL_FSYNC", "false").lower() == "true"
+
+#Realtime seen-txid filter (two rotating Bloom generations of DEDUP_CAPACITY txids each)
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "1000000"))
+DEDUP_FP_RATE = float(os.getenv("DEDUP_FP_RATE", "0.001"))
+
+#Smurfing aggregates (kept on Wallet nodes by the graph writers; rebuild with `python graph_schema.py rebuild-smurfing`)
+SMURF_SMALL_TX_VALUE = int(os.getenv("SMURF_SMALL_TX_VALUE", "100000"))  # satoshis; smaller sends count as "small"
+SMURF_WINDOW_BLOCKS = int(os.getenv("SMURF_WINDOW_BLOCKS", "30"))  # ~5 hours back from the wallet's latest small send
+SMURF_MIN_TOTAL_VALUE = int(os.getenv("SMURF_MIN_TOTAL_VALUE", "1000000"))
+SMURF_MIN_TX_COUNT = int(os.getenv("SMURF_MIN_TX_COUNT", "5"))
+SMURF_TOP_K = int(os.getenv("SMURF_TOP_K", "30"))
+
+#Top-N leaderboards (one Leaderboard node per metric, updated with every batch of Transaction nodes)
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "100"))
+HIGH_VALUE_TOP_K = int(os.getenv("HIGH_VALUE_TOP_K", "5"))
+
+#In-process analytics snapshot (python graph_snapshot.py from-store)
+GRAPH_SNAPSHOT_DIR = os.getenv("GRAPH_SNAPSHOT_DIR", "graph_snapshot")
+
+#Circular flow detection (cycle_finder.py)
+CYCLE_MAX_HOPS = int(os.getenv("CYCLE_MAX_HOPS", "4"))  # wallets per cycle
+CYCLE_MIN_VALUE = int(os.getenv("CYCLE_MIN_VALUE", "10000"))  # satoshis per hop
+CYCLE_WINDOW_BLOCKS = int(os.getenv("CYCLE_WINDOW_BLOCKS", "144"))  # ~1 day back from the newest block
+CYCLE_LIMIT = int(os.getenv("CYCLE_LIMIT", "50"))
+
+#Address clustering (common-input ownership), written to Wallet.entity by the loader
+CLUSTER_DIR = os.getenv("CLUSTER_DIR", "address_clusters")
+CLUSTER_WRITE_BATCH_SIZE = int(os.getenv("CLUSTER_WRITE_BATCH_SIZE", "5000"))
+
+#Value flow tracing (flow_tracer.py)
+TRACE_MAX_DEPTH = int(os.getenv("TRACE_MAX_DEPTH", "6"))  # hops; transaction -> wallet and wallet -> transaction each count
+TRACE_MIN_VALUE = int(os.getenv("TRACE_MIN_VALUE", "1000"))  # satoshis; smaller shares are not followed
+TRACE_MAX_FANOUT = int(os.getenv("TRACE_MAX_FANOUT", "100"))  # nodes with more edges (exchanges, pools) end the trace
+TRACE_POLICY = os.getenv("TRACE_POLICY", "haircut")  # haircut or fifo
+TRACE_PAGE_SIZE = int(os.getenv("TRACE_PAGE_SIZE", "100"))
+
+#Peel chain detection (peel_chains.py), cached per processed block range
+PEEL_CACHE_PATH = os.getenv("PEEL_CACHE_PATH", ".peel_chains.json")
+PEEL_MAX_PEEL_RATIO = float(os.getenv("PEEL_MAX_PEEL_RATIO", "0.3"))  # peeled output vs change output
+PEEL_MAX_GAP_BLOCKS = int(os.getenv("PEEL_MAX_GAP_BLOCKS", "144"))  # a chain closes after this many quiet blocks
+PEEL_MIN_LENGTH = int(os.getenv("PEEL_MIN_LENGTH", "3"))  # hops
+PEEL_WINDOW_BLOCKS = int(os.getenv("PEEL_WINDOW_BLOCKS", "1008"))  # first run reads ~1 week back
+PEEL_BLOCK_BATCH = int(os.getenv("PEEL_BLOCK_BATCH", "50"))  # blocks per candidate query
+PEEL_SETTLE_BLOCKS = int(os.getenv("PEEL_SETTLE_BLOCKS", "1"))  # blocks behind the tip left for the next run
+PEEL_TOP_K = int(os.getenv("PEEL_TOP_K", "30"))
+
+#Fee analytics (fee_analytics.py), stored on Block and FeeBucket nodes
+FEE_PERCENTILES = (10, 25, 50, 75, 90, 99)
+FEE_RATE_BINS = (1, 2, 3, 5, 8, 12, 20, 30, 50, 80, 120, 200, 500, 1000)  # sat/vB histogram edges
+FEE_OUTLIER_IQR = float(os.getenv("FEE_OUTLIER_IQR", "3"))  # outlier above p75 + this * (p75 - p25)
+FEE_OUTLIER_MIN_TXS = int(os.getenv("FEE_OUTLIER_MIN_TXS", "20"))  # smaller groups get no outlier flags
+FEE_BLOCK_BATCH = int(os.getenv("FEE_BLOCK_BATCH", "100"))  # blocks per read/write round trip
+FEE_SETTLE_BLOCKS = int(os.getenv("FEE_SETTLE_BLOCKS", "1"))
+FEE_MEMPOOL_BUCKET_SECONDS = int(os.getenv("FEE_MEMPOOL_BUCKET_SECONDS", "600"))
+FEE_MEMPOOL_WINDOW_SECONDS = int(os.getenv("FEE_MEMPOOL_WINDOW_SECONDS", "86400"))
 
 #Queries
-smurfing_query = '''
-// Find potential smurfing patterns
-MATCH (w:Wallet)-[s:SENT]->(t:Transaction)-[:INCLUDED_IN]->(b:Block)
-WHERE t.value < 100000  // Small transactions below threshold
-WITH w, collect(t) AS small_txs, 
-     sum(t.value) AS total_value, 
-     count(t) AS tx_count,
-     min(b.height) AS earliest_block,
-     max(b.height) AS latest_block
-// Filter for significant total values and multiple transactions
-WHERE total_value > 1000000 AND tx_count > 5
-// Calculate block span to identify rapid succession
-WITH w, small_txs, total_value, tx_count, 
-     latest_block - earliest_block AS block_span
-// Filter for transactions that happened within a small block span
-WHERE block_span <= 30  // Transactions within ~5 hours
-// Get recipient diversity to check if funds are spread across multiple wallets
-MATCH (w)-[:SENT]->(t:Transaction)-[r:RECEIVED]->(receiver:Wallet)
-WHERE t IN small_txs
-WITH w, small_txs, total_value, tx_count, block_span,
-     count(DISTINCT receiver) AS recipient_count
-// Return the results
-RETURN w.address AS sender_address, 
-       tx_count AS transaction_count,
-       total_value AS total_value_satoshis, 
-       block_span AS block_span,
-       recipient_count AS unique_recipients,
-       [tx IN small_txs | tx.txid] AS transaction_ids
-ORDER BY total_value DESC
-LIMIT 30
+smurfing_query = f'''
+// Top-K smurfing candidates from the per-wallet aggregates maintained at ingest time
+MATCH (w:Wallet)
+WHERE w.small_tx_value > {SMURF_MIN_TOTAL_VALUE}
+  AND w.small_tx_count > {SMURF_MIN_TX_COUNT}
+WITH w
+ORDER BY w.small_tx_value DESC
+LIMIT {SMURF_TOP_K}
+// Only the K winners are expanded to list their small transactions
+MATCH (w)-[:SENT]->(t:Transaction)
+WHERE t.value < {SMURF_SMALL_TX_VALUE}
+  AND t.block_height >= w.small_tx_min_height AND t.block_height <= w.small_tx_max_height
+WITH w, collect(t.txid) AS transaction_ids
+RETURN w.address AS sender_address,
+       w.small_tx_count AS transaction_count,
+       w.small_tx_value AS total_value_satoshis,
+       w.small_tx_max_height - w.small_tx_min_height AS block_span,
+       w.small_tx_recipients AS unique_recipients,
+       transaction_ids
+ORDER BY total_value_satoshis DESC
 '''
 
-high_value_query = '''
-MATCH (t:Transaction)
+high_value_query = f'''
+// Read the K winners from the maintained value leaderboard, then expand only those
+MATCH (lb:Leaderboard {{metric: 'value'}})
+UNWIND lb.txids[0..{HIGH_VALUE_TOP_K}] AS txid
+MATCH (t:Transaction {{txid: txid}})
 WHERE t.value > 1000000
-MATCH (sender:Wallet)-[sent:SENT]->(t)
-MATCH (t)-[received:RECEIVED]->(receiver:Wallet)
 OPTIONAL MATCH (t)-[:INCLUDED_IN]->(b:Block)
-RETURN t.txid AS txid, 
-       t.value AS value, 
-       t.fee AS fee, 
-       collect(DISTINCT sender.address) AS senders,
-       collect(DISTINCT receiver.address) AS receivers,
+CALL {{
+    WITH t
+    OPTIONAL MATCH (sender:Wallet)-[sent:SENT]->(t)
+    RETURN collect(DISTINCT sender.address) AS senders, sum(sent.value) AS total_input_value
+}}
+CALL {{
+    WITH t
+    OPTIONAL MATCH (t)-[:RECEIVED]->(receiver:Wallet)
+    RETURN collect(DISTINCT receiver.address) AS receivers
+}}
+RETURN t.txid AS txid,
+       t.value AS value,
+       t.fee AS fee,
+       senders,
+       receivers,
        b.height AS block_height,
        b.hash AS block_hash,
-       sum(sent.value) AS total_input_value
+       total_input_value
 ORDER BY t.value DESC
-LIMIT 5
 '''
\ No newline at end of file
@@ -0,0 +1,268 @@
+import random
+import sys
+import time
+from collections import deque
+import numpy as np
+from config import CYCLE_MAX_HOPS, CYCLE_MIN_VALUE, CYCLE_WINDOW_BLOCKS, CYCLE_LIMIT
+
+# Wallet -> Transaction -> Wallet hops inside a block-height window; the index on
+# t.block_height bounds the scan, so no variable-length pattern is ever expanded
+CYPHER_WALLET_FLOWS = """
+    MATCH (t:Transaction)
+    WHERE t.block_height >= $min_height AND t.block_height <= $max_height
+    MATCH (s:Wallet)-[:SENT]->(t)-[r:RECEIVED]->(d:Wallet)
+    WHERE s <> d AND r.value >= $min_value
+    RETURN s.address AS source, d.address AS target, t.txid AS txid,
+           r.value AS value, t.block_height AS height
+"""
+
+class WalletFlowGraph:
+    """Directed wallet graph; each wallet pair keeps its largest qualifying transfer"""
+
+    def __init__(self):
+        self.ids = {}
+        self.addresses = []
+        self.edges = {}
+
+    def _id(self, address):
+        wallet = self.ids.get(address)
+        if wallet is None:
+            wallet = self.ids[address] = len(self.addresses)
+            self.addresses.append(address)
+        return wallet
+
+    def add(self, source, target, txid, value, height):
+        if source == target:
+            return
+        key = (self._id(source), self._id(target))
+        current = self.edges.get(key)
+        if current is None or value > current[1]:
+            self.edges[key] = (txid, value, height)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def pruned_adjacency(self):
+        """Successor and predecessor lists after peeling wallets that cannot be on a cycle.
+
+        A wallet with no qualifying incoming or no outgoing flow (dead ends,
+        sinks, single-edge wallets) is removed, and removal repeats until
+        every remaining wallet has both.
+        """
+        successors = {}
+        predecessors = {}
+        for source, target in self.edges:
+            successors.setdefault(source, set()).add(target)
+            predecessors.setdefault(target, set()).add(source)
+
+        queue = deque(w for w in range(len(self.addresses)) if not successors.get(w) or not predecessors.get(w))
+        removed = set()
+        while queue:
+            wallet = queue.popleft()
+            if wallet in removed:
+                continue
+            removed.add(wallet)
+            for target in successors.pop(wallet, ()):
+                preds = predecessors.get(target)
+                if preds is not None:
+                    preds.discard(wallet)
+                    if not preds and target not in removed:
+                        queue.append(target)
+            for source in predecessors.pop(wallet, ()):
+                succs = successors.get(source)
+                if succs is not None:
+                    succs.discard(wallet)
+                    if not succs and source not in removed:
+                        queue.append(source)
+        return (
+            {w: sorted(targets) for w, targets in successors.items() if w not in removed},
+            {w: sorted(sources) for w, sources in predecessors.items() if w not in removed},
+        )
+
+    def cycle_record(self, cycle):
+        hops = [self.edges[(cycle[i], cycle[(i + 1) % len(cycle)])] for i in range(len(cycle))]
+        values = [value for _, value, _ in hops]
+        heights = [height for _, _, height in hops if height is not None]
+        return {
+            "wallets": [self.addresses[w] for w in cycle],
+            "txids": [txid for txid, _, _ in hops],
+            "values": values,
+            "hops": len(cycle),
+            "min_value": min(values),
+            "total_value": sum(values),
+            "first_block": min(heights) if heights else None,
+            "last_block": max(heights) if heights else None,
+        }
+
+def iter_cycles(successors, predecessors, max_hops=CYCLE_MAX_HOPS):
+    """Yield every simple cycle of 2..max_hops wallets exactly once (as a list of wallet ids).
+
+    Each cycle is reported from its smallest wallet id. Before searching from
+    a start wallet, a backward BFS gives every wallet's hop distance back to
+    it, and the DFS only steps where the cycle can still close in budget.
+    """
+    for start in sorted(successors):
+        distance = {start: 0}
+        frontier = [start]
+        for hop in range(1, max_hops):
+            next_frontier = []
+            for wallet in frontier:
+                for source in predecessors.get(wallet, ()):
+                    if source > start and source not in distance:
+                        distance[source] = hop
+                        next_frontier.append(source)
+            frontier = next_frontier
+        if len(distance) == 1:
+            continue
+
+        path = [start]
+        on_path = {start}
+        stack = [iter(successors[start])]
+        while stack:
+            wallet = next(stack[-1], None)
+            if wallet is None:
+                stack.pop()
+                on_path.discard(path.pop())
+                continue
+            if wallet == start:
+                if len(path) >= 2:
+                    yield list(path)
+                continue
+            if wallet in on_path or wallet not in distance or len(path) + distance[wallet] > max_hops:
+                continue
+            path.append(wallet)
+            on_path.add(wallet)
+            stack.append(iter(successors.get(wallet, ())))
+
+def find_cycles(graph, max_hops=CYCLE_MAX_HOPS, limit=CYCLE_LIMIT):
+    """Stream cycle records from a WalletFlowGraph as they are found"""
+    successors, predecessors = graph.pruned_adjacency()
+    for count, cycle in enumerate(iter_cycles(successors, predecessors, max_hops), start=1):
+        yield graph.cycle_record(cycle)
+        if limit and count >= limit:
+            return
+
+def _window(min_height, max_height, window_blocks, tip):
+    max_height = tip if max_height is None else max_height
+    if min_height is None:
+        min_height = max_height - window_blocks if max_height is not None else None
+    return min_height, max_height
+
+def load_flows_from_neo4j(min_value=CYCLE_MIN_VALUE, min_height=None, max_height=None,
+                          window_blocks=CYCLE_WINDOW_BLOCKS):
+    """Fetch the qualifying wallet-to-wallet flows in one windowed query"""
+    from graph_utils import query_Neo4j_database
+    from neo4j_connection import get_session
+    tip = None
+    if max_height is None:
+        rows = query_Neo4j_database(
+            "MATCH (t:Transaction) WHERE t.block_height IS NOT NULL "
+            "RETURN t.block_height AS height ORDER BY t.block_height DESC LIMIT 1"
+        )
+        tip = rows[0]["height"] if rows else None
+    min_height, max_height = _window(min_height, max_height, window_blocks, tip)
+    graph = WalletFlowGraph()
+    if max_height is None:
+        return graph, (None, None)
+    with get_session() as session:
+        for record in session.run(CYPHER_WALLET_FLOWS, min_height=min_height,
+                                  max_height=max_height, min_value=min_value):
+            graph.add(record["source"], record["target"], record["txid"], record["value"], record["height"])
+    return graph, (min_height, max_height)
+
+def load_flows_from_snapshot(snapshot, min_value=CYCLE_MIN_VALUE, min_height=None, max_height=None,
+                             window_blocks=CYCLE_WINDOW_BLOCKS):
+    """Same flows as `load_flows_from_neo4j`, taken from a graph_snapshot.GraphSnapshot"""
+    from compact_backup import MISSING
+    heights = np.asarray(snapshot.tx_height)
+    confirmed = heights[heights != MISSING]
+    min_height, max_height = _window(min_height, max_height, window_blocks,
+                                     int(confirmed.max()) if len(confirmed) else None)
+    graph = WalletFlowGraph()
+    if max_height is None:
+        return graph, (None, None)
+
+    txs, targets, values = (np.asarray(a) for a in
+                            (snapshot.received_src, snapshot.received_dst, snapshot.received_value))
+    tx_heights = heights[txs]
+    keep = (tx_heights != MISSING) & (tx_heights >= min_height) & (tx_heights <= max_height) & (values >= min_value)
+    txs, targets, values, tx_heights = txs[keep], targets[keep], values[keep], tx_heights[keep]
+
+    # Every sender of the transaction flows to each of its receivers
+    starts = snapshot.sent_dst_offsets[txs]
+    lengths = snapshot.sent_dst_offsets[txs + 1] - starts
+    owner = np.repeat(np.arange(len(txs)), lengths)
+    slots = np.arange(int(lengths.sum())) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    senders = np.asarray(snapshot.sent_src)[np.asarray(snapshot.sent_dst_order)[slots]]
+    for sender, i in zip(senders.tolist(), owner.tolist()):
+        graph.add(snapshot.address_of(sender), snapshot.address_of(int(targets[i])),
+                  snapshot.txid_of(int(txs[i])), int(values[i]), int(tx_heights[i]))
+    return graph, (min_height, max_height)
+
+def circular_patterns(max_hops=CYCLE_MAX_HOPS, min_value=CYCLE_MIN_VALUE, min_height=None, max_height=None,
+                      window_blocks=CYCLE_WINDOW_BLOCKS, limit=CYCLE_LIMIT, snapshot=None):
+    """Stream circular Wallet -> Transaction -> Wallet flows (Neo4j, or a snapshot when given)"""
+    if snapshot is not None:
+        graph, _ = load_flows_from_snapshot(snapshot, min_value, min_height, max_height, window_blocks)
+    else:
+        graph, _ = load_flows_from_neo4j(min_value, min_height, max_height, window_blocks)
+    yield from find_cycles(graph, max_hops=max_hops, limit=limit)
+
+def synthetic_flow_graph(wallets, edges, spenders=0.2, planted=20, planted_hops=4, seed=0):
+    """Random flow graph where only a fraction of wallets ever spend, plus some planted cycles"""
+    rng = random.Random(seed)
+    graph = WalletFlowGraph()
+    active = max(2, int(wallets * spenders))
+    for i in range(edges):
+        graph.add(f"w{rng.randrange(active)}", f"w{rng.randrange(wallets)}", f"tx{i}", rng.randint(1, 10 ** 8), 0)
+    for c in range(planted):
+        ring = [f"ring{c}-{k}" for k in range(planted_hops)]
+        for k in range(planted_hops):
+            graph.add(ring[k], ring[(k + 1) % planted_hops], f"ring{c}-tx{k}", 10 ** 6, 0)
+    return graph
+
+def benchmark(sizes=((10_000, 20_000), (100_000, 200_000), (500_000, 1_000_000)), hops=(3, 4, 5), limit=100_000):
+    print(f"{'wallets':>8} {'edges':>9} {'hops':>4} {'kept':>8} {'prune s':>8} {'cycles':>8} {'search s':>9}")
+    for wallets, edges in sizes:
+        graph = synthetic_flow_graph(wallets, edges)
+        for max_hops in hops:
+            start = time.perf_counter()
+            successors, predecessors = graph.pruned_adjacency()
+            pruned = time.perf_counter()
+            found = 0
+            for _ in iter_cycles(successors, predecessors, max_hops):
+                found += 1
+                if found >= limit:
+                    break
+            done = time.perf_counter()
+            print(f"{wallets:>8} {len(graph.edges):>9} {max_hops:>4} {len(successors):>8} "
+                  f"{pruned - start:>8.2f} {found:>8} {done - pruned:>9.2f}")
+
+def print_cycles(cycles):
+    count = 0
+    for count, cycle in enumerate(cycles, start=1):
+        print(f"[{count}] {cycle['hops']} hops, min {cycle['min_value']} sat, "
+              f"blocks {cycle['first_block']}-{cycle['last_block']}: {' -> '.join(cycle['wallets'])}")
+    print(f"{count} cycles found")
+
+if __name__ == "__main__":
+    usage = "Usage: python cycle_finder.py [find [MAX_HOPS] [MIN_VALUE] | snapshot [DIR] | bench]"
+    command = sys.argv[1] if len(sys.argv) > 1 else "find"
+    if command == "find":
+        from neo4j_connection import close_connections
+        try:
+            print_cycles(circular_patterns(
+                max_hops=int(sys.argv[2]) if len(sys.argv) > 2 else CYCLE_MAX_HOPS,
+                min_value=int(sys.argv[3]) if len(sys.argv) > 3 else CYCLE_MIN_VALUE
+            ))
+        finally:
+            close_connections()
+    elif command == "snapshot":
+        from graph_snapshot import GraphSnapshot
+        from config import GRAPH_SNAPSHOT_DIR
+        print_cycles(circular_patterns(snapshot=GraphSnapshot(sys.argv[2] if len(sys.argv) > 2 else GRAPH_SNAPSHOT_DIR)))
+    elif command == "bench":
+        benchmark()
+    else:
+        print(usage)
+        sys.exit(1)
@@ -0,0 +1,98 @@
+import hashlib
+import math
+import threading
+
+class SeenTxidFilter:
+    """Memory-bounded "have we seen this txid" check for the realtime path.
+
+    Two Bloom filter generations are kept: lookups consult both, inserts go
+    to the current one, and once it holds `capacity` txids it becomes the
+    previous generation and a fresh one starts. Memory is fixed at two
+    bit arrays sized for `fp_rate` at `capacity` entries; recent txids are
+    always remembered for at least one full generation.
+    """
+
+    def __init__(self, capacity=1_000_000, fp_rate=0.001):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.num_bits = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._current = bytearray((self.num_bits + 7) // 8)
+        self._previous = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.duplicates = 0
+        self.rotations = 0
+
+    def _positions(self, txid):
+        # Txids are already uniformly random hex; fall back to hashing anything else
+        try:
+            h1 = int(txid[:16], 16)
+            h2 = int(txid[16:32], 16) | 1
+        except (ValueError, TypeError):
+            digest = hashlib.blake2b(str(txid).encode("utf-8"), digest_size=16).digest()
+            h1 = int.from_bytes(digest[:8], "little")
+            h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    @staticmethod
+    def _contains(bits, positions):
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def _add_locked(self, positions):
+        if self._count >= self.capacity:
+            self._previous = self._current
+            self._current = bytearray(len(self._previous))
+            self._count = 0
+            self.rotations += 1
+        for p in positions:
+            self._current[p >> 3] |= 1 << (p & 7)
+        self._count += 1
+
+    def seen_before(self, txid):
+        """Record `txid` and report whether it was (probably) seen already"""
+        positions = self._positions(txid)
+        with self._lock:
+            self.checked += 1
+            if self._contains(self._current, positions) or self._contains(self._previous, positions):
+                self.duplicates += 1
+                return True
+            self._add_locked(positions)
+            return False
+
+    def warm_start(self, txids):
+        """Pre-load txids (e.g. from the spool index) without counting them as traffic"""
+        loaded = 0
+        for txid in txids:
+            positions = self._positions(txid)
+            with self._lock:
+                if not self._contains(self._current, positions):
+                    self._add_locked(positions)
+            loaded += 1
+        return loaded
+
+    def estimated_fp_rate(self):
+        """False-positive probability of a lookup given how full both generations are"""
+        def fill(count):
+            return (1 - math.exp(-self.num_hashes * count / self.num_bits)) ** self.num_hashes
+        with self._lock:
+            current = fill(self._count)
+            previous = fill(self.capacity) if self.rotations else 0.0
+        return 1 - (1 - current) * (1 - previous)
+
+    def stats(self):
+        return {
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "duplicate_rate": self.duplicates / self.checked if self.checked else 0.0,
+            "estimated_fp_rate": self.estimated_fp_rate(),
+            "rotations": self.rotations,
+            "memory_bytes": 2 * len(self._current)
+        }
+
+    def report(self):
+        s = self.stats()
+        print(f"[DEDUP] checked={s['checked']} duplicates={s['duplicates']} "
+              f"duplicate_rate={s['duplicate_rate']:.2%} est_fp_rate={s['estimated_fp_rate']:.4%} "
+              f"rotations={s['rotations']} memory={s['memory_bytes'] // 1024} KiB")
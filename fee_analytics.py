@@ -0,0 +1,326 @@
+import asyncio
+import sys
+import time
+import numpy as np
+from config import (
+    FEE_PERCENTILES, FEE_RATE_BINS, FEE_OUTLIER_IQR, FEE_OUTLIER_MIN_TXS, FEE_BLOCK_BATCH,
+    FEE_SETTLE_BLOCKS, FEE_MEMPOOL_BUCKET_SECONDS, FEE_MEMPOOL_WINDOW_SECONDS
+)
+
+# Blocks whose fee stats have not been computed yet (Block nodes are few, one per block)
+CYPHER_BLOCKS_WITHOUT_FEE_STATS = """
+    MATCH (b:Block)
+    WHERE b.fee_tx_count IS NULL AND b.height <= $max_height
+    RETURN b.height AS height ORDER BY height
+"""
+
+CYPHER_TIP_HEIGHT = "MATCH (b:Block) RETURN max(b.height) AS height"
+
+CYPHER_BLOCK_FEE_ROWS = """
+    UNWIND $keys AS height
+    MATCH (t:Transaction {block_height: height})
+    WHERE t.fee_rate IS NOT NULL
+    RETURN t.txid AS txid, height AS key, t.fee AS fee, t.fee_rate AS fee_rate
+"""
+
+# Mempool transactions still waiting, grouped by when the ingester first saw them
+CYPHER_MEMPOOL_FEE_ROWS = """
+    MATCH (t:Transaction)
+    WHERE t.confirmed = false AND t.seen_time >= $since AND t.fee_rate IS NOT NULL
+    RETURN t.txid AS txid, t.seen_time - t.seen_time % $bucket AS key, t.fee AS fee, t.fee_rate AS fee_rate
+"""
+
+CYPHER_SET_BLOCK_FEE_STATS = """
+    UNWIND $rows AS row
+    MATCH (b:Block {height: row.key})
+    SET b.fee_tx_count = row.count,
+        b.fee_percentiles = row.fee_percentiles,
+        b.fee_rate_percentiles = row.fee_rate_percentiles,
+        b.fee_rate_histogram = row.fee_rate_histogram,
+        b.fee_rate_outlier_threshold = row.fee_rate_outlier_threshold
+"""
+
+CYPHER_SET_BUCKET_FEE_STATS = """
+    MATCH (b:FeeBucket) WHERE NOT b.start IN [row IN $rows | row.key] DETACH DELETE b
+    WITH count(*) AS removed
+    UNWIND $rows AS row
+    MERGE (b:FeeBucket {start: row.key})
+    SET b.seconds = $bucket,
+        b.fee_tx_count = row.count,
+        b.fee_percentiles = row.fee_percentiles,
+        b.fee_rate_percentiles = row.fee_rate_percentiles,
+        b.fee_rate_histogram = row.fee_rate_histogram,
+        b.fee_rate_outlier_threshold = row.fee_rate_outlier_threshold
+"""
+
+CYPHER_CLEAR_BLOCK_OUTLIERS = """
+    UNWIND $keys AS height
+    MATCH (t:Transaction {block_height: height})
+    WHERE t.fee_outlier IS NOT NULL
+    REMOVE t.fee_outlier
+"""
+
+CYPHER_CLEAR_MEMPOOL_OUTLIERS = """
+    MATCH (t:Transaction {fee_outlier: true})
+    WHERE t.confirmed = false
+    REMOVE t.fee_outlier
+"""
+
+CYPHER_SET_OUTLIERS = """
+    UNWIND $txids AS txid
+    MATCH (t:Transaction {txid: txid})
+    SET t.fee_outlier = true
+"""
+
+# Transactions written before size/vsize were recorded, paged in txid order
+CYPHER_TRANSACTIONS_WITHOUT_VSIZE = """
+    MATCH (t:Transaction)
+    WHERE t.txid > $after AND t.vsize IS NULL
+    RETURN t.txid AS txid, t.value AS value, t.fee AS fee
+    ORDER BY t.txid
+    LIMIT $limit
+"""
+
+# A changed fee rate invalidates the stats of the block the transaction is in
+CYPHER_SET_TRANSACTION_SIZES = """
+    UNWIND $rows AS row
+    MATCH (t:Transaction {txid: row.txid})
+    SET t.size = row.size,
+        t.vsize = row.vsize,
+        t.fee_rate = row.fee_rate
+    WITH t
+    MATCH (t)-[:INCLUDED_IN]->(b:Block)
+    REMOVE b.fee_tx_count
+"""
+
+def _segment_percentiles(values, groups, starts, counts, q):
+    """Linear-interpolated percentiles (as np.percentile) of every group, shape (groups, len(q))"""
+    # Sorting by value and then (stably) by group is cheaper than a two-key lexsort
+    order = np.argsort(values)
+    ordered = values[order[np.argsort(groups[order], kind="stable")]]
+    position = starts[:, None] + q[None, :] * (counts - 1)[:, None]
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    weight = position - low
+    return ordered[low] * (1 - weight) + ordered[high] * weight
+
+def group_fee_stats(keys, fees, rates, percentiles=FEE_PERCENTILES, bins=FEE_RATE_BINS,
+                    iqr=FEE_OUTLIER_IQR, min_txs=FEE_OUTLIER_MIN_TXS):
+    """Per-group fee and fee-rate percentiles, fee-rate histograms and outlier flags in one vectorized pass.
+
+    `keys` groups the transactions (block height or mempool bucket start).
+    A transaction is an outlier when its fee rate is above p75 + iqr * (p75 - p25)
+    of its group; groups smaller than `min_txs` flag nothing.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    fees = np.asarray(fees, dtype=np.float64)
+    rates = np.asarray(rates, dtype=np.float64)
+    unique, groups, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    starts = np.cumsum(counts) - counts
+    q = np.asarray(percentiles, dtype=np.float64) / 100
+
+    fee_percentiles = _segment_percentiles(fees, groups, starts, counts, q)
+    # The quartiles for the outlier fence ride along with the configured fee-rate percentiles
+    rate_percentiles = _segment_percentiles(rates, groups, starts, counts, np.concatenate((q, [0.25, 0.75])))
+    rate_percentiles, quartiles = rate_percentiles[:, :len(q)], rate_percentiles[:, len(q):]
+    threshold = quartiles[:, 1] + iqr * (quartiles[:, 1] - quartiles[:, 0])
+    threshold[counts < min_txs] = np.inf
+
+    # Bin 0 is below the first edge, the last bin is at or above the last edge
+    width = len(bins) + 1
+    bin_ids = np.searchsorted(np.asarray(bins, dtype=np.float64), rates, side="right")
+    histogram = np.bincount(groups * width + bin_ids, minlength=len(unique) * width).reshape(len(unique), width)
+
+    return {
+        "keys": unique,
+        "counts": counts,
+        "fee_percentiles": fee_percentiles,
+        "fee_rate_percentiles": rate_percentiles,
+        "fee_rate_histogram": histogram,
+        "fee_rate_outlier_threshold": threshold,
+        "outliers": rates > threshold[groups],
+    }
+
+def _fetch(query, params):
+    from graph_utils import query_Neo4j_database
+    rows = query_Neo4j_database(query, params)
+    txids = [row["txid"] for row in rows]
+    columns = [np.fromiter((row[name] or 0 for row in rows), dtype=np.float64, count=len(rows))
+               for name in ("key", "fee", "fee_rate")]
+    return txids, columns
+
+def _stat_rows(stats, keys=()):
+    """Compact node properties per group; `keys` with no transactions get a zero count"""
+    rows = {int(key): {"key": int(key), "count": 0, "fee_percentiles": None, "fee_rate_percentiles": None,
+                       "fee_rate_histogram": None, "fee_rate_outlier_threshold": None} for key in keys}
+    for i, key in enumerate(stats["keys"].tolist() if stats else ()):
+        threshold = stats["fee_rate_outlier_threshold"][i]
+        rows[key] = {
+            "key": key,
+            "count": int(stats["counts"][i]),
+            "fee_percentiles": np.round(stats["fee_percentiles"][i]).astype(np.int64).tolist(),
+            "fee_rate_percentiles": np.round(stats["fee_rate_percentiles"][i], 2).tolist(),
+            "fee_rate_histogram": stats["fee_rate_histogram"][i].tolist(),
+            "fee_rate_outlier_threshold": None if np.isinf(threshold) else round(float(threshold), 2),
+        }
+    return list(rows.values())
+
+def _write_block_stats(tx, rows, keys, outliers):
+    tx.run(CYPHER_CLEAR_BLOCK_OUTLIERS, keys=keys).consume()
+    tx.run(CYPHER_SET_BLOCK_FEE_STATS, rows=rows).consume()
+    if outliers:
+        tx.run(CYPHER_SET_OUTLIERS, txids=outliers).consume()
+
+def _write_bucket_stats(tx, rows, outliers, bucket):
+    tx.run(CYPHER_CLEAR_MEMPOOL_OUTLIERS).consume()
+    tx.run(CYPHER_SET_BUCKET_FEE_STATS, rows=rows, bucket=bucket).consume()
+    if outliers:
+        tx.run(CYPHER_SET_OUTLIERS, txids=outliers).consume()
+
+def _group_and_flag(txids, columns):
+    keys, fees, rates = columns
+    if not len(txids):
+        return None, []
+    stats = group_fee_stats(keys, fees, rates)
+    return stats, [txid for txid, flagged in zip(txids, stats["outliers"].tolist()) if flagged]
+
+def update_block_fee_stats(batch_size=FEE_BLOCK_BATCH):
+    """Compute and store fee stats for every block that has none yet, one read and one write per batch"""
+    from graph_utils import query_Neo4j_database
+    from neo4j_connection import get_session
+    tip = query_Neo4j_database(CYPHER_TIP_HEIGHT)
+    if not tip or tip[0]["height"] is None:
+        return 0
+    # Stay behind the tip so transactions confirmed late into a block are counted
+    heights = [row["height"] for row in query_Neo4j_database(
+        CYPHER_BLOCKS_WITHOUT_FEE_STATS, {"max_height": tip[0]["height"] - FEE_SETTLE_BLOCKS})]
+    flagged = 0
+    for start in range(0, len(heights), batch_size):
+        keys = heights[start:start + batch_size]
+        txids, columns = _fetch(CYPHER_BLOCK_FEE_ROWS, {"keys": keys})
+        stats, outliers = _group_and_flag(txids, columns)
+        rows = _stat_rows(stats, keys)
+        with get_session() as session:
+            session.execute_write(_write_block_stats, rows, keys, outliers)
+        flagged += len(outliers)
+    print(f"[FEES] Stored fee stats for {len(heights)} blocks, {flagged} fee-rate outliers flagged")
+    return len(heights)
+
+def update_mempool_fee_stats(now=None, bucket=FEE_MEMPOOL_BUCKET_SECONDS, window=FEE_MEMPOOL_WINDOW_SECONDS):
+    """Recompute FeeBucket stats over the transactions still unconfirmed, by first-seen time"""
+    from neo4j_connection import get_session
+    since = int(now if now is not None else time.time()) - window
+    txids, columns = _fetch(CYPHER_MEMPOOL_FEE_ROWS, {"since": since, "bucket": bucket})
+    stats, outliers = _group_and_flag(txids, columns)
+    rows = _stat_rows(stats)
+    with get_session() as session:
+        session.execute_write(_write_bucket_stats, rows, outliers, bucket)
+    print(f"[FEES] {len(txids)} waiting transactions in {len(rows)} mempool buckets, {len(outliers)} outliers")
+    return len(rows)
+
+def rebuild_block_fee_stats():
+    from graph_utils import query_Neo4j_database
+    query_Neo4j_database("MATCH (b:Block) REMOVE b.fee_tx_count")
+    return update_block_fee_stats()
+
+def _fetch_documents(txids, fetcher):
+    """Blockstream /tx documents for `txids` (None when not found), through the persistent cache"""
+    from tx_cache import MISS, get_tx_cache
+    cache = get_tx_cache()
+    documents, to_fetch = {}, []
+    for txid in txids:
+        cached = cache.get(txid)
+        if cached is MISS:
+            to_fetch.append(txid)
+        else:
+            documents[txid] = cached
+
+    async def collect():
+        async for txid, tx in fetcher.fetch_many(to_fetch):
+            cache.put(txid, tx)
+            documents[txid] = tx
+
+    if to_fetch:
+        asyncio.run(collect())
+    return documents
+
+def _write_transaction_sizes(tx, rows):
+    tx.run(CYPHER_SET_TRANSACTION_SIZES, rows=rows).consume()
+
+def backfill_transaction_sizes(batch_size=1000, fetcher=None):
+    """Fill in size, vsize and fee_rate on Transaction nodes written before they were recorded.
+
+    Sizes come from the Blockstream /tx documents (tx cache first). The blocks
+    of updated transactions lose their fee stats, which are then recomputed,
+    and the fee_rate leaderboard is rebuilt.
+    """
+    from async_fetcher import AsyncTxFetcher
+    from graph_utils import query_Neo4j_database, rebuild_leaderboards, virtual_size
+    from neo4j_connection import get_session
+    fetcher = fetcher or AsyncTxFetcher()
+    after, updated, unresolved = "", 0, 0
+    while True:
+        rows = query_Neo4j_database(CYPHER_TRANSACTIONS_WITHOUT_VSIZE, {"after": after, "limit": batch_size})
+        if not rows:
+            break
+        after = rows[-1]["txid"]
+        documents = _fetch_documents([row["txid"] for row in rows], fetcher)
+        updates = []
+        for row in rows:
+            document = documents.get(row["txid"])
+            vsize = virtual_size(document.get("weight"), document.get("size")) if document else None
+            if not vsize:
+                # Left unset; a later run retries it
+                unresolved += 1
+                continue
+            fee, value = row["fee"], row["value"]
+            # Same rule as graph_utils.flatten_transactions: no fee rate for coinbase or missing prevouts
+            fee_rate = round(fee / vsize, 2) if value and value > 0 and fee is not None and fee >= 0 else None
+            updates.append({"txid": row["txid"], "size": document.get("size"), "vsize": vsize, "fee_rate": fee_rate})
+        if updates:
+            with get_session() as session:
+                session.execute_write(_write_transaction_sizes, updates)
+        updated += len(updates)
+        print(f"[FEES] Backfilled sizes for {updated} transactions ({unresolved} not found)")
+    if updated:
+        rebuild_leaderboards(["fee_rate"])
+        update_block_fee_stats()
+    return updated
+
+def benchmark(transactions=1_000_000, blocks=5_000, seed=0):
+    """Time group_fee_stats on random data against a per-group np.percentile loop"""
+    rng = np.random.default_rng(seed)
+    keys = rng.integers(0, blocks, size=transactions)
+    rates = rng.lognormal(2.5, 1.0, size=transactions)
+    fees = rates * rng.integers(150, 600, size=transactions)
+    started = time.perf_counter()
+    stats = group_fee_stats(keys, fees, rates)
+    vectorized = time.perf_counter() - started
+    started = time.perf_counter()
+    expected = np.array([np.percentile(rates[keys == key], FEE_PERCENTILES) for key in stats["keys"]])
+    looped = time.perf_counter() - started
+    assert np.allclose(expected, stats["fee_rate_percentiles"])
+    print(f"{transactions} transactions in {blocks} blocks: vectorized {vectorized:.3f}s, "
+          f"per-block loop {looped:.3f}s, {int(stats['outliers'].sum())} outliers")
+
+if __name__ == "__main__":
+    usage = "Usage: python fee_analytics.py [blocks|mempool|rebuild|backfill-sizes|bench]"
+    command = sys.argv[1] if len(sys.argv) > 1 else "blocks"
+    if command == "bench":
+        benchmark()
+    elif command in ("blocks", "mempool", "rebuild", "backfill-sizes"):
+        from neo4j_connection import close_connections
+        try:
+            if command == "blocks":
+                update_block_fee_stats()
+            elif command == "mempool":
+                update_mempool_fee_stats()
+            elif command == "backfill-sizes":
+                backfill_transaction_sizes()
+            else:
+                rebuild_block_fee_stats()
+        finally:
+            close_connections()
+    else:
+        print(usage)
+        sys.exit(1)
@@ -0,0 +1,450 @@
+import sys
+import time
+from itertools import islice
+import numpy as np
+from config import TRACE_MAX_DEPTH, TRACE_MIN_VALUE, TRACE_MAX_FANOUT, TRACE_POLICY, TRACE_PAGE_SIZE
+
+# Height used for unconfirmed transactions (after every block) and for "no lower bound"
+UNCONFIRMED_HEIGHT = 2 ** 62
+BEFORE_ANY_BLOCK = -1
+
+# One statement per hop kind; each takes the whole frontier in one round trip.
+# Edges come back ordered (largest first for transactions, oldest first for
+# wallets) and cut at $limit; degree and total always cover every edge.
+# Wallet hops skip the transactions the value just came from (row.exclude),
+# so a change output is not routed back into its own transaction.
+CYPHER_TX_OUTPUTS = """
+    UNWIND $keys AS txid
+    MATCH (t:Transaction {txid: txid})-[r:RECEIVED]->(w:Wallet)
+    WITH txid, t, w, r ORDER BY r.value DESC, w.address
+    WITH txid, t.block_height AS height, count(w) AS degree, sum(r.value) AS total,
+         collect({id: w.address, value: r.value})[..$limit] AS edges
+    RETURN txid AS key, height, degree, total, edges
+"""
+
+CYPHER_TX_INPUTS = """
+    UNWIND $keys AS txid
+    MATCH (w:Wallet)-[s:SENT]->(t:Transaction {txid: txid})
+    WITH txid, t, w, s ORDER BY s.value DESC, w.address
+    WITH txid, t.block_height AS height, count(w) AS degree, sum(s.value) AS total,
+         collect({id: w.address, value: s.value})[..$limit] AS edges
+    RETURN txid AS key, height, degree, total, edges
+"""
+
+CYPHER_WALLET_SPENDS = """
+    UNWIND $rows AS row
+    MATCH (w:Wallet {address: row.address})-[s:SENT]->(t:Transaction)
+    WHERE coalesce(t.block_height, $unconfirmed) >= row.height AND NOT t.txid IN row.exclude
+    WITH row, w, t, s ORDER BY coalesce(t.block_height, $unconfirmed), t.txid
+    WITH row, w, count(t) AS degree, sum(s.value) AS total,
+         collect({id: t.txid, value: s.value, height: t.block_height})[..$limit] AS edges
+    {history}
+    RETURN row.key AS key, degree, total, edges{history_columns}
+"""
+
+CYPHER_WALLET_RECEIPTS = """
+    UNWIND $rows AS row
+    MATCH (t:Transaction)-[r:RECEIVED]->(w:Wallet {address: row.address})
+    WHERE coalesce(t.block_height, $unconfirmed) <= row.height AND NOT t.txid IN row.exclude
+    WITH row, w, t, r ORDER BY coalesce(t.block_height, $unconfirmed), t.txid
+    WITH row, w, count(t) AS degree, sum(r.value) AS total,
+         collect({id: t.txid, value: r.value, height: t.block_height})[..$limit] AS edges
+    {history}
+    RETURN row.key AS key, degree, total, edges{history_columns}
+"""
+
+# FIFO needs what the wallet received and spent before the traced coins arrived
+CYPHER_WALLET_HISTORY = """
+    CALL {
+        WITH w, row
+        OPTIONAL MATCH (w)<-[r:RECEIVED]-(p:Transaction)
+        WHERE coalesce(p.block_height, $unconfirmed) < row.height
+        RETURN coalesce(sum(r.value), 0) AS received_before
+    }
+    CALL {
+        WITH w, row
+        OPTIONAL MATCH (w)-[s:SENT]->(p:Transaction)
+        WHERE coalesce(p.block_height, $unconfirmed) < row.height
+        RETURN coalesce(sum(s.value), 0) AS sent_before
+    }
+"""
+
+def _wallet_query(template, history):
+    if history:
+        return template.replace("{history}", CYPHER_WALLET_HISTORY).replace(
+            "{history_columns}", ", received_before, sent_before")
+    return template.replace("{history}", "").replace("{history_columns}", "")
+
+class Neo4jFlowBackend:
+    """Frontier lookups against the graph, one query per hop"""
+
+    def _run(self, query, **params):
+        from graph_utils import query_Neo4j_database
+        return {row["key"]: row for row in query_Neo4j_database(query, params)}
+
+    def transaction_edges(self, txids, direction, limit):
+        query = CYPHER_TX_OUTPUTS if direction == "forward" else CYPHER_TX_INPUTS
+        return self._run(query, keys=list(txids), limit=limit)
+
+    def wallet_edges(self, items, direction, limit, history):
+        template = CYPHER_WALLET_SPENDS if direction == "forward" else CYPHER_WALLET_RECEIPTS
+        rows = [{"key": key, "address": address, "height": height, "exclude": list(exclude)}
+                for key, (address, height, exclude) in items.items()]
+        return self._run(_wallet_query(template, history), rows=rows, limit=limit, unconfirmed=UNCONFIRMED_HEIGHT)
+
+class SnapshotFlowBackend:
+    """The same frontier lookups answered from a graph_snapshot.GraphSnapshot"""
+
+    def __init__(self, snapshot):
+        from compact_backup import MISSING
+        self.snapshot = snapshot
+        heights = np.asarray(snapshot.tx_height)
+        self.heights = np.where(heights == MISSING, UNCONFIRMED_HEIGHT, heights)
+        self.values = {relation: np.where(np.asarray(getattr(snapshot, f"{relation}_value")) == MISSING, 0,
+                                          getattr(snapshot, f"{relation}_value"))
+                       for relation in ("sent", "received")}
+
+    def _height(self, tx):
+        height = int(self.heights[tx])
+        return None if height == UNCONFIRMED_HEIGHT else height
+
+    def transaction_edges(self, txids, direction, limit):
+        s = self.snapshot
+        results = {}
+        for txid in txids:
+            tx = s.find_transaction(txid)
+            if tx is None:
+                continue
+            if direction == "forward":
+                slots = np.arange(s.received_src_offsets[tx], s.received_src_offsets[tx + 1])
+                wallets, values = s.received_dst[slots], self.values["received"][slots]
+            else:
+                slots = s.sent_dst_order[s.sent_dst_offsets[tx]:s.sent_dst_offsets[tx + 1]]
+                wallets, values = s.sent_src[slots], self.values["sent"][slots]
+            if not len(slots):
+                continue
+            addresses = [s.address_of(int(w)) for w in wallets]
+            order = sorted(range(len(slots)), key=lambda i: (-int(values[i]), addresses[i]))
+            results[txid] = {
+                "height": self._height(tx),
+                "degree": len(slots),
+                "total": int(np.sum(values)),
+                "edges": [{"id": addresses[i], "value": int(values[i])} for i in order[:limit]],
+            }
+        return results
+
+    def wallet_edges(self, items, direction, limit, history):
+        s = self.snapshot
+        results = {}
+        for key, (address, height, exclude) in items.items():
+            wallet = s.find_wallet(address)
+            if wallet is None:
+                continue
+            sent_slots = np.arange(s.sent_src_offsets[wallet], s.sent_src_offsets[wallet + 1])
+            received_slots = s.received_dst_order[s.received_dst_offsets[wallet]:s.received_dst_offsets[wallet + 1]]
+            sent_txs, sent_values = s.sent_dst[sent_slots], self.values["sent"][sent_slots]
+            received_txs, received_values = s.received_src[received_slots], self.values["received"][received_slots]
+            if direction == "forward":
+                txs, values = sent_txs, sent_values
+                keep = self.heights[txs] >= height
+            else:
+                txs, values = received_txs, received_values
+                keep = self.heights[txs] <= height
+            txs, values = txs[keep], values[keep]
+            if exclude:
+                excluded = [s.find_transaction(txid) for txid in exclude]
+                keep = ~np.isin(txs, [tx for tx in excluded if tx is not None])
+                txs, values = txs[keep], values[keep]
+            if not len(txs):
+                continue
+            txids = [s.txid_of(int(t)) for t in txs]
+            order = sorted(range(len(txs)), key=lambda i: (int(self.heights[txs[i]]), txids[i]))
+            row = {
+                "degree": len(txs),
+                "total": int(np.sum(values)),
+                "edges": [{"id": txids[i], "value": int(values[i]), "height": self._height(txs[i])}
+                          for i in order[:limit]],
+            }
+            if history:
+                row["received_before"] = int(np.sum(received_values[self.heights[received_txs] < height]))
+                row["sent_before"] = int(np.sum(sent_values[self.heights[sent_txs] < height]))
+            results[key] = row
+        return results
+
+def _haircut(amount, edges, total):
+    """Split `amount` over edges in proportion to their values (None = follow everything)"""
+    if amount is None:
+        return [(edge, edge["value"]) for edge in edges]
+    if not total:
+        return []
+    return [(edge, amount * edge["value"] / total) for edge in edges]
+
+def _fifo(amount, edges, skip):
+    """Walk edges oldest first: the first `skip` satoshis are other coins, then `amount` is ours"""
+    if amount is None:
+        return [(edge, edge["value"]) for edge in edges]
+    allocated = []
+    remaining = amount
+    for edge in edges:
+        if remaining <= 0:
+            break
+        value = edge["value"] or 0
+        skipped = min(skip, value)
+        skip -= skipped
+        share = min(remaining, value - skipped)
+        if share > 0:
+            allocated.append((edge, share))
+            remaining -= share
+    return allocated
+
+class FlowTracer:
+    """Frontier BFS that follows value forward (where did it go) or backward (where did it come from).
+
+    Hops alternate between transactions and wallets and each hop is one
+    backend call for the whole frontier. Transactions always split value
+    in proportion to their outputs (or inputs). Wallets use `policy`:
+    "haircut" splits in proportion to every later spend (earlier receipt),
+    "fifo" assumes coins leave in the order they arrived. A node is not
+    expanded past `max_depth` hops, below `min_value`, or when it has more
+    than `max_fanout` candidate edges (typically an exchange or pool).
+
+    Value never flows back into the transaction it just left, and every node
+    remembers how much it has already passed on: a node reached again (a
+    loop, or a second path) only forwards what is left of its own total, and
+    stops as "visited" once that is used up.
+    """
+
+    def __init__(self, backend, direction="forward", policy=TRACE_POLICY, max_depth=TRACE_MAX_DEPTH,
+                 min_value=TRACE_MIN_VALUE, max_fanout=TRACE_MAX_FANOUT):
+        if direction not in ("forward", "backward"):
+            raise ValueError(f"Unknown direction: {direction}")
+        if policy not in ("haircut", "fifo"):
+            raise ValueError(f"Unknown policy: {policy}")
+        self.backend = backend
+        self.direction = direction
+        self.policy = policy
+        self.max_depth = max_depth
+        self.min_value = min_value
+        self.max_fanout = max_fanout
+        self.hop_timings = []
+        self.consumed = {}
+
+    def _consume(self, key, value, total):
+        """Part of `value` node `key` can still pass on, given what earlier visits already used"""
+        used = self.consumed.get(key)
+        if value is None:
+            self.consumed[key] = total
+            return None if used is None else 0
+        allowed = max(0, min(value, total - (used or 0)))
+        self.consumed[key] = (used or 0) + allowed
+        return allowed
+
+    def _stop_reason(self, depth, amount, degree=None):
+        if amount is not None and amount < self.min_value:
+            return "min_value"
+        if degree is not None and degree > self.max_fanout:
+            return "fanout"
+        if depth >= self.max_depth:
+            return "depth"
+        return None
+
+    def trace(self, txid=None, address=None, amount=None):
+        """Yield one record per reached node, hop by hop; later hops are only queried when consumed"""
+        if (txid is None) == (address is None):
+            raise ValueError("Start from exactly one of txid or address")
+        self.hop_timings = []
+        self.consumed = {}
+        transactions, wallets = {}, {}
+        if txid is not None:
+            transactions[txid] = amount
+        else:
+            start_height = BEFORE_ANY_BLOCK if self.direction == "forward" else UNCONFIRMED_HEIGHT
+            wallets[f"{address}@{start_height}"] = (address, start_height, amount, set())
+
+        depth = 0
+        while transactions or wallets:
+            started = time.perf_counter()
+            next_transactions, next_wallets = {}, {}
+
+            if transactions:
+                expand = {key: value for key, value in transactions.items()
+                          if self._stop_reason(depth, value) is None}
+                found = self.backend.transaction_edges(list(expand), self.direction, self.max_fanout + 1) \
+                    if expand else {}
+                for key, value in transactions.items():
+                    info = found.get(key)
+                    reason = self._stop_reason(depth, value, info and info["degree"])
+                    if info is not None and reason is None:
+                        value = self._consume(key, value, info["total"])
+                        reason = "visited" if value == 0 else self._stop_reason(depth, value)
+                    yield {"depth": depth, "type": "transaction", "id": key, "amount": value,
+                           "height": info and info["height"], "stop": reason or ("end" if info is None else None)}
+                    if reason or info is None:
+                        continue
+                    height = UNCONFIRMED_HEIGHT if info["height"] is None else info["height"]
+                    for edge, share in _haircut(value, info["edges"], info["total"]):
+                        wallet_key = f"{edge['id']}@{height}"
+                        current = next_wallets.get(wallet_key, (edge["id"], height, 0, set()))
+                        next_wallets[wallet_key] = (edge["id"], height, current[2] + share, current[3] | {key})
+
+            if wallets:
+                expand = {key: (address_, height, sources) for key, (address_, height, value, sources)
+                          in wallets.items() if self._stop_reason(depth, value) is None}
+                found = self.backend.wallet_edges(expand, self.direction, self.max_fanout + 1,
+                                                  history=self.policy == "fifo") if expand else {}
+                for key, (address_, height, value, _) in wallets.items():
+                    info = found.get(key)
+                    reason = self._stop_reason(depth, value, info and info["degree"])
+                    if info is not None and reason is None:
+                        value = self._consume(key, value, info["total"])
+                        reason = "visited" if value == 0 else self._stop_reason(depth, value)
+                    yield {"depth": depth, "type": "wallet", "id": address_, "amount": value,
+                           "height": None if height in (BEFORE_ANY_BLOCK, UNCONFIRMED_HEIGHT) else height,
+                           "stop": reason or ("end" if info is None else None)}
+                    if reason or info is None:
+                        continue
+                    if self.policy == "haircut":
+                        allocated = _haircut(value, info["edges"], info["total"])
+                    elif self.direction == "forward":
+                        # Coins already in the wallet (and not yet spent) leave before ours
+                        allocated = _fifo(value, info["edges"],
+                                          max(0, (info["received_before"] or 0) - (info["sent_before"] or 0)))
+                    else:
+                        # Earlier spends already consumed the oldest receipts
+                        allocated = _fifo(value, info["edges"], info["sent_before"] or 0)
+                    for edge, share in allocated:
+                        next_transactions[edge["id"]] = next_transactions.get(edge["id"], 0) + share
+
+            self.hop_timings.append(time.perf_counter() - started)
+            transactions, wallets = next_transactions, next_wallets
+            depth += 1
+
+    def pages(self, page_size=TRACE_PAGE_SIZE, **start):
+        """Group `trace` records into pages; the graph is only queried as far as the pages read"""
+        records = self.trace(**start)
+        while True:
+            page = list(islice(records, page_size))
+            if not page:
+                return
+            yield page
+
+def trace_page(backend, page=0, page_size=TRACE_PAGE_SIZE, **options):
+    """One page of a trace (recomputed up to that page); `options` are FlowTracer settings plus the start"""
+    start = {key: options.pop(key) for key in ("txid", "address", "amount") if key in options}
+    tracer = FlowTracer(backend, **options)
+    for number, records in enumerate(tracer.pages(page_size, **start)):
+        if number == page:
+            return records
+    return []
+
+def benchmark(backend, depths=range(1, TRACE_MAX_DEPTH + 1), repeat=3, options=None, **start):
+    """Latency of a full trace at each depth limit (best of `repeat`), plus per-hop timings"""
+    print(f"{'depth':>5} {'nodes':>8} {'best s':>8}  per-hop s")
+    for depth in depths:
+        best, nodes, hops = None, 0, []
+        for _ in range(repeat):
+            tracer = FlowTracer(backend, max_depth=depth, **(options or {}))
+            started = time.perf_counter()
+            nodes = sum(1 for _ in tracer.trace(**start))
+            elapsed = time.perf_counter() - started
+            if best is None or elapsed < best:
+                best, hops = elapsed, tracer.hop_timings
+        print(f"{depth:>5} {nodes:>8} {best:>8.3f}  {' '.join(f'{h:.3f}' for h in hops)}")
+
+def synthetic_transactions(count=20_000, wallets=5_000, seed=0):
+    """Chain-like random transactions (each spends outputs of earlier ones) for benchmarking"""
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        inputs = rng.integers(0, wallets, size=int(rng.integers(1, 3)))
+        outputs = rng.integers(0, wallets, size=int(rng.integers(1, 4)))
+        yield {
+            "txid": f"{i:064x}",
+            "status": {"confirmed": True, "block_height": i // 100, "block_hash": None, "block_time": None},
+            "vin": [{"prevout": {"scriptpubkey_address": f"w{w}", "value": int(rng.integers(10 ** 4, 10 ** 7))}}
+                    for w in inputs],
+            "vout": [{"scriptpubkey_address": f"w{w}", "value": int(rng.integers(10 ** 4, 10 ** 6))}
+                     for w in outputs],
+        }
+
+def self_change_check():
+    """Regression check on a two-transaction graph where A pays change back to its own input wallet.
+
+    A (W:1000 -> W:600, X:390) then B (X:390 -> Y:385). Tracing 1000 sat forward
+    from A must not route W's change back into A, so Y receives at most 390.
+    Returns the number of failed checks.
+    """
+    import tempfile
+    from graph_snapshot import build_from_transactions, GraphSnapshot
+    a, b = f"{0xa:064x}", f"{0xb:064x}"
+
+    def tx(txid, height, inputs, outputs):
+        return {"txid": txid, "status": {"confirmed": True, "block_height": height, "block_hash": None, "block_time": None},
+                "vin": [{"prevout": {"scriptpubkey_address": w, "value": v}} for w, v in inputs],
+                "vout": [{"scriptpubkey_address": w, "value": v} for w, v in outputs]}
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        build_from_transactions([tx(a, 100, [("W", 1000)], [("W", 600), ("X", 390)]),
+                                 tx(b, 101, [("X", 390)], [("Y", 385)])], f"{tmp}/snapshot")
+        backend = SnapshotFlowBackend(GraphSnapshot(f"{tmp}/snapshot"))
+        for policy in ("haircut", "fifo"):
+            records = list(FlowTracer(backend, policy=policy, min_value=0).trace(txid=a, amount=1000))
+            received = sum(r["amount"] for r in records if r["type"] == "wallet" and r["id"] == "Y")
+            into_a = sum(r["amount"] for r in records if r["type"] == "transaction" and r["id"] == a)
+            if received > 390 or into_a > 990:
+                failures += 1
+                print(f"[TRACE] Self-change check failed ({policy}): Y received {received:.1f}, "
+                      f"A passed on {into_a:.1f}")
+    print(f"[TRACE] Self-change check finished with {failures} failures")
+    return failures
+
+def print_trace(records):
+    for record in records:
+        amount = "all" if record["amount"] is None else f"{record['amount']:.0f}"
+        stop = f" [{record['stop']}]" if record["stop"] else ""
+        print(f"{record['depth']:>3} {record['type']:<11} {record['id']:<64} {amount:>14} sat{stop}")
+
+if __name__ == "__main__":
+    usage = ("Usage: python flow_tracer.py "
+             "[trace (txid|address) ID [forward|backward] [haircut|fifo] [--snapshot DIR] | "
+             "bench (txid|address) ID [--snapshot DIR] | bench-synthetic | check]")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    snapshot_dir = None
+    if "--snapshot" in sys.argv:
+        snapshot_dir = sys.argv[sys.argv.index("--snapshot") + 1]
+        args.remove(snapshot_dir)
+
+    def make_backend():
+        if snapshot_dir:
+            from graph_snapshot import GraphSnapshot
+            return SnapshotFlowBackend(GraphSnapshot(snapshot_dir))
+        return Neo4jFlowBackend()
+
+    if len(args) >= 3 and args[0] in ("trace", "bench") and args[1] in ("txid", "address"):
+        start = {args[1]: args[2]}
+        try:
+            if args[0] == "trace":
+                tracer = FlowTracer(make_backend(),
+                                    direction=args[3] if len(args) > 3 else "forward",
+                                    policy=args[4] if len(args) > 4 else TRACE_POLICY)
+                for page in tracer.pages(**start):
+                    print_trace(page)
+            else:
+                benchmark(make_backend(), **start)
+        finally:
+            if not snapshot_dir:
+                from neo4j_connection import close_connections
+                close_connections()
+    elif args[:1] == ["bench-synthetic"]:
+        import tempfile
+        from graph_snapshot import build_from_transactions, GraphSnapshot
+        with tempfile.TemporaryDirectory() as tmp:
+            build_from_transactions(synthetic_transactions(), f"{tmp}/snapshot")
+            backend = SnapshotFlowBackend(GraphSnapshot(f"{tmp}/snapshot"))
+            print("Forward from the first synthetic transaction (snapshot backend):")
+            benchmark(backend, depths=range(2, 13, 2), options={"min_value": 0}, txid=f"{0:064x}")
+    elif args[:1] == ["check"]:
+        sys.exit(1 if self_change_check() else 0)
+    else:
+        print(usage)
+        sys.exit(1)
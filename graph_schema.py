@@ -0,0 +1,186 @@
+import json
+import sys
+from neo4j_connection import get_session, close_connections
+from graph_utils import rebuild_smurfing_aggregates, rebuild_leaderboards
+
+# Uniqueness constraints for every MERGE key. Each one is backed by a range
+# index, so Block.height (used by the smurfing block-span filter) is covered here.
+CONSTRAINTS = [
+    ("wallet_address_unique",
+     "CREATE CONSTRAINT wallet_address_unique IF NOT EXISTS "
+     "FOR (w:Wallet) REQUIRE w.address IS UNIQUE"),
+    ("transaction_txid_unique",
+     "CREATE CONSTRAINT transaction_txid_unique IF NOT EXISTS "
+     "FOR (t:Transaction) REQUIRE t.txid IS UNIQUE"),
+    ("block_height_unique",
+     "CREATE CONSTRAINT block_height_unique IF NOT EXISTS "
+     "FOR (b:Block) REQUIRE b.height IS UNIQUE"),
+    ("leaderboard_metric_unique",
+     "CREATE CONSTRAINT leaderboard_metric_unique IF NOT EXISTS "
+     "FOR (lb:Leaderboard) REQUIRE lb.metric IS UNIQUE"),
+    ("fee_bucket_start_unique",
+     "CREATE CONSTRAINT fee_bucket_start_unique IF NOT EXISTS "
+     "FOR (fb:FeeBucket) REQUIRE fb.start IS UNIQUE"),
+]
+
+# Plain range indexes for properties that are filtered or sorted on
+INDEXES = [
+    ("transaction_value",
+     "CREATE RANGE INDEX transaction_value IF NOT EXISTS "
+     "FOR (t:Transaction) ON (t.value)"),
+    ("transaction_confirmed",
+     "CREATE RANGE INDEX transaction_confirmed IF NOT EXISTS "
+     "FOR (t:Transaction) ON (t.confirmed)"),
+    ("transaction_block_time",
+     "CREATE RANGE INDEX transaction_block_time IF NOT EXISTS "
+     "FOR (t:Transaction) ON (t.block_time)"),
+    ("transaction_block_height",
+     "CREATE RANGE INDEX transaction_block_height IF NOT EXISTS "
+     "FOR (t:Transaction) ON (t.block_height)"),
+    # Serves the top-K smurfing read (filter and ORDER BY on the maintained aggregate)
+    ("wallet_small_tx_value",
+     "CREATE RANGE INDEX wallet_small_tx_value IF NOT EXISTS "
+     "FOR (w:Wallet) ON (w.small_tx_value)"),
+    # Address-cluster id written by address_clustering.py; entity-level grouping
+    ("wallet_entity",
+     "CREATE RANGE INDEX wallet_entity IF NOT EXISTS "
+     "FOR (w:Wallet) ON (w.entity)"),
+    # Fee-rate ranking and the outlier flags written by fee_analytics.py
+    ("transaction_fee_rate",
+     "CREATE RANGE INDEX transaction_fee_rate IF NOT EXISTS "
+     "FOR (t:Transaction) ON (t.fee_rate)"),
+    ("transaction_fee_outlier",
+     "CREATE RANGE INDEX transaction_fee_outlier IF NOT EXISTS "
+     "FOR (t:Transaction) ON (t.fee_outlier)"),
+]
+
+def ensure_schema(wait_seconds=300):
+    """Idempotently create the project's constraints and indexes"""
+    created = 0
+    with get_session() as session:
+        for name, statement in CONSTRAINTS + INDEXES:
+            try:
+                counters = session.run(statement).consume().counters
+                if counters.constraints_added or counters.indexes_added:
+                    created += 1
+                    print(f"[SCHEMA] Created {name}")
+            except Exception as e:
+                # Most likely duplicate keys already in the graph; keep going with the rest
+                print(f"[SCHEMA] Could not create {name}: {e}")
+
+        if wait_seconds:
+            try:
+                session.run("CALL db.awaitIndexes($timeout)", timeout=wait_seconds).consume()
+            except Exception as e:
+                print(f"[SCHEMA] Indexes still populating after {wait_seconds}s: {e}")
+
+    print(f"[SCHEMA] Schema ready ({created} new, {len(CONSTRAINTS) + len(INDEXES) - created} existing)")
+    return created
+
+def schema_status():
+    """Return the state and population progress of every index in the database"""
+    with get_session() as session:
+        result = session.run("""
+            SHOW INDEXES
+            YIELD name, type, entityType, labelsOrTypes, properties, state, populationPercent, owningConstraint
+            RETURN name, type, entityType, labelsOrTypes, properties, state, populationPercent, owningConstraint
+            ORDER BY name
+        """)
+        return [record.data() for record in result]
+
+def print_schema_status():
+    expected = {name for name, _ in CONSTRAINTS + INDEXES}
+    rows = schema_status()
+    found = set()
+    for row in rows:
+        name = row["owningConstraint"] or row["name"]
+        found.add(name)
+        target = f"{','.join(row['labelsOrTypes'] or [])}({','.join(row['properties'] or [])})"
+        print(f"{name:<32} {row['type']:<8} {target:<36} {row['state']:<10} {row['populationPercent']:.1f}%")
+    for name in sorted(expected - found):
+        print(f"{name:<32} MISSING")
+
+# Temporary index for the migration: each batch finds the remaining legacy nodes through it
+# instead of label-scanning past the ones already migrated; dropped when the migration is done
+STATUS_MIGRATION_INDEX = "transaction_status_migration"
+
+def _migrate_status_batch(tx, batch_size):
+    """Convert one batch of legacy JSON `t.status` strings into typed properties"""
+    records = tx.run("""
+        MATCH (t:Transaction)
+        WHERE t.status IS NOT NULL
+        RETURN t.txid AS txid, t.status AS status
+        LIMIT $limit
+    """, limit=batch_size)
+    rows = []
+    unparsed = 0
+    for record in records:
+        try:
+            status = json.loads(record["status"]) or {}
+        except (TypeError, ValueError):
+            status = {}
+            unparsed += 1
+        rows.append({
+            "txid": record["txid"],
+            "confirmed": bool(status.get("confirmed", False)),
+            "block_height": status.get("block_height"),
+            "block_time": status.get("block_time")
+        })
+    if rows:
+        tx.run("""
+            UNWIND $rows AS row
+            MATCH (t:Transaction {txid: row.txid})
+            SET t.confirmed = row.confirmed,
+                t.block_height = row.block_height,
+                t.block_time = row.block_time
+            REMOVE t.status
+        """, rows=rows).consume()
+    return len(rows), unparsed
+
+def migrate_status(batch_size=10000):
+    """Rewrite legacy `t.status` JSON strings as typed properties.
+
+    Each batch is its own transaction and only touches nodes that still have
+    `t.status`, so the migration can be interrupted and re-run at any point.
+    A temporary range index on `t.status` keeps every batch an index seek.
+    """
+    migrated = unparsed = 0
+    with get_session() as session:
+        session.run(f"CREATE RANGE INDEX {STATUS_MIGRATION_INDEX} IF NOT EXISTS "
+                    "FOR (t:Transaction) ON (t.status)").consume()
+        session.run("CALL db.awaitIndexes($timeout)", timeout=3600).consume()
+        while True:
+            count, bad = session.execute_write(_migrate_status_batch, batch_size)
+            if not count:
+                break
+            migrated += count
+            unparsed += bad
+            print(f"[SCHEMA] Migrated status on {migrated} transactions")
+        # Only dropped once nothing is left; an interrupted run reuses it
+        session.run(f"DROP INDEX {STATUS_MIGRATION_INDEX} IF EXISTS").consume()
+    if unparsed:
+        print(f"[SCHEMA] {unparsed} status values could not be parsed and were stored as unconfirmed")
+    print(f"[SCHEMA] Status migration complete ({migrated} transactions)")
+    return migrated
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    try:
+        if command == "ensure":
+            ensure_schema()
+        elif command == "status":
+            print_schema_status()
+        elif command == "rebuild-smurfing":
+            ensure_schema()
+            rebuild_smurfing_aggregates()
+        elif command == "rebuild-leaderboards":
+            ensure_schema()
+            rebuild_leaderboards()
+        elif command == "migrate-status":
+            ensure_schema()
+            migrate_status(int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+        else:
+            print("Usage: python graph_schema.py [ensure|status|migrate-status [batch_size]|rebuild-smurfing|rebuild-leaderboards]")
+            sys.exit(1)
+    finally:
+        close_connections()
@@ -0,0 +1,517 @@
+import json
+import os
+import shutil
+import sys
+import time
+from array import array
+import numpy as np
+from backup_reader import iter_backup_transactions, iter_chunks
+from compact_backup import MISSING
+from graph_utils import flatten_transactions
+from config import (
+    GRAPH_SNAPSHOT_DIR, SMURF_SMALL_TX_VALUE, SMURF_WINDOW_BLOCKS,
+    SMURF_MIN_TOTAL_VALUE, SMURF_MIN_TX_COUNT, SMURF_TOP_K
+)
+
+# Transaction columns, indexed by transaction id (row number)
+TX_COLUMNS = ("tx_value", "tx_fee", "tx_height", "tx_time")
+
+# Both relationship kinds are stored sorted by source (CSR) with a by-destination
+# permutation (CSC). SENT runs wallet -> transaction, RECEIVED transaction -> wallet.
+RELATIONS = ("sent", "received")
+RELATION_FILES = ("src", "dst", "value", "src_offsets", "dst_order", "dst_offsets")
+
+SNAPSHOT_FILES = TX_COLUMNS + ("tx_confirmed", "txid", "txid_order", "address", "address_order") + tuple(
+    f"{relation}_{name}" for relation in RELATIONS for name in RELATION_FILES
+)
+
+# Cypher equivalents of the snapshot reports, used by `check`
+CYPHER_BLOCK_STATS = """
+    MATCH (t:Transaction)-[:INCLUDED_IN]->(b:Block)
+    WHERE t.fee IS NOT NULL
+    RETURN b.height AS block_height,
+           count(t) AS transaction_count,
+           sum(t.value) AS total_value,
+           avg(t.fee) AS avg_fee,
+           min(t.fee) AS min_fee,
+           max(t.fee) AS max_fee
+    ORDER BY block_height
+"""
+
+def _int_or_missing(value):
+    return MISSING if value is None else int(value)
+
+class _Accumulator:
+    """Collects transaction rows and edges keyed by strings; the last version of a txid wins"""
+
+    def __init__(self):
+        self.txids = []
+        self.last = {}
+        self.cols = {name: array("q") for name in TX_COLUMNS}
+        self.confirmed = array("b")
+        self.addresses = {}
+        self.edges = {relation: (array("q"), array("q"), array("q")) for relation in RELATIONS}
+
+    def add_transaction(self, row):
+        self.last[row["txid"]] = len(self.txids)
+        self.txids.append(row["txid"])
+        self.cols["tx_value"].append(_int_or_missing(row.get("total_sent")))
+        self.cols["tx_fee"].append(_int_or_missing(row.get("fee")))
+        self.cols["tx_height"].append(_int_or_missing(row.get("block_height")))
+        self.cols["tx_time"].append(_int_or_missing(row.get("block_time")))
+        self.confirmed.append(1 if row.get("confirmed") else 0)
+
+    def add_edge(self, relation, row):
+        position = self.last.get(row["txid"])
+        if position is None or row.get("address") is None:
+            return
+        address = self.addresses.setdefault(row["address"], len(self.addresses))
+        positions, addresses, values = self.edges[relation]
+        positions.append(position)
+        addresses.append(address)
+        values.append(_int_or_missing(row.get("value")))
+
+    def add_transactions(self, transactions):
+        params = flatten_transactions(transactions)
+        for row in params["transactions"]:
+            self.add_transaction(row)
+        for relation in RELATIONS:
+            for row in params[relation]:
+                self.add_edge(relation, row)
+
+def _fixed_width(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    width = max((len(s) for s in encoded), default=1)
+    return np.array(encoded, dtype=f"S{max(width, 1)}")
+
+def _lookup(keys, order, queries):
+    """Ids of `queries` in `keys` (sorted through the `order` permutation), -1 where absent"""
+    if not len(keys) or not len(queries):
+        return np.full(len(queries), -1, dtype=np.int64)
+    # Anything wider than the stored keys cannot match (and must not be truncated into a match)
+    fits = np.char.str_len(queries) <= keys.dtype.itemsize
+    queries = queries.astype(keys.dtype)
+    pos = np.minimum(np.searchsorted(keys, queries, sorter=order), len(keys) - 1)
+    ids = np.asarray(order)[pos]
+    found = fits & (keys[ids] == queries)
+    return np.where(found, ids, -1).astype(np.int64)
+
+def _concat_strings(existing, new):
+    width = max(existing.dtype.itemsize if len(existing) else 1, new.dtype.itemsize if len(new) else 1)
+    return np.concatenate([existing.astype(f"S{width}"), new.astype(f"S{width}")])
+
+def _offsets(keys, count):
+    """CSR row pointer for sorted `keys` in [0, count)"""
+    return np.searchsorted(keys, np.arange(count + 1)).astype(np.int64)
+
+def _segment_sums(values, offsets):
+    """Exact int64 sums of consecutive segments (empty segments sum to 0)"""
+    cumulative = np.concatenate([[0], np.cumsum(values, dtype=np.int64)])
+    return cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+
+def _expand(offsets, keys):
+    """For every entry of `keys`, list the positions offsets[k]..offsets[k+1].
+
+    Returns (owner, position): owner[i] indexes `keys`, position[i] is the CSR slot.
+    """
+    starts = offsets[keys]
+    lengths = offsets[keys + 1] - starts
+    owner = np.repeat(np.arange(len(keys)), lengths)
+    shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return owner, np.arange(int(lengths.sum())) + shift
+
+def _count_distinct_pairs(a, b, size_a, size_b):
+    """Number of distinct b per a (a, b are parallel id arrays)"""
+    if not len(a):
+        return np.zeros(size_a, dtype=np.int64)
+    pairs = np.unique(a.astype(np.int64) * max(size_b, 1) + b)
+    return np.bincount(pairs // max(size_b, 1), minlength=size_a)
+
+def _materialize(acc, out_dir, base=None, meta=None):
+    """Merge accumulated rows into `base` (or nothing) and write a complete snapshot"""
+    # Keep only the last version of each txid from this accumulation
+    keep = np.array(sorted(acc.last.values()), dtype=np.int64)
+    rank = np.full(len(acc.txids), -1, dtype=np.int64)
+    rank[keep] = np.arange(len(keep))
+    batch_txids = _fixed_width([acc.txids[i] for i in keep])
+
+    base_txids = np.asarray(base.txid) if base else np.empty(0, dtype="S1")
+    existing = _lookup(base.txid, base.txid_order, batch_txids) if base \
+        else np.full(len(keep), -1, dtype=np.int64)
+    is_new = existing < 0
+    tx_ids = existing.copy()
+    tx_ids[is_new] = len(base_txids) + np.arange(int(is_new.sum()))
+    tx_count = len(base_txids) + int(is_new.sum())
+
+    arrays = {"txid": _concat_strings(base_txids, batch_txids[is_new])}
+    for name in TX_COLUMNS:
+        column = np.full(tx_count, MISSING, dtype=np.int64)
+        if base:
+            column[:len(base_txids)] = getattr(base, name)
+        column[tx_ids] = np.asarray(acc.cols[name], dtype=np.int64)[keep]
+        arrays[name] = column
+    confirmed = np.zeros(tx_count, dtype=np.bool_)
+    if base:
+        confirmed[:len(base_txids)] = base.tx_confirmed
+    confirmed[tx_ids] = np.asarray(acc.confirmed, dtype=np.bool_)[keep]
+    arrays["tx_confirmed"] = confirmed
+
+    # Addresses: reuse existing wallet ids, append unseen ones
+    batch_addresses = _fixed_width(list(acc.addresses))
+    base_addresses = np.asarray(base.address) if base else np.empty(0, dtype="S1")
+    wallet_ids = _lookup(base.address, base.address_order, batch_addresses) if base \
+        else np.full(len(batch_addresses), -1, dtype=np.int64)
+    new_wallets = wallet_ids < 0
+    wallet_ids[new_wallets] = len(base_addresses) + np.arange(int(new_wallets.sum()))
+    arrays["address"] = _concat_strings(base_addresses, batch_addresses[new_wallets])
+    wallet_count = len(arrays["address"])
+
+    # Re-written transactions replace all of their old edges
+    replaced = np.zeros(tx_count, dtype=np.bool_)
+    replaced[existing[~is_new]] = True
+    for relation in RELATIONS:
+        positions, addresses, values = (np.asarray(col, dtype=np.int64) for col in acc.edges[relation])
+        # Edges of superseded versions are dropped
+        live = rank[positions] >= 0
+        edge_tx = tx_ids[rank[positions[live]]]
+        edge_wallet = wallet_ids[addresses[live]]
+        if relation == "sent":
+            new_src, new_dst, n_src, n_dst = edge_wallet, edge_tx, wallet_count, tx_count
+        else:
+            new_src, new_dst, n_src, n_dst = edge_tx, edge_wallet, tx_count, wallet_count
+
+        if base:
+            old_src = np.asarray(getattr(base, f"{relation}_src"))
+            old_dst = np.asarray(getattr(base, f"{relation}_dst"))
+            old_value = np.asarray(getattr(base, f"{relation}_value"))
+            old_tx = old_dst if relation == "sent" else old_src
+            kept = ~replaced[old_tx]
+            src = np.concatenate([old_src[kept], new_src])
+            dst = np.concatenate([old_dst[kept], new_dst])
+            value = np.concatenate([old_value[kept], values[live]])
+        else:
+            src, dst, value = new_src, new_dst, values[live]
+
+        # One edge per (source, destination), last write wins, like MERGE ... SET r.value
+        key = src.astype(np.int64) * max(n_dst, 1) + dst
+        unique_keys, last_index = np.unique(key[::-1], return_index=True)
+        value = value[::-1][last_index]
+        src = unique_keys // max(n_dst, 1)
+        dst = unique_keys % max(n_dst, 1)
+        dst_order = np.argsort(dst, kind="stable")
+        arrays.update({
+            f"{relation}_src": src,
+            f"{relation}_dst": dst,
+            f"{relation}_value": value,
+            f"{relation}_src_offsets": _offsets(src, n_src),
+            f"{relation}_dst_order": dst_order.astype(np.int64),
+            f"{relation}_dst_offsets": _offsets(dst[dst_order], n_dst),
+        })
+
+    arrays["txid_order"] = np.argsort(arrays["txid"], kind="stable").astype(np.int64)
+    arrays["address_order"] = np.argsort(arrays["address"], kind="stable").astype(np.int64)
+
+    # Write next to the target and swap, so readers never see a half-written snapshot
+    tmp_dir = out_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), values)
+    meta = dict(meta or {})
+    meta.update({"transactions": tx_count, "wallets": wallet_count, "built_at": time.time()})
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    old_dir = out_dir.rstrip("/") + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return meta
+
+class GraphSnapshot:
+    """Integer-id CSR snapshot of the transaction graph; every array is memory-mapped by default"""
+
+    def __init__(self, directory=GRAPH_SNAPSHOT_DIR, mmap=True):
+        self.directory = directory
+        mode = "r" if mmap else None
+        for name in SNAPSHOT_FILES:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode))
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+    @staticmethod
+    def exists(directory=GRAPH_SNAPSHOT_DIR):
+        return os.path.exists(os.path.join(directory, "meta.json"))
+
+    @property
+    def num_transactions(self):
+        return len(self.txid)
+
+    @property
+    def num_wallets(self):
+        return len(self.address)
+
+    def txid_of(self, tx):
+        return self.txid[tx].decode("utf-8")
+
+    def address_of(self, wallet):
+        return self.address[wallet].decode("utf-8")
+
+    def find_wallet(self, address):
+        ids = _lookup(self.address, self.address_order, _fixed_width([address]))
+        return int(ids[0]) if ids[0] >= 0 else None
+
+    def find_transaction(self, txid):
+        ids = _lookup(self.txid, self.txid_order, _fixed_width([txid]))
+        return int(ids[0]) if ids[0] >= 0 else None
+
+    def wallet_stats(self):
+        """Per-wallet degree and volume arrays (SENT and RECEIVED edges, values in satoshis)"""
+        sent_values = np.where(self.sent_value == MISSING, 0, self.sent_value)
+        received_values = np.where(self.received_value == MISSING, 0, self.received_value)
+        received_offsets = self.received_dst_offsets
+        return {
+            "sent_count": np.diff(self.sent_src_offsets),
+            "sent_volume": _segment_sums(sent_values, self.sent_src_offsets),
+            "received_count": np.diff(received_offsets),
+            "received_volume": _segment_sums(received_values[self.received_dst_order], received_offsets),
+        }
+
+    def top_wallets(self, by="sent_volume", k=10):
+        """Wallets ranked by one of the `wallet_stats` metrics"""
+        stats = self.wallet_stats()
+        top = np.argsort(-stats[by], kind="stable")[:k]
+        return [
+            {"address": self.address_of(w), **{name: int(values[w]) for name, values in stats.items()}}
+            for w in top if stats[by][w] > 0
+        ]
+
+    def fan_out(self):
+        """Distinct wallets each wallet has paid (through the transactions it sent in), excluding itself"""
+        sender_slot, slots = _expand(self.received_src_offsets, self.sent_dst)
+        senders = self.sent_src[sender_slot]
+        recipients = self.received_dst[slots]
+        other = senders != recipients
+        return _count_distinct_pairs(senders[other], recipients[other], self.num_wallets, self.num_wallets)
+
+    def fan_in(self):
+        """Distinct wallets that have paid each wallet, excluding itself"""
+        edge, slots = _expand(self.sent_dst_offsets, self.received_src)
+        recipients = self.received_dst[edge]
+        senders = self.sent_src[self.sent_dst_order[slots]]
+        other = senders != recipients
+        return _count_distinct_pairs(recipients[other], senders[other], self.num_wallets, self.num_wallets)
+
+    def top_fan(self, direction="out", k=10):
+        counts = self.fan_out() if direction == "out" else self.fan_in()
+        top = np.argsort(-counts, kind="stable")[:k]
+        return [{"address": self.address_of(w), f"fan_{direction}": int(counts[w])} for w in top if counts[w] > 0]
+
+    def smurfing_candidates(self, small_value=SMURF_SMALL_TX_VALUE, window=SMURF_WINDOW_BLOCKS,
+                            min_total=SMURF_MIN_TOTAL_VALUE, min_count=SMURF_MIN_TX_COUNT, k=SMURF_TOP_K):
+        """Vectorized version of `config.smurfing_query` (same columns, same window semantics)"""
+        wallets, txs = np.asarray(self.sent_src), np.asarray(self.sent_dst)
+        values, heights = self.tx_value[txs], self.tx_height[txs]
+        small = (values != MISSING) & (values < small_value) & (heights != MISSING)
+
+        latest = np.full(self.num_wallets, MISSING, dtype=np.int64)
+        np.maximum.at(latest, wallets[small], heights[small])
+        in_window = small.copy()
+        in_window[small] = heights[small] >= latest[wallets[small]] - window
+
+        w, t, h = wallets[in_window], txs[in_window], heights[in_window]
+        count = np.bincount(w, minlength=self.num_wallets)
+        total = np.zeros(self.num_wallets, dtype=np.int64)
+        np.add.at(total, w, self.tx_value[t])
+        earliest = np.full(self.num_wallets, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(earliest, w, h)
+
+        # Distinct receivers over each wallet's windowed small transactions (self included, as in Cypher)
+        owner, slots = _expand(self.received_src_offsets, t)
+        recipients = _count_distinct_pairs(w[owner], self.received_dst[slots], self.num_wallets, self.num_wallets)
+
+        qualifying = np.flatnonzero((total > min_total) & (count > min_count))
+        winners = qualifying[np.argsort(-total[qualifying], kind="stable")][:k]
+        results = []
+        for wallet in winners:
+            own = w == wallet
+            results.append({
+                "sender_address": self.address_of(wallet),
+                "transaction_count": int(count[wallet]),
+                "total_value_satoshis": int(total[wallet]),
+                "block_span": int(latest[wallet] - earliest[wallet]),
+                "unique_recipients": int(recipients[wallet]),
+                "transaction_ids": [self.txid_of(tx) for tx in t[own]],
+            })
+        return results
+
+    def block_stats(self):
+        """Per-block transaction count, value and fee statistics for confirmed transactions"""
+        heights, fees = np.asarray(self.tx_height), np.asarray(self.tx_fee)
+        mask = (heights != MISSING) & (fees != MISSING)
+        blocks, inverse = np.unique(heights[mask], return_inverse=True)
+        fees = fees[mask]
+        values = np.where(self.tx_value[mask] == MISSING, 0, self.tx_value[mask])
+        count = np.bincount(inverse, minlength=len(blocks))
+        fee_sum = np.zeros(len(blocks), dtype=np.int64)
+        np.add.at(fee_sum, inverse, fees)
+        value_sum = np.zeros(len(blocks), dtype=np.int64)
+        np.add.at(value_sum, inverse, values)
+        fee_min = np.full(len(blocks), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(fee_min, inverse, fees)
+        fee_max = np.full(len(blocks), np.iinfo(np.int64).min, dtype=np.int64)
+        np.maximum.at(fee_max, inverse, fees)
+        return [
+            {
+                "block_height": int(blocks[i]),
+                "transaction_count": int(count[i]),
+                "total_value": int(value_sum[i]),
+                "avg_fee": float(fee_sum[i] / count[i]),
+                "min_fee": int(fee_min[i]),
+                "max_fee": int(fee_max[i]),
+            }
+            for i in range(len(blocks))
+        ]
+
+def _open_base(out_dir, update):
+    return GraphSnapshot(out_dir, mmap=True) if update and GraphSnapshot.exists(out_dir) else None
+
+def build_from_transactions(transactions, out_dir=GRAPH_SNAPSHOT_DIR, update=False, meta=None, chunk_size=1000):
+    """Build (or with `update`, merge into) a snapshot from transaction dicts"""
+    acc = _Accumulator()
+    for chunk in iter_chunks(transactions, chunk_size):
+        acc.add_transactions(chunk)
+    return _materialize(acc, out_dir, base=_open_base(out_dir, update), meta=meta)
+
+def build_from_store(out_dir=GRAPH_SNAPSHOT_DIR, update=True):
+    """Build from the master store; with `update`, only records appended since the last build are read"""
+    from master_store import open_master_store
+    store = open_master_store()
+    try:
+        base = _open_base(out_dir, update)
+        start = 0
+        if base and base.meta.get("source") == "store":
+            offset = int(base.meta.get("store_offset", 0))
+            if store.fingerprint(offset) == base.meta.get("store_hash"):
+                start = offset
+        if start == 0:
+            base = None
+
+        acc = _Accumulator()
+        end = start
+        chunk = []
+        for _, end_offset, tx in store.iter_records(start):
+            chunk.append(tx)
+            end = end_offset
+            if len(chunk) >= 1000:
+                acc.add_transactions(chunk)
+                chunk = []
+        if chunk:
+            acc.add_transactions(chunk)
+        print(f"[SNAPSHOT] Read {len(acc.txids)} store records from offset {start}")
+        return _materialize(acc, out_dir, base=base, meta={
+            "source": "store", "store_offset": end, "store_hash": store.fingerprint(end)
+        })
+    finally:
+        store.close()
+
+def build_from_neo4j(out_dir=GRAPH_SNAPSHOT_DIR, fetch_size=10000):
+    """Build from the graph itself (Transaction nodes plus SENT/RECEIVED relationships)"""
+    from neo4j_connection import get_session
+    acc = _Accumulator()
+    with get_session(fetch_size=fetch_size) as session:
+        for record in session.run("""
+            MATCH (t:Transaction)
+            RETURN t.txid AS txid, t.value AS total_sent, t.fee AS fee, t.confirmed AS confirmed,
+                   t.block_height AS block_height, t.block_time AS block_time
+        """):
+            acc.add_transaction(record.data())
+        for record in session.run(
+            "MATCH (w:Wallet)-[r:SENT]->(t:Transaction) RETURN w.address AS address, t.txid AS txid, r.value AS value"
+        ):
+            acc.add_edge("sent", record.data())
+        for record in session.run(
+            "MATCH (t:Transaction)-[r:RECEIVED]->(w:Wallet) RETURN w.address AS address, t.txid AS txid, r.value AS value"
+        ):
+            acc.add_edge("received", record.data())
+    return _materialize(acc, out_dir, meta={"source": "neo4j"})
+
+def check_against_neo4j(snapshot):
+    """Compare the snapshot reports with their Cypher versions; returns the number of mismatches"""
+    from config import smurfing_query
+    from graph_utils import query_Neo4j_database
+    mismatches = 0
+
+    def key(row):
+        return (row["sender_address"], row["transaction_count"], row["total_value_satoshis"],
+                row["block_span"], row["unique_recipients"], tuple(sorted(row["transaction_ids"])))
+    expected = {key(row) for row in query_Neo4j_database(smurfing_query)}
+    actual = {key(row) for row in snapshot.smurfing_candidates()}
+    if expected != actual:
+        mismatches += len(expected ^ actual)
+        print(f"[SNAPSHOT] Smurfing candidates differ: {len(expected - actual)} only in Neo4j, "
+              f"{len(actual - expected)} only in the snapshot")
+
+    expected_blocks = {row["block_height"]: row for row in query_Neo4j_database(CYPHER_BLOCK_STATS)}
+    for row in snapshot.block_stats():
+        other = expected_blocks.pop(row["block_height"], None)
+        if other is None or any(
+            abs(row[name] - other[name]) > 1e-6 for name in
+            ("transaction_count", "total_value", "avg_fee", "min_fee", "max_fee")
+        ):
+            mismatches += 1
+    mismatches += len(expected_blocks)
+    print(f"[SNAPSHOT] Check finished with {mismatches} mismatches")
+    return mismatches
+
+def print_report(snapshot, k=10):
+    print(f"Snapshot: {snapshot.num_transactions} transactions, {snapshot.num_wallets} wallets "
+          f"(source: {snapshot.meta.get('source')})")
+    print("\nTop wallets by sent volume:")
+    for row in snapshot.top_wallets("sent_volume", k):
+        print(f"  {row['address']:<64} {row['sent_volume']:>16} sat in {row['sent_count']} txs")
+    print("\nTop fan-out:")
+    for row in snapshot.top_fan("out", k):
+        print(f"  {row['address']:<64} {row['fan_out']:>8} recipients")
+    print("\nTop fan-in:")
+    for row in snapshot.top_fan("in", k):
+        print(f"  {row['address']:<64} {row['fan_in']:>8} senders")
+    print("\nSmurfing candidates:")
+    for row in snapshot.smurfing_candidates()[:k]:
+        print(f"  {row['sender_address']:<64} {row['transaction_count']:>4} txs {row['total_value_satoshis']:>14} sat "
+              f"span {row['block_span']} recipients {row['unique_recipients']}")
+    blocks = snapshot.block_stats()
+    print(f"\nBlocks: {len(blocks)}")
+    for row in blocks[-k:]:
+        print(f"  {row['block_height']:>8} {row['transaction_count']:>6} txs avg fee {row['avg_fee']:.1f} "
+              f"(min {row['min_fee']}, max {row['max_fee']})")
+
+if __name__ == "__main__":
+    usage = ("Usage: python graph_snapshot.py "
+             "[from-store [DIR] [--full] | from-json JSON [DIR] [--update] | from-neo4j [DIR] | report [DIR] | check [DIR]]")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    flags = {arg for arg in sys.argv[1:] if arg.startswith("--")}
+    if not args:
+        print(usage)
+        sys.exit(1)
+    command = args[0]
+    start_time = time.time()
+    if command == "from-store":
+        meta = build_from_store(args[1] if len(args) > 1 else GRAPH_SNAPSHOT_DIR, update="--full" not in flags)
+    elif command == "from-json" and len(args) >= 2:
+        meta = build_from_transactions(iter_backup_transactions(args[1]),
+                                       args[2] if len(args) > 2 else GRAPH_SNAPSHOT_DIR,
+                                       update="--update" in flags, meta={"source": "backup"})
+    elif command == "from-neo4j":
+        meta = build_from_neo4j(args[1] if len(args) > 1 else GRAPH_SNAPSHOT_DIR)
+    elif command == "report":
+        print_report(GraphSnapshot(args[1] if len(args) > 1 else GRAPH_SNAPSHOT_DIR))
+        sys.exit(0)
+    elif command == "check":
+        sys.exit(1 if check_against_neo4j(GraphSnapshot(args[1] if len(args) > 1 else GRAPH_SNAPSHOT_DIR)) else 0)
+    else:
+        print(usage)
+        sys.exit(1)
+    print(f"[SNAPSHOT] {meta['transactions']} transactions, {meta['wallets']} wallets "
+          f"written in {time.time() - start_time:.2f} seconds")
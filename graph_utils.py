@@ -1,102 +1,505 @@
-from langchain_neo4j import Neo4jGraph
-from config import NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD
-import json
+from neo4j_connection import get_graph, get_session
+from neo4j.exceptions import TransientError
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    GRAPH_WRITER_WORKERS, GRAPH_WRITER_RETRIES, SMURF_SMALL_TX_VALUE, SMURF_WINDOW_BLOCKS, LEADERBOARD_SIZE
+)
+import heapq
+import random
+import time
 
 def connection_to_graph():
-    graphConnection = Neo4jGraph(
-        url=NEO4J_URI,
-        username=NEO4J_USERNAME,
-        password=NEO4J_PASSWORD
-    )
-    return graphConnection
+    """Shared LangChain graph wrapper; kept for callers that need Neo4jGraph itself"""
+    return get_graph()
 
-def insert_transaction(transaction_data):
-    graphConnection = connection_to_graph()
-    txid = transaction_data["txid"]
-    status = transaction_data.get("status", {})
-    vin = transaction_data.get("vin", [])
-    vout = transaction_data.get("vout", [])
-
-    # Calculate total sent (sum of vin values) and total received (sum of vout values)
-    total_sent = sum(vin_entry.get("prevout", {}).get("value", 0) for vin_entry in vin)
-    total_received = sum(vout_entry.get("value", 0) for vout_entry in vout)
-    fee = total_sent - total_received
-
-    # Extract block height and block hash from status
-    block_height = status.get("block_height")
-    block_hash = status.get("block_hash")
-
-    # Store status as JSON string for easy retrieval/visualization
-    status_json = json.dumps(status)
-
-    # Create the Transaction node
-    cypher_tx = """
-        MERGE (t:Transaction {txid: $txid})
-        SET t.value = $total_sent,
-            t.fee = $fee,
-            t.status = $status_json,
-            t.name = $txid
-        """
-
-    graphConnection.query(cypher_tx, {
-        "txid": txid,
-        "total_sent": total_sent,
-        "fee": fee,
-        "status_json": status_json
-    })
-
-    # If block_height is not null, create Block node and relationship
-    if block_height is not None:
-        cypher_block = """
-            MERGE (b:Block {height: $block_height})
-            SET b.hash = $block_hash,
-                b.name = toString($block_height)
-            WITH b
-            MATCH (t:Transaction {txid: $txid})
-            MERGE (t)-[r:INCLUDED_IN]->(b)
-        """
-        graphConnection.query(cypher_block, {
-            "block_height": block_height,
-            "block_hash": block_hash,
-            "txid": txid
+# Leaderboard metric -> transaction row field it ranks by
+LEADERBOARD_METRICS = {
+    "value": "total_sent",
+    "fee": "fee",
+    "fee_rate": "fee_rate",
+}
+
+def virtual_size(weight, size):
+    """vbytes from the weight units both APIs report; pre-segwit data without weight falls back to size"""
+    if weight:
+        return -(-int(weight) // 4)
+    return size
+
+def flatten_transactions(transactions):
+    """Flatten a batch of transactions into the parameter lists used by the UNWIND writes"""
+    tx_rows = []
+    block_rows = []
+    sent_rows = []
+    received_rows = []
+
+    for transaction_data in transactions:
+        txid = transaction_data["txid"]
+        status = transaction_data.get("status", {})
+        vin = transaction_data.get("vin", [])
+        vout = transaction_data.get("vout", [])
+
+        # Calculate total sent (sum of vin values) and total received (sum of vout values)
+        total_sent = sum(vin_entry.get("prevout", {}).get("value", 0) for vin_entry in vin)
+        total_received = sum(vout_entry.get("value", 0) for vout_entry in vout)
+        fee = total_sent - total_received
+        vsize = transaction_data.get("vsize")
+        # Coinbase and records with missing prevouts have no meaningful fee rate
+        fee_rate = round(fee / vsize, 2) if vsize and total_sent > 0 and fee >= 0 else None
+
+        # Status is stored as typed, indexable properties (block hash lives on the Block node)
+        tx_rows.append({
+            "txid": txid,
+            "total_sent": total_sent,
+            "fee": fee,
+            "size": transaction_data.get("size"),
+            "vsize": vsize,
+            "fee_rate": fee_rate,
+            "seen_time": transaction_data.get("seen_time"),
+            "confirmed": bool(status.get("confirmed", False)),
+            "block_height": status.get("block_height"),
+            "block_time": status.get("block_time")
         })
 
-    # Create Wallet nodes and SENT relationships (vin)
-    for vin_entry in vin:
-        prevout = vin_entry.get("prevout", {})
-        sender_addr = prevout.get("scriptpubkey_address")
-        sent_value = prevout.get("value")
-        if sender_addr and sent_value is not None:
-            cypher_sent = """
-                MERGE (w:Wallet {address: $address})
-                MERGE (t:Transaction {txid: $txid})
-                MERGE (w)-[r:SENT]->(t)
-                SET r.value = $value
-            """
-            graphConnection.query(cypher_sent, {
-                "address": sender_addr,
-                "txid": txid,
-                "value": sent_value
+        # Only confirmed transactions carry a block height
+        block_height = status.get("block_height")
+        if block_height is not None:
+            block_rows.append({
+                "block_height": block_height,
+                "block_hash": status.get("block_hash"),
+                "txid": txid
             })
 
-    # Create Wallet nodes and RECEIVED relationships (vout)
-    for vout_entry in vout:
-        receiver_addr = vout_entry.get("scriptpubkey_address")
-        received_value = vout_entry.get("value")
-        if receiver_addr and received_value is not None:
-            cypher_received = """
-                MERGE (w:Wallet {address: $address})
-                MERGE (t:Transaction {txid: $txid})
-                MERGE (t)-[r:RECEIVED]->(w)
-                SET r.value = $value
-            """
-            graphConnection.query(cypher_received, {
-                "address": receiver_addr,
-                "txid": txid,
-                "value": received_value
-            })
+        # Wallet -> Transaction edges (vin)
+        for vin_entry in vin:
+            prevout = vin_entry.get("prevout", {})
+            sender_addr = prevout.get("scriptpubkey_address")
+            sent_value = prevout.get("value")
+            if sender_addr and sent_value is not None:
+                sent_rows.append({"address": sender_addr, "txid": txid, "value": sent_value})
+
+        # Transaction -> Wallet edges (vout)
+        for vout_entry in vout:
+            receiver_addr = vout_entry.get("scriptpubkey_address")
+            received_value = vout_entry.get("value")
+            if receiver_addr and received_value is not None:
+                received_rows.append({"address": receiver_addr, "txid": txid, "value": received_value})
+
+    addresses = list(dict.fromkeys(
+        row["address"] for row in sent_rows + received_rows
+    ))
+
+    # Senders of small confirmed transactions need their smurfing aggregates refreshed
+    small_confirmed = {
+        row["txid"] for row in tx_rows
+        if row["block_height"] is not None and row["total_sent"] < SMURF_SMALL_TX_VALUE
+    }
+    sender_txids = {}
+    for row in sent_rows:
+        if row["txid"] in small_confirmed:
+            sender_txids.setdefault(row["address"], []).append(row["txid"])
+    smurfing_senders = [
+        {"address": address, "txids": list(dict.fromkeys(txids))}
+        for address, txids in sender_txids.items()
+    ]
+
+    # Only a batch's own top N can enter a top-N leaderboard
+    leaderboard = {
+        metric: [
+            {"txid": row["txid"], "score": row[field]}
+            for row in heapq.nlargest(LEADERBOARD_SIZE, (r for r in tx_rows if r[field] is not None),
+                                      key=lambda r: r[field])
+        ]
+        for metric, field in LEADERBOARD_METRICS.items()
+    }
+
+    return {
+        "transactions": tx_rows,
+        "blocks": block_rows,
+        "addresses": addresses,
+        "sent": sent_rows,
+        "received": received_rows,
+        "smurfing_senders": smurfing_senders,
+        "leaderboard": leaderboard
+    }
+
+# One statement per node/relationship kind; each runs once per batch
+# Confirmation is monotonic: a late mempool copy of a transaction never unconfirms it
+CYPHER_UNWIND_TRANSACTIONS = """
+    UNWIND $rows AS row
+    MERGE (t:Transaction {txid: row.txid})
+    SET t.value = row.total_sent,
+        t.fee = row.fee,
+        t.size = coalesce(row.size, t.size),
+        t.vsize = coalesce(row.vsize, t.vsize),
+        t.fee_rate = coalesce(row.fee_rate, t.fee_rate),
+        t.seen_time = coalesce(t.seen_time, row.seen_time),
+        t.confirmed = coalesce(t.confirmed, false) OR row.confirmed,
+        t.block_height = coalesce(row.block_height, t.block_height),
+        t.block_time = coalesce(row.block_time, t.block_time),
+        t.name = row.txid
+    REMOVE t.status
+"""
+
+# A new INCLUDED_IN edge invalidates the block's fee stats (fee_analytics recomputes them)
+CYPHER_UNWIND_BLOCKS = """
+    UNWIND $rows AS row
+    MERGE (b:Block {height: row.block_height})
+    SET b.hash = row.block_hash,
+        b.name = toString(row.block_height)
+    WITH b, row
+    MATCH (t:Transaction {txid: row.txid})
+    MERGE (t)-[r:INCLUDED_IN]->(b)
+    ON CREATE SET b.fee_tx_count = null
+"""
+
+CYPHER_UNWIND_WALLETS = """
+    UNWIND $rows AS address
+    MERGE (w:Wallet {address: address})
+"""
+
+CYPHER_UNWIND_SENT = """
+    UNWIND $rows AS row
+    MATCH (w:Wallet {address: row.address})
+    MATCH (t:Transaction {txid: row.txid})
+    MERGE (w)-[r:SENT]->(t)
+    SET r.value = row.value
+"""
+
+CYPHER_UNWIND_RECEIVED = """
+    UNWIND $rows AS row
+    MATCH (w:Wallet {address: row.address})
+    MATCH (t:Transaction {txid: row.txid})
+    MERGE (t)-[r:RECEIVED]->(w)
+    SET r.value = row.value
+"""
+
+CYPHER_SET_CHECKPOINT = """
+    MERGE (c:LoaderCheckpoint {id: $id})
+    SET c += $props,
+        c.updated_at = datetime()
+"""
+
+# Confirms already-written transactions in place when a new block is announced
+CYPHER_CONFIRM_IN_BLOCK = """
+    MERGE (b:Block {height: $height})
+    SET b.hash = $hash,
+        b.name = toString($height)
+    WITH b
+    UNWIND $txids AS txid
+    MATCH (t:Transaction {txid: txid})
+    SET t.confirmed = true,
+        t.block_height = $height,
+        t.block_time = $time
+    MERGE (t)-[:INCLUDED_IN]->(b)
+    ON CREATE SET b.fee_tx_count = null
+    RETURN t.txid AS txid
+"""
+
+# Incremental smurfing update: each wallet keeps the txids of the small sends inside its
+# current window (small_tx_window), so a batch only reads those plus its own new sends
+# by txid and never expands the wallet's SENT edges
+CYPHER_UPDATE_SMURFING = """
+    UNWIND $rows AS row
+    MATCH (w:Wallet {address: row.address})
+    UNWIND coalesce(w.small_tx_window, []) + row.txids AS txid
+    MATCH (t:Transaction {txid: txid})
+    WHERE t.value < $small_value AND t.block_height IS NOT NULL
+    WITH w, collect(DISTINCT t) AS candidates, max(t.block_height) AS latest
+    UNWIND [t IN candidates WHERE t.block_height >= latest - $window] AS t
+    OPTIONAL MATCH (t)-[:RECEIVED]->(r:Wallet)
+    WITH w, collect(DISTINCT t) AS small_txs, count(DISTINCT r) AS recipients,
+         min(t.block_height) AS earliest, max(t.block_height) AS latest
+    SET w.small_tx_window = [t IN small_txs | t.txid],
+        w.small_tx_count = size(small_txs),
+        w.small_tx_value = reduce(total = 0, t IN small_txs | total + t.value),
+        w.small_tx_min_height = earliest,
+        w.small_tx_max_height = latest,
+        w.small_tx_recipients = recipients
+"""
+
+# Full recompute of each wallet's small-send aggregates (and its window state) from all of
+# its SENT edges; used by rebuild-smurfing only
+CYPHER_REFRESH_SMURFING = """
+    UNWIND $addresses AS address
+    MATCH (w:Wallet {address: address})
+    OPTIONAL MATCH (w)-[:SENT]->(t:Transaction)
+    WHERE t.value < $small_value AND t.block_height IS NOT NULL
+    WITH w, max(t.block_height) AS latest
+    OPTIONAL MATCH (w)-[:SENT]->(t:Transaction)
+    WHERE t.value < $small_value AND t.block_height >= latest - $window
+    WITH w, collect(t) AS small_txs, sum(t.value) AS total,
+         min(t.block_height) AS earliest, max(t.block_height) AS latest
+    CALL {
+        WITH small_txs
+        UNWIND small_txs AS t
+        MATCH (t)-[:RECEIVED]->(r:Wallet)
+        RETURN count(DISTINCT r) AS recipients
+    }
+    WITH w, small_txs, size(small_txs) AS tx_count, total, earliest, latest, recipients
+    SET w.small_tx_window = CASE WHEN tx_count > 0 THEN [t IN small_txs | t.txid] END,
+        w.small_tx_count = CASE WHEN tx_count > 0 THEN tx_count END,
+        w.small_tx_value = CASE WHEN tx_count > 0 THEN total END,
+        w.small_tx_min_height = earliest,
+        w.small_tx_max_height = latest,
+        w.small_tx_recipients = CASE WHEN tx_count > 0 THEN recipients END
+"""
+
+# Merge a batch's candidates into the stored top N (parallel txids/scores lists, best first).
+# Runs after the batch's Transaction nodes are written, and every entry is re-scored from its
+# node (metric names are the property names), so a txid re-ingested with a lower score
+# (e.g. a corrected fee) replaces its stored score instead of keeping the stale higher one
+CYPHER_MERGE_LEADERBOARD = """
+    MERGE (lb:Leaderboard {metric: $metric})
+    WITH lb, coalesce(lb.txids, []) + [c IN $candidates | c.txid] AS txids
+    UNWIND txids AS txid
+    WITH DISTINCT lb, txid
+    MATCH (t:Transaction {txid: txid})
+    WITH lb, txid, t[$metric] AS score
+    WHERE score IS NOT NULL
+    ORDER BY score DESC, txid
+    LIMIT $size
+    WITH lb, collect(txid) AS txids, collect(score) AS scores
+    SET lb.txids = txids,
+        lb.scores = scores,
+        lb.updated_at = datetime()
+"""
+
+CYPHER_SMALL_TX_SENDERS = """
+    UNWIND $txids AS txid
+    MATCH (w:Wallet)-[:SENT]->(t:Transaction {txid: txid})
+    WHERE t.value < $small_value
+    RETURN w.address AS address, collect(DISTINCT t.txid) AS txids
+"""
+
+def _update_smurfing(tx, senders):
+    """Fold new small confirmed sends ({address, txids} rows) into the wallets' window state"""
+    tx.run(CYPHER_UPDATE_SMURFING, rows=senders,
+           small_value=SMURF_SMALL_TX_VALUE, window=SMURF_WINDOW_BLOCKS).consume()
+
+def _refresh_smurfing(tx, addresses):
+    tx.run(CYPHER_REFRESH_SMURFING, addresses=addresses,
+           small_value=SMURF_SMALL_TX_VALUE, window=SMURF_WINDOW_BLOCKS).consume()
+
+def _merge_leaderboards(tx, leaderboard):
+    for metric, candidates in leaderboard.items():
+        if candidates:
+            tx.run(CYPHER_MERGE_LEADERBOARD, metric=metric, candidates=candidates,
+                   size=LEADERBOARD_SIZE).consume()
+
+def _write_nodes(tx, params):
+    tx.run(CYPHER_UNWIND_TRANSACTIONS, rows=params["transactions"]).consume()
+    _merge_leaderboards(tx, params["leaderboard"])
+    if params["blocks"]:
+        tx.run(CYPHER_UNWIND_BLOCKS, rows=params["blocks"]).consume()
+    if params["addresses"]:
+        tx.run(CYPHER_UNWIND_WALLETS, rows=params["addresses"]).consume()
+
+def _write_edges(tx, params):
+    if params["sent"]:
+        tx.run(CYPHER_UNWIND_SENT, rows=params["sent"]).consume()
+    if params["received"]:
+        tx.run(CYPHER_UNWIND_RECEIVED, rows=params["received"]).consume()
+
+def _write_checkpoint(tx, checkpoint):
+    props = {key: value for key, value in checkpoint.items() if key != "id"}
+    tx.run(CYPHER_SET_CHECKPOINT, id=checkpoint["id"], props=props).consume()
+
+def _write_transaction_batch(tx, params, checkpoint=None):
+    """Run the UNWIND statements for one flattened batch inside a single transaction"""
+    _write_nodes(tx, params)
+    _write_edges(tx, params)
+    if params["smurfing_senders"]:
+        _update_smurfing(tx, params["smurfing_senders"])
+    # Committed atomically with the batch, so a crash never skips or half-applies one
+    if checkpoint:
+        _write_checkpoint(tx, checkpoint)
+
+def _execute_write(work, *args, retries=GRAPH_WRITER_RETRIES):
+    """execute_write with extra jittered retries once the driver's own retry budget is spent"""
+    for attempt in range(retries + 1):
+        try:
+            with get_session() as session:
+                return session.execute_write(work, *args)
+        except TransientError as e:
+            # Deadlocks and lock timeouts are transient; anything else propagates
+            if attempt == retries:
+                raise
+            wait = random.uniform(0, 0.1 * (2 ** attempt))
+            print(f"[GRAPH WRITER] Transient error ({e.code}); retry {attempt + 1}/{retries} in {wait:.2f}s")
+            time.sleep(wait)
+
+def insert_transactions(transactions, checkpoint=None):
+    """Insert a batch of transactions with a few UNWIND statements in one explicit transaction.
+
+    `checkpoint` (a dict with an "id" key) is written to a LoaderCheckpoint
+    node in the same transaction as the batch.
+    """
+    transactions = list(transactions)
+    if not transactions and not checkpoint:
+        return 0
+
+    params = flatten_transactions(transactions)
+    _execute_write(_write_transaction_batch, params, checkpoint)
+    return len(transactions)
+
+def _confirm_in_block(tx, block, txids):
+    result = tx.run(CYPHER_CONFIRM_IN_BLOCK, height=block["height"], hash=block["hash"],
+                    time=block.get("time"), txids=txids)
+    confirmed = [record["txid"] for record in result]
+    senders = [record.data() for record in
+               tx.run(CYPHER_SMALL_TX_SENDERS, txids=confirmed, small_value=SMURF_SMALL_TX_VALUE)]
+    if senders:
+        _update_smurfing(tx, senders)
+    return confirmed
+
+def confirm_transactions_in_block(block, txids):
+    """Mark `txids` confirmed in `block` (a dict with height, hash, time) with one write.
+
+    Returns the txids that were found in the graph; the rest have not been
+    written yet.
+    """
+    if not txids:
+        return []
+    return _execute_write(_confirm_in_block, block, list(txids))
+
+def partition_edges(sent_rows, received_rows, workers):
+    """Split SENT/RECEIVED rows into at most `workers` groups that share no node.
+
+    Transactions and wallets joined by an edge end up in the same connected
+    component (union-find), and components are packed largest-first onto the
+    least-loaded worker, so concurrent writers never lock the same node.
+    """
+    parent = {}
+
+    def find(key):
+        parent.setdefault(key, key)
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for row in sent_rows + received_rows:
+        a, b = find(("t", row["txid"])), find(("w", row["address"]))
+        if a != b:
+            parent[a] = b
+
+    components = {}
+    for kind, rows in (("sent", sent_rows), ("received", received_rows)):
+        for row in rows:
+            group = components.setdefault(find(("t", row["txid"])), {"sent": [], "received": []})
+            group[kind].append(row)
+
+    partitions = [{"sent": [], "received": []} for _ in range(max(1, workers))]
+    loads = [0] * len(partitions)
+    for group in sorted(components.values(), key=lambda g: len(g["sent"]) + len(g["received"]), reverse=True):
+        target = loads.index(min(loads))
+        partitions[target]["sent"].extend(group["sent"])
+        partitions[target]["received"].extend(group["received"])
+        loads[target] += len(group["sent"]) + len(group["received"])
+    return [p for p in partitions if p["sent"] or p["received"]]
+
+def insert_transactions_parallel(transactions, workers=GRAPH_WRITER_WORKERS, checkpoint=None):
+    """Two-phase batch write that scales across database cores.
+
+    Phase one creates every Transaction, Block (with INCLUDED_IN) and Wallet
+    node of the batch in a single transaction, so hot blocks are only locked
+    once. Phase two writes SENT/RECEIVED in parallel over node-disjoint
+    partitions. The checkpoint is committed only after both phases succeed.
+    """
+    transactions = list(transactions)
+    if workers <= 1:
+        return insert_transactions(transactions, checkpoint=checkpoint)
+    if not transactions:
+        if checkpoint:
+            _execute_write(_write_checkpoint, checkpoint)
+        return 0
+
+    params = flatten_transactions(transactions)
+    _execute_write(_write_nodes, params)
+
+    partitions = partition_edges(params["sent"], params["received"], workers)
+    if len(partitions) > 1:
+        with ThreadPoolExecutor(max_workers=len(partitions)) as executor:
+            # list() re-raises the first failure after all partitions finish
+            list(executor.map(lambda part: _execute_write(_write_edges, part), partitions))
+    elif partitions:
+        _execute_write(_write_edges, partitions[0])
+
+    if params["smurfing_senders"]:
+        _execute_write(_update_smurfing, params["smurfing_senders"])
+    if checkpoint:
+        _execute_write(_write_checkpoint, checkpoint)
+    return len(transactions)
+
+def _wallet_addresses_after(tx, after, limit):
+    result = tx.run(
+        "MATCH (w:Wallet) WHERE w.address > $after "
+        "RETURN w.address AS address ORDER BY w.address LIMIT $limit",
+        after=after, limit=limit
+    )
+    return [record["address"] for record in result]
+
+def rebuild_smurfing_aggregates(batch_size=5000):
+    """Recompute the smurfing aggregates of every wallet (backfills, threshold changes).
+
+    Wallets are walked in address order, one write transaction per batch.
+    """
+    after = ""
+    refreshed = 0
+    while True:
+        with get_session() as session:
+            addresses = session.execute_read(_wallet_addresses_after, after, batch_size)
+        if not addresses:
+            break
+        _execute_write(_refresh_smurfing, addresses)
+        refreshed += len(addresses)
+        after = addresses[-1]
+        print(f"[SMURFING] Refreshed aggregates for {refreshed} wallets")
+    return refreshed
+
+def _rebuild_leaderboard(tx, metric, prop):
+    tx.run(f"""
+        MATCH (t:Transaction)
+        WHERE t.{prop} IS NOT NULL
+        WITH t ORDER BY t.{prop} DESC, t.txid LIMIT $size
+        WITH collect(t.txid) AS txids, collect(t.{prop}) AS scores
+        MERGE (lb:Leaderboard {{metric: $metric}})
+        SET lb.txids = txids,
+            lb.scores = scores,
+            lb.updated_at = datetime()
+    """, metric=metric, size=LEADERBOARD_SIZE).consume()
+
+def rebuild_leaderboards(metrics=None):
+    """Recompute leaderboards from the Transaction nodes (after imports or a LEADERBOARD_SIZE change)"""
+    for metric in metrics or LEADERBOARD_METRICS:
+        # Leaderboard metrics are stored on the node under the same name
+        _execute_write(_rebuild_leaderboard, metric, metric)
+        print(f"[LEADERBOARD] Rebuilt '{metric}' (top {LEADERBOARD_SIZE})")
+
+def ensure_leaderboards():
+    """Build any leaderboard that does not exist yet, e.g. on a graph loaded before they did"""
+    existing = {
+        record["metric"] for record in
+        query_Neo4j_database("MATCH (lb:Leaderboard) RETURN lb.metric AS metric")
+    }
+    missing = [metric for metric in LEADERBOARD_METRICS if metric not in existing]
+    if missing:
+        rebuild_leaderboards(missing)
+    return missing
+
+def get_checkpoint(checkpoint_id):
+    """Read a loader checkpoint back from the graph, or None"""
+    records = query_Neo4j_database(
+        "MATCH (c:LoaderCheckpoint {id: $id}) RETURN properties(c) AS props",
+        {"id": checkpoint_id}
+    )
+    return records[0]["props"] if records else None
+
+def insert_transaction(transaction_data):
+    insert_transactions([transaction_data])
 
-def query_Neo4j_database(query):
-    graphConnection = connection_to_graph()
-    records = graphConnection.query(query)
+def query_Neo4j_database(query, params=None):
+    with get_session() as session:
+        result = session.run(query, params or {})
+        records = [record.data() for record in result]
     return records
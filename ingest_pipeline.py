@@ -0,0 +1,283 @@
+import json
+import os
+import queue
+import threading
+import time
+from graph_utils import insert_transactions
+
+OVERFLOW_POLICIES = ("block", "spill", "drop_oldest")
+
+class SpillFile:
+    """Append-only JSONL overflow file that the writers drain once the queue has room"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._read_offset = 0
+        self.pending = 0
+        # Lines that could not be decoded (skipped, not retried)
+        self.skipped = 0
+        self._drop_torn_tail()
+        self._writer = open(path, "a", encoding="utf-8")
+        # Records left over from a previous run still need writing
+        with open(path, "r", encoding="utf-8") as f:
+            self.pending = sum(1 for _ in f)
+
+    def _drop_torn_tail(self):
+        """Cut a partial last line left by a crash, so the next append does not glue onto it"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                f.seek(max(0, position - 65536))
+                chunk = f.read(position - max(0, position - 65536))
+                newline = chunk.rfind(b"\n")
+                if newline >= 0:
+                    position = position - len(chunk) + newline + 1
+                    break
+                position -= len(chunk)
+            if position < end:
+                print(f"[PIPELINE] Dropping {end - position} bytes of a torn record at the end of {self.path}")
+                f.truncate(position)
+
+    def append(self, tx):
+        with self._lock:
+            self._writer.write(json.dumps(tx) + "\n")
+            self._writer.flush()
+            self.pending += 1
+
+    def read(self, limit):
+        """Return up to `limit` spilled records, oldest first"""
+        with self._lock:
+            if not self.pending:
+                return []
+            records = []
+            consumed = 0
+            with open(self.path, "r", encoding="utf-8") as f:
+                f.seek(self._read_offset)
+                while len(records) < limit:
+                    line = f.readline()
+                    if not line:
+                        break
+                    consumed += 1
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        self.skipped += 1
+                        print(f"[PIPELINE] Skipping an undecodable spill record ({self.skipped} so far)")
+                self._read_offset = f.tell()
+            self.pending = max(0, self.pending - consumed)
+            if not self.pending:
+                # Fully drained: start the file over so it does not grow forever
+                self._writer.truncate(0)
+                self._writer.seek(0)
+                self._read_offset = 0
+            return records
+
+    def close(self):
+        with self._lock:
+            self._writer.close()
+        if not self.pending and os.path.exists(self.path):
+            os.remove(self.path)
+
+class IngestPipeline:
+    """Bounded queue between the websocket reader and batched graph writers.
+
+    The receive path only calls submit(); writer threads drain the queue and
+    flush a batch when it reaches `batch_size` or `flush_interval` seconds
+    after its first record arrived, whichever comes first.
+    """
+
+    def __init__(self, write_batch=insert_transactions, workers=1, batch_size=500,
+                 flush_interval=1.0, max_queue=10000, overflow="block", spill_path=None,
+                 retry_backoff=0.5, max_retry_backoff=30.0):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+        if overflow == "spill" and not spill_path:
+            raise ValueError("overflow='spill' needs a spill_path")
+        self.write_batch = write_batch
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.spill = SpillFile(spill_path) if overflow == "spill" else None
+        # After a failed write, writers pause and the spill file is not re-read until _retry_at
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._stop = threading.Event()
+        self._threads = []
+        # drop_oldest evicts and re-inserts as one step, so a concurrent submit cannot refill the slot
+        self._drop_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0, "written": 0, "batches": 0, "failed": 0,
+            "dropped": 0, "spilled": 0, "max_depth": 0, "last_batch_seconds": 0.0
+        }
+
+    def _bump(self, **deltas):
+        with self._stats_lock:
+            for key, value in deltas.items():
+                self._stats[key] += value
+
+    def submit(self, tx):
+        """Enqueue one transaction; returns False if it was dropped or spilled"""
+        if self.overflow == "block":
+            self.queue.put(tx)
+        else:
+            try:
+                self.queue.put_nowait(tx)
+            except queue.Full:
+                if self.overflow == "spill":
+                    self.spill.append(tx)
+                    self._bump(enqueued=1, spilled=1)
+                    return False
+                # drop_oldest: make room by discarding the head of the queue (retried if another
+                # submitter without the lock takes the freed slot first)
+                with self._drop_lock:
+                    while True:
+                        try:
+                            self.queue.get_nowait()
+                            self.queue.task_done()
+                            self._bump(dropped=1)
+                        except queue.Empty:
+                            pass
+                        try:
+                            self.queue.put_nowait(tx)
+                            break
+                        except queue.Full:
+                            continue
+
+        depth = self.queue.qsize()
+        with self._stats_lock:
+            self._stats["enqueued"] += 1
+            if depth > self._stats["max_depth"]:
+                self._stats["max_depth"] = depth
+        return True
+
+    def _next_batch(self):
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = self.flush_interval if deadline is None else deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                tx = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            self.queue.task_done()
+            batch.append(tx)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+
+        # Backfill from the spill file once the live queue is keeping up (and not while backing off)
+        with self._stats_lock:
+            backing_off = time.monotonic() < self._retry_at
+        if self.spill is not None and len(batch) < self.batch_size and self.queue.empty() and not backing_off:
+            try:
+                batch.extend(self.spill.read(self.batch_size - len(batch)))
+            except OSError as e:
+                # Keep what came off the queue; the spill file is retried on the next batch
+                print(f"[PIPELINE] Could not read the spill file: {e}")
+        return batch
+
+    def _flush(self, batch):
+        """Write one batch; returns False if the write failed"""
+        started = time.monotonic()
+        try:
+            self.write_batch(batch)
+        except Exception as e:
+            print(f"[PIPELINE] Failed to write batch of {len(batch)} transactions: {e}")
+            if self.spill is not None:
+                for tx in batch:
+                    self.spill.append(tx)
+                self._bump(spilled=len(batch), failed=1)
+            else:
+                self._bump(failed=1)
+            with self._stats_lock:
+                # Exponential backoff, reset by the next successful write
+                self._backoff = min(self.max_retry_backoff, self._backoff * 2 or self.retry_backoff)
+                self._retry_at = time.monotonic() + self._backoff
+            return False
+        elapsed = time.monotonic() - started
+        with self._stats_lock:
+            self._backoff = 0.0
+            self._retry_at = 0.0
+            self._stats["written"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["last_batch_seconds"] = elapsed
+        return True
+
+    def _worker(self):
+        while True:
+            try:
+                if self._work_once():
+                    return
+            except Exception as e:
+                # One bad batch must not kill the writer; everything after it still needs writing
+                print(f"[PIPELINE] Writer error: {e}")
+                self._bump(failed=1)
+                if self._stop.is_set():
+                    return
+                self._stop.wait(self.retry_backoff)
+
+    def _work_once(self):
+        """Take and write one batch; returns True when the writer should exit"""
+        batch = self._next_batch()
+        if batch:
+            if not self._flush(batch):
+                # A failure while shutting down leaves the rest in the spill file for next run
+                if self._stop.is_set():
+                    return True
+                with self._stats_lock:
+                    delay = self._retry_at - time.monotonic()
+                self._stop.wait(max(0.0, delay))
+            return False
+        return self._stop.is_set() and self.queue.empty()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"graph-writer-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """Stop accepting work, drain what is queued and wait for the writers"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self.spill is not None:
+            self.spill.close()
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["depth"] = self.queue.qsize()
+        stats["capacity"] = self.queue.maxsize
+        stats["spill_pending"] = self.spill.pending if self.spill is not None else 0
+        stats["spill_skipped"] = self.spill.skipped if self.spill is not None else 0
+        return stats
+
+    def report(self):
+        m = self.metrics()
+        print(f"[PIPELINE] depth={m['depth']}/{m['capacity']} max_depth={m['max_depth']} "
+              f"enqueued={m['enqueued']} written={m['written']} batches={m['batches']} "
+              f"dropped={m['dropped']} spilled={m['spilled']} spill_pending={m['spill_pending']} "
+              f"spill_skipped={m['spill_skipped']} "
+              f"failed={m['failed']} last_batch={m['last_batch_seconds']:.3f}s")
+
+    def start_reporter(self, interval=30, extra_reports=()):
+        """Print metrics (plus any `extra_reports` callables) every `interval` seconds until the pipeline stops"""
+        def run():
+            while not self._stop.wait(interval):
+                self.report()
+                for report in extra_reports:
+                    report()
+        threading.Thread(target=run, name="pipeline-metrics", daemon=True).start()
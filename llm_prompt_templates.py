@@ -35,11 +35,30 @@ Examples of good queries:
   ORDER BY t.value DESC 
   LIMIT 10
 
-- Fetching all unconfirmed Transactions
-    MATCH (t:Transaction)-[r]-(other)
-    WHERE t.status CONTAINS '"confirmed": false'
+- Fetching all unconfirmed Transactions (t.confirmed is indexed; never parse a status string)
+    MATCH (t:Transaction {confirmed: false})-[r]-(other)
     RETURN t, r, other LIMIT 100
 
+- Transactions confirmed in a time or height range (t.block_time is unix seconds; both are indexed)
+    MATCH (t:Transaction)
+    WHERE t.block_time >= 1700000000 AND t.block_time < 1700086400
+    RETURN t.txid, t.value, t.block_height
+    ORDER BY t.block_time
+    LIMIT 100
+
+- Most active entities (w.entity groups addresses spent together as inputs, i.e. one owner; it is indexed)
+    MATCH (w:Wallet)-[:SENT]->(t:Transaction)
+    WHERE w.entity IS NOT NULL
+    WITH w.entity AS entity, count(DISTINCT t) AS tx_count, count(DISTINCT w) AS address_count
+    RETURN entity, tx_count, address_count
+    ORDER BY tx_count DESC
+    LIMIT 5
+
+- All addresses that belong to the same entity as a given address
+    MATCH (w:Wallet {address: $address})
+    MATCH (other:Wallet {entity: w.entity})
+    RETURN other.address
+
 - getting the highest number of transactions performed by a block 
     MATCH (t:Transaction)-[:INCLUDED_IN]->(b:Block)
     WITH b, count(t) AS tx_count
@@ -48,17 +67,23 @@ Examples of good queries:
     LIMIT 1
 
 
-- To identify transaction fee patterns within a specific block
-    MATCH (t:Transaction)-[:INCLUDED_IN]->(b:Block)
-    WHERE t.fee IS NOT NULL
-    RETURN 
+- To identify transaction fee patterns within a specific block (fee stats are precomputed on the Block;
+  percentile lists are p10, p25, p50, p75, p90, p99; fee_rate is in sat/vB; never collect(t.fee))
+    MATCH (b:Block)
+    WHERE b.fee_tx_count > 0
+    RETURN
     b.height AS block_height,
-    count(t) AS transaction_count,
-    avg(t.fee) AS avg_fee,
-    min(t.fee) AS min_fee,
-    max(t.fee) AS max_fee,
-    collect(t.fee) AS all_fees
-    ORDER BY block_height
+    b.fee_tx_count AS transaction_count,
+    b.fee_percentiles AS fee_percentiles,
+    b.fee_rate_percentiles AS fee_rate_percentiles,
+    b.fee_rate_histogram AS fee_rate_histogram
+    ORDER BY block_height DESC
+    LIMIT 10
+
+- Transactions with an unusually high fee (t.fee_outlier is indexed)
+    MATCH (t:Transaction {fee_outlier: true})
+    RETURN t.txid, t.fee, t.fee_rate, t.vsize, t.block_height
+    ORDER BY t.fee_rate DESC
     LIMIT 10
 
 Now convert this natural language query into a precise Cypher query:
@@ -1,19 +1,35 @@
+import argparse
+import asyncio
+import json
+import os
 import orjson
 import requests
 import time
 import sys
-import concurrent.futures
-from functools import lru_cache
-from graph_utils import insert_transaction
-from config import BLOCKSTREAM_API
+from graph_utils import (
+    insert_transactions, insert_transactions_parallel, get_checkpoint, ensure_leaderboards, virtual_size
+)
+from address_clustering import cluster_and_write
+from fee_analytics import update_block_fee_stats
+from neo4j_connection import close_connections
+from graph_schema import ensure_schema
+from bulk_import_csv import export_backup_to_csv, import_command
+from master_store import open_master_store
+from backup_reader import iter_chunks
+from block_resolver import BlockConfirmationResolver
+from async_fetcher import AsyncTxFetcher
+from tx_cache import MISS, get_tx_cache
+from config import BLOCKSTREAM_API, LOADER_CHECKPOINT_PATH
 
-BACKUP_FILE = "bitcoin_transactions_backup.json"
+CHECKPOINT_ID = "master_store"
 
 def filter_and_format_tx(tx):
     # Build the structure as specified
     return {
         "txid": tx["txid"],
         "status": tx["status"],
+        "size": tx.get("size"),
+        "vsize": virtual_size(tx.get("weight"), tx.get("size")),
         "vin": [
             {
                 "prevout": {
@@ -30,9 +46,12 @@ def filter_and_format_tx(tx):
         ]
     }
 
+# One keep-alive session for every synchronous lookup
+_session = requests.Session()
+
 def safe_get(url, txid, max_retries=2, backoff_factor=1):
     """Make a GET request with retry logic to handle connection issues"""
-    session = requests.Session()
+    session = _session
     retries = 0
     last_status = None
     
@@ -69,137 +88,311 @@ def safe_get(url, txid, max_retries=2, backoff_factor=1):
     return None
 
 
-@lru_cache(maxsize=1024)
-def get_tx_current_status(txid):
-    """Fetch current transaction status from Blockstream API with caching"""
+def get_tx_current_status(txid, confirmed_only=False):
+    """Fetch current transaction status from Blockstream API through the persistent cache.
+
+    With `confirmed_only` (the txid was just seen in a block) only a cached
+    confirmed document is trusted; a cached unconfirmed copy or 404 is refetched.
+    """
+    cache = get_tx_cache()
+    cached = cache.get(txid)
+    if cached is not MISS and (not confirmed_only or (cached and cached["status"].get("confirmed", False))):
+        return cached
     url = f"{BLOCKSTREAM_API}/tx/{txid}"
     response = safe_get(url,txid)
-    if response:
-        # Use orjson to parse the response content
-        return orjson.loads(response.content)
-    return None
+    # Use orjson to parse the response content
+    tx = orjson.loads(response.content) if response else None
+    cache.put(txid, tx)
+    return tx
 
-def check_transactions_concurrently(unconfirmed_txs, txid_to_index, transactions, max_workers=10):
-    """Check transaction status concurrently using thread pool"""
-    updated_count = 0
-    total = len(unconfirmed_txs)
+def check_transactions_concurrently(unconfirmed_txids, fetcher=None):
+    """Check transaction status through the pooled, rate-limited async fetcher; returns the newly confirmed transactions"""
+    fetcher = fetcher or AsyncTxFetcher()
+    cache = get_tx_cache()
+    total = len(unconfirmed_txids)
     print(f"[DOCKER LOG] Starting concurrent check of {total} unconfirmed transactions...")
-    
-    # Process transactions in chunks to avoid overwhelming the API
-    chunk_size = 100
-    for chunk_start in range(0, total, chunk_size):
-        chunk_end = min(chunk_start + chunk_size, total)
-        chunk = unconfirmed_txs[chunk_start:chunk_end]
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_tx = {executor.submit(get_tx_current_status, tx["txid"]): tx for tx in chunk}
-            
-            for i, future in enumerate(concurrent.futures.as_completed(future_to_tx)):
-                original_tx = future_to_tx[future]
-                txid = original_tx.get("txid")
-                
-                try:
-                    current_tx = future.result()
-                    if current_tx and current_tx["status"].get("confirmed", False):
-                        # Get the index from our mapping and update
-                        original_index = txid_to_index[txid]
-                        current_tx_formatted = filter_and_format_tx(current_tx)
-                        transactions[original_index] = current_tx_formatted
-                        updated_count += 1
-                except Exception as e:
-                    print(f"Error processing transaction {txid}: {e}")
-            
-            # Display progress after each chunk
-            percent_complete = int((chunk_end) / total * 100)
-            print(f"[DOCKER LOG] Processing: {percent_complete}% complete ({chunk_end}/{total})")
-            sys.stdout.flush()
-    
+
+    # Answer what we can from the persistent cache; only misses go over the network
+    confirmed_txs = []
+    to_fetch = []
+    for txid in unconfirmed_txids:
+        cached = cache.get(txid)
+        if cached is MISS:
+            to_fetch.append(txid)
+        elif cached and cached["status"].get("confirmed", False):
+            confirmed_txs.append(filter_and_format_tx(cached))
+    print(f"[DOCKER LOG] {total - len(to_fetch)} answered from cache, {len(to_fetch)} to fetch")
+
+    async def collect():
+        done = total - len(to_fetch)
+        # Results arrive in completion order, not submission order
+        async for txid, current_tx in fetcher.fetch_many(to_fetch):
+            done += 1
+            cache.put(txid, current_tx)
+            try:
+                if current_tx and current_tx["status"].get("confirmed", False):
+                    confirmed_txs.append(filter_and_format_tx(current_tx))
+            except Exception as e:
+                print(f"Error processing transaction {txid}: {e}")
+
+            # Display progress every 100 transactions
+            if done % 100 == 0 or done == total:
+                percent_complete = int(done / total * 100)
+                print(f"[DOCKER LOG] Processing: {percent_complete}% complete ({done}/{total}) | "
+                      f"{fetcher.stats.requests_per_second():.1f} req/s, p99 {fetcher.stats.percentile(99) * 1000:.0f} ms")
+                sys.stdout.flush()
+
+    if to_fetch:
+        asyncio.run(collect())
     print(f"[DOCKER LOG] Completed checking unconfirmed transactions: 100% ({total}/{total})")
-    return updated_count
+    print(f"[DOCKER LOG] Status fetcher: {fetcher.stats.summary()}")
+    return confirmed_txs
 
-def update_transaction_statuses():
-    """Check for status changes in transactions and update backup file using concurrent processing"""
+def resolve_confirmations(unconfirmed_txids, resolver=None):
+    """Find newly confirmed transactions by walking blocks since the stored tip.
+
+    Only the very first run (no stored tip yet) falls back to polling every
+    unconfirmed txid; it then records the tip so later runs walk blocks.
+    """
+    resolver = resolver or BlockConfirmationResolver()
+    try:
+        if not unconfirmed_txids:
+            # Still advance the stored tip so the next non-empty run starts from here
+            return resolver.resolve(unconfirmed_txids)
+        if resolver.load_tip() is None:
+            tip = resolver.tip_height()
+            confirmed_txs = check_transactions_concurrently(unconfirmed_txids)
+            resolver.save_tip(tip)
+            return confirmed_txs
+        confirmed = resolver.resolve(unconfirmed_txids,
+                                     fetch_tx=lambda txid: get_tx_current_status(txid, confirmed_only=True))
+        return [filter_and_format_tx(tx) for tx in confirmed]
+    except Exception as e:
+        print(f"[DOCKER LOG] Block walk failed ({e}); polling transactions individually")
+        return check_transactions_concurrently(unconfirmed_txids)
+
+def update_transaction_statuses(store):
+    """Check for status changes in transactions and append updated versions to the master store"""
     try:
         start_time = time.time()
-        # Load transactions from backup file using orjson
-        with open(BACKUP_FILE, "rb") as f:
-            transactions = orjson.loads(f.read())
-        
-        print(f"Loaded {len(transactions)} transactions from backup file.")
-        
-        # Find transactions with status.confirmed = false
-        unconfirmed_txs = [tx for tx in transactions if not tx.get("status", {}).get("confirmed", True)]
-        print(f"Found {len(unconfirmed_txs)} unconfirmed transactions.")
-        
-        # Create a mapping of txid to index in the original transactions list
-        txid_to_index = {tx.get("txid"): i for i, tx in enumerate(transactions)}
+        # The store index keeps each txid's current confirmed flag; no record is parsed
+        unconfirmed_txids = store.unconfirmed_txids()
+        print(f"Found {len(unconfirmed_txids)} unconfirmed transactions out of {len(store)}.")
 
-        # Use concurrent processing
-        updated_count = check_transactions_concurrently(unconfirmed_txs, txid_to_index, transactions)
+        updated_txs = resolve_confirmations(unconfirmed_txids)
+        updated_count = len(updated_txs)
         
         if updated_count > 0:
-            # Save updated transactions back to file using orjson
-            with open(BACKUP_FILE, "wb") as f:
-                f.write(orjson.dumps(transactions, option=orjson.OPT_INDENT_2))
-            print(f"[DOCKER LOG] Updated {updated_count} transactions in the backup file.")
+            # Append the confirmed versions; the store is never rewritten
+            store.update(updated_txs)
+            print(f"[DOCKER LOG] Updated {updated_count} transactions in the master store.")
         else:
             print("[DOCKER LOG] No transactions needed updating.")
         
         end_time = time.time()
         print(f"[DOCKER LOG] Transaction status update completed in {end_time - start_time:.2f} seconds")
-        return updated_count, len(unconfirmed_txs), transactions
+        return updated_count, len(unconfirmed_txids)
     
     except Exception as e:
         print(f"Error updating transaction statuses: {e}")
         return None
 
-def bulk_insert_transactions(transactions, batch_size=100):
-    """Insert transactions in batches"""
-    total = len(transactions)
+def bulk_insert_transactions(transactions, total=None, batch_size=1000):
+    """Insert transactions in batches with the two-phase parallel writer.
+
+    `transactions` may be any iterable (e.g. a streaming reader); pass `total`
+    for progress reporting when it has no len().
+    """
+    if total is None:
+        total = len(transactions)
     print(f"[DOCKER LOG] Inserting {total} transactions into Neo4j database...")
+    start_time = time.time()
     
     # Set up milestone percentages for insertion
     milestones = [10, 30, 50, 70, 80, 90, 100]
     next_milestone_idx = 0
+    current_progress = 0
     
-    for i in range(0, total, batch_size):
-        batch = transactions[i:min(i+batch_size, total)]
+    for batch in iter_chunks(transactions, batch_size):
+        insert_transactions_parallel(batch)
         
-        # Insert each transaction in the batch
-        for j, tx in enumerate(batch):
-            insert_transaction(tx)
-            
-            # Calculate current percentage for the whole operation
-            current_progress = i + j + 1
-            percent_complete = int(current_progress / total * 100)
-            
-            # Check if we've hit a milestone
-            if next_milestone_idx < len(milestones) and percent_complete >= milestones[next_milestone_idx]:
-                print(f"[DOCKER LOG] Database insertion: {milestones[next_milestone_idx]}% complete ({current_progress}/{total})")
-                sys.stdout.flush()
-                next_milestone_idx += 1
+        # Calculate current percentage for the whole operation
+        current_progress += len(batch)
+        percent_complete = int(current_progress / total * 100) if total else 100
+        
+        # Report every milestone passed by this batch
+        while next_milestone_idx < len(milestones) and percent_complete >= milestones[next_milestone_idx]:
+            print(f"[DOCKER LOG] Database insertion: {milestones[next_milestone_idx]}% complete ({current_progress}/{total})")
+            sys.stdout.flush()
+            next_milestone_idx += 1
     
-    print("[DOCKER LOG] All transactions inserted into the database: 100% complete")
+    elapsed = time.time() - start_time
+    rate = current_progress / elapsed if elapsed > 0 else 0
+    print(f"[DOCKER LOG] All transactions inserted into the database: 100% complete ({rate:.0f} tx/s)")
 
-def main():
+def read_local_checkpoint():
+    if not os.path.exists(LOADER_CHECKPOINT_PATH):
+        return None
     try:
+        with open(LOADER_CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return None
+
+def write_local_checkpoint(checkpoint):
+    tmp_path = LOADER_CHECKPOINT_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, LOADER_CHECKPOINT_PATH)
+
+def make_checkpoint(store, offset):
+    return {"id": CHECKPOINT_ID, "offset": offset, "hash": store.fingerprint(offset)}
+
+def resume_offset(store):
+    """Byte offset in the master store up to which the graph is already loaded.
+
+    The database copy of the watermark is authoritative (a wiped volume means
+    a full reload); the hash guards against a store that was replaced.
+    """
+    checkpoint = get_checkpoint(CHECKPOINT_ID)
+    local = read_local_checkpoint()
+    if checkpoint is None:
+        if local:
+            print("[DOCKER LOG] Database has no loader checkpoint (fresh volume?); loading everything")
+        return 0
+    offset = int(checkpoint.get("offset", 0))
+    if store.fingerprint(offset) != checkpoint.get("hash"):
+        print("[DOCKER LOG] Master store changed since the last load; loading everything")
+        return 0
+    if local and local.get("offset") != offset:
+        print(f"[DOCKER LOG] Local checkpoint ({local.get('offset')}) differs from database ({offset}); using database")
+    return offset
+
+def load_new_records(store, start_offset, batch_size=1000):
+    """Insert only the records appended after `start_offset`, checkpointing after every batch.
+
+    Status changes are appended to the store as new versions, so confirmed
+    transactions (with their block linkage) arrive here as ordinary records.
+    """
+    end_offset = store.size()
+    pending_bytes = end_offset - start_offset
+    if pending_bytes <= 0:
+        print("[DOCKER LOG] Graph is up to date with the master store; nothing to insert.")
+        return 0
+
+    print(f"[DOCKER LOG] Loading {pending_bytes} new bytes of the master store from offset {start_offset}...")
+    start_time = time.time()
+    milestones = [10, 30, 50, 70, 80, 90, 100]
+    next_milestone_idx = 0
+    loaded = 0
+    batch = []
+    batch_end = start_offset
+
+    def flush():
+        nonlocal loaded, next_milestone_idx
+        checkpoint = make_checkpoint(store, batch_end)
+        insert_transactions_parallel(batch, checkpoint=checkpoint)
+        write_local_checkpoint(checkpoint)
+        loaded += len(batch)
+        batch.clear()
+        percent_complete = int((batch_end - start_offset) / pending_bytes * 100)
+        if next_milestone_idx < len(milestones) and percent_complete >= milestones[next_milestone_idx]:
+            while next_milestone_idx < len(milestones) and percent_complete >= milestones[next_milestone_idx]:
+                next_milestone_idx += 1
+            print(f"[DOCKER LOG] Database insertion: {milestones[next_milestone_idx - 1]}% complete ({loaded} records)")
+            sys.stdout.flush()
+
+    for _, record_end, tx in store.iter_records(start_offset):
+        batch.append(tx)
+        batch_end = record_end
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    elapsed = time.time() - start_time
+    rate = loaded / elapsed if elapsed > 0 else 0
+    print(f"[DOCKER LOG] Inserted {loaded} new records into the database ({rate:.0f} tx/s)")
+    return loaded
+
+def main(full=False):
+    try:
+        start_time = time.time()
+        # Make sure every MERGE key is backed by a constraint before writing
+        ensure_schema()
+        # Seed leaderboards from existing nodes before batches start merging into them
+        ensure_leaderboards()
+
         # First check and update transaction statuses
         print("[DOCKER LOG] Starting transaction verification process...")
-        start_time = time.time()
-        
-        updated_count, unconfirmed_txs_count, transactions = update_transaction_statuses()
-        print(f'[DOCKER LOG] Updated {updated_count} out of {unconfirmed_txs_count} unconfirmed transactions')
         
-        if transactions:
-            # Now insert all transactions into Neo4j
-            bulk_insert_transactions(transactions)
-        else:
-            print("[DOCKER LOG] No transactions to insert.")
+        store = open_master_store()
+        try:
+            updated_count, unconfirmed_txs_count = update_transaction_statuses(store)
+            print(f'[DOCKER LOG] Updated {updated_count} out of {unconfirmed_txs_count} unconfirmed transactions')
+            
+            if full:
+                # Re-MERGE everything, then move the watermark to the end of the store
+                start_offset = 0
+                end_offset = store.size()
+                total = len(store)
+                if total:
+                    bulk_insert_transactions(store.iter_latest(), total=total)
+                checkpoint = make_checkpoint(store, end_offset)
+                insert_transactions([], checkpoint=checkpoint)
+                write_local_checkpoint(checkpoint)
+            else:
+                # Only what was appended (new transactions and status deltas) since the last load
+                start_offset = resume_offset(store)
+                load_new_records(store, start_offset)
+
+            # Extend the address clusters with the new records and tag changed wallets
+            try:
+                # A reload from zero may mean a fresh database, so every entity id is rewritten
+                cluster_and_write(store, rewrite_all=start_offset == 0)
+            except Exception as e:
+                print(f"[DOCKER LOG] Address clustering failed (will catch up next run): {e}")
+            # Per-block fee percentiles, histograms and outlier flags for blocks that have none yet
+            try:
+                update_block_fee_stats()
+            except Exception as e:
+                print(f"[DOCKER LOG] Fee analytics failed (will catch up next run): {e}")
+        finally:
+            store.close()
             
+        cache_stats = get_tx_cache().stats()
+        print(f"[DOCKER LOG] Status cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+              f"{cache_stats['evictions']} evictions, {cache_stats['entries']} entries")
         end_time = time.time()
         print(f"[DOCKER LOG] Total execution time: {end_time - start_time:.2f} seconds")
     except Exception as e:
         print(f"[DOCKER LOG] Error loading or inserting transactions: {e}")
+    finally:
+        get_tx_cache().close()
+        close_connections()
+
+def export_csv(out_dir):
+    """Offline mode: stream the backup into neo4j-admin import CSV files instead of writing over Bolt"""
+    start_time = time.time()
+    print(f"[DOCKER LOG] Exporting the master store to neo4j-admin import files in {out_dir}...")
+    store = open_master_store()
+    try:
+        counts = export_backup_to_csv(store.iter_latest(), out_dir, input_bytes=store.size())
+    finally:
+        store.close()
+    for stem, count in counts.items():
+        print(f"[DOCKER LOG] {stem}: {count} rows")
+    print(f"[DOCKER LOG] CSV export completed in {time.time() - start_time:.2f} seconds")
+    print(f"[DOCKER LOG] Import into an empty database with:\n{import_command(out_dir)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load the transaction backup into Neo4j")
+    parser.add_argument("--export-csv", metavar="DIR",
+                        help="write neo4j-admin import CSV files to DIR instead of loading over Bolt")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the loader checkpoint and re-insert every transaction")
+    args = parser.parse_args()
+    if args.export_csv:
+        export_csv(args.export_csv)
+    else:
+        main(full=args.full)
\ No newline at end of file
@@ -0,0 +1,359 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from backup_reader import iter_backup_transactions
+from spool import iter_segment, list_segments, load_index, remove_segments
+from config import MASTER_STORE_PATH, SPOOL_DIR
+
+LEGACY_BACKUP_PATH = "bitcoin_transactions_backup.json"
+
+def _is_confirmed(tx):
+    return 1 if (tx.get("status") or {}).get("confirmed", False) else 0
+
+class MasterStore:
+    """Append-only JSONL store of every transaction seen, with a persistent txid index.
+
+    The index is a small SQLite table mapping txid to the byte offset of the
+    newest version of that record, so membership checks and appends cost time
+    proportional to the new data only. Status changes are appended as new
+    versions; readers that want the current state use iter_latest(). The
+    index also keeps each newest version's confirmed flag, so the unconfirmed
+    set comes from a partial index instead of parsing the whole store.
+    """
+
+    def __init__(self, path=MASTER_STORE_PATH, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + ".idx.sqlite"
+        self._db = sqlite3.connect(self.index_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS txids "
+            "(txid TEXT PRIMARY KEY, offset INTEGER NOT NULL, confirmed INTEGER) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID")
+        self._db.commit()
+        self._drop_torn_tail()
+        self._index_confirmed()
+
+    def _index_confirmed(self):
+        """Add the confirmed column to an index created before it existed, filling it in with one pass"""
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(txids)")]
+        if "confirmed" not in columns:
+            self._db.execute("ALTER TABLE txids ADD COLUMN confirmed INTEGER")
+        if self.get_meta("confirmed_indexed") is None:
+            print(f"[MASTER STORE] Indexing confirmation status of {self.path} (one-time)")
+            rows = []
+            for offset, _, tx in self.iter_records():
+                rows.append((_is_confirmed(tx), tx["txid"], offset))
+                if len(rows) >= 10000:
+                    self._db.executemany("UPDATE txids SET confirmed = ? WHERE txid = ? AND offset = ?", rows)
+                    rows = []
+            self._db.executemany("UPDATE txids SET confirmed = ? WHERE txid = ? AND offset = ?", rows)
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('confirmed_indexed', '1')")
+        self._db.execute("CREATE INDEX IF NOT EXISTS txids_unconfirmed ON txids (confirmed) WHERE confirmed = 0")
+        self._db.commit()
+
+    def _drop_torn_tail(self, block_size=64 * 1024):
+        """Cut a partial last line left by an interrupted append, so the next record starts on its own line"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - block_size)
+                f.seek(start)
+                newline = f.read(position - start).rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                print(f"[MASTER STORE] Dropping {end - position} bytes of a torn last record in {self.path}")
+                f.truncate(position)
+
+    def get_meta(self, key):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+        self._db.commit()
+
+    def __len__(self):
+        return self._db.execute("SELECT count(*) FROM txids").fetchone()[0]
+
+    def known_txids(self, txids, chunk_size=500):
+        """Return the subset of `txids` already in the store"""
+        txids = list(txids)
+        known = set()
+        for i in range(0, len(txids), chunk_size):
+            chunk = txids[i:i + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._db.execute(f"SELECT txid FROM txids WHERE txid IN ({placeholders})", chunk)
+            known.update(row[0] for row in rows)
+        return known
+
+    def unconfirmed_txids(self):
+        """Txids whose newest version is unconfirmed, read from the index without touching the store"""
+        return [row[0] for row in self._db.execute("SELECT txid FROM txids WHERE confirmed = 0")]
+
+    def unconfirmed_of(self, txids, chunk_size=500):
+        """Return the subset of `txids` stored with an unconfirmed newest version"""
+        txids = list(txids)
+        found = set()
+        for i in range(0, len(txids), chunk_size):
+            chunk = txids[i:i + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._db.execute(f"SELECT txid FROM txids WHERE confirmed = 0 AND txid IN ({placeholders})", chunk)
+            found.update(row[0] for row in rows)
+        return found
+
+    def offset_of(self, txid):
+        row = self._db.execute("SELECT offset FROM txids WHERE txid = ?", (txid,)).fetchone()
+        return row[0] if row else None
+
+    def append(self, transactions, replace=False):
+        """Append records; unless `replace` is set, txids already stored are skipped"""
+        latest = {}
+        for tx in transactions:
+            if tx.get("txid"):
+                latest[tx["txid"]] = tx
+        if not replace:
+            for txid in self.known_txids(latest):
+                del latest[txid]
+        if not latest:
+            return 0
+
+        entries = []
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            for txid, tx in latest.items():
+                line = (json.dumps(tx) + "\n").encode("utf-8")
+                f.write(line)
+                entries.append((txid, offset, _is_confirmed(tx)))
+                offset += len(line)
+        self._db.executemany("INSERT OR REPLACE INTO txids (txid, offset, confirmed) VALUES (?, ?, ?)", entries)
+        self._db.commit()
+        return len(entries)
+
+    def update(self, transactions):
+        """Append new versions of existing records, e.g. after a confirmation"""
+        return self.append(transactions, replace=True)
+
+    def get(self, txid):
+        offset = self.offset_of(txid)
+        if offset is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def iter_records(self, start_offset=0):
+        """Yield (offset, end_offset, transaction) for every stored version, in append order"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(start_offset)
+            offset = start_offset
+            for line in f:
+                try:
+                    tx = json.loads(line)
+                except ValueError:
+                    tx = None  # torn line from an interrupted append
+                if tx is not None:
+                    yield offset, offset + len(line), tx
+                offset += len(line)
+
+    def iter_latest(self, chunk_size=1000):
+        """Yield only the newest version of each transaction"""
+        chunk = []
+        for offset, _, tx in self.iter_records():
+            chunk.append((offset, tx))
+            if len(chunk) >= chunk_size:
+                yield from self._filter_latest(chunk)
+                chunk = []
+        if chunk:
+            yield from self._filter_latest(chunk)
+
+    def _filter_latest(self, chunk):
+        txids = [tx["txid"] for _, tx in chunk]
+        placeholders = ",".join("?" * len(txids))
+        current = dict(self._db.execute(
+            f"SELECT txid, offset FROM txids WHERE txid IN ({placeholders})", txids
+        ))
+        for offset, tx in chunk:
+            if current.get(tx["txid"]) == offset:
+                yield tx
+
+    def size(self):
+        """Current length of the store in bytes"""
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def fingerprint(self, offset, window=256):
+        """Hash of the bytes just before `offset`; detects a store that was replaced or rewritten"""
+        if offset <= 0:
+            return ""
+        if offset > self.size():
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(max(0, offset - window))
+            return hashlib.sha256(f.read(offset - max(0, offset - window))).hexdigest()
+
+    def export_json(self, out_path, indent=2):
+        """Write the current state as the legacy pretty-printed JSON array"""
+        count = 0
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write("[")
+            for tx in self.iter_latest():
+                f.write(",\n" if count else "\n")
+                f.write(json.dumps(tx, indent=indent))
+                count += 1
+            f.write("\n]\n" if count else "]\n")
+        return count
+
+    def close(self):
+        self._db.close()
+
+def import_legacy_json(store, json_path=LEGACY_BACKUP_PATH, chunk_size=1000):
+    """Stream a legacy JSON array backup into the store"""
+    imported = 0
+    chunk = []
+    for tx in iter_backup_transactions(json_path):
+        chunk.append(tx)
+        if len(chunk) >= chunk_size:
+            imported += store.append(chunk)
+            chunk = []
+    if chunk:
+        imported += store.append(chunk)
+    return imported
+
+def open_master_store(path=MASTER_STORE_PATH, legacy_path=LEGACY_BACKUP_PATH):
+    """Open the store, seeding it once from the legacy JSON backup.
+
+    Completion is recorded in the index, so a seed interrupted partway is
+    resumed on the next open (already stored txids are skipped).
+    """
+    store = MasterStore(path)
+    if store.get_meta("seeded_from") is None and os.path.exists(legacy_path):
+        print(f"Seeding {path} from {legacy_path}...")
+        imported = import_legacy_json(store, legacy_path)
+        store.set_meta("seeded_from", legacy_path)
+        print(f"Imported {imported} transactions from {legacy_path}")
+    return store
+
+def iter_latest_spooled(spool_dir=SPOOL_DIR):
+    """Yield only the newest spooled copy of each txid (e.g. the confirmed one BlockConfirmer appended)"""
+    latest = load_index(spool_dir)
+    for segment in list_segments(spool_dir):
+        for offset, tx in iter_segment(spool_dir, segment):
+            # Records missing from the index (none after spool repair) are kept rather than lost
+            if latest.get(tx.get("txid"), (segment, offset)) == (segment, offset):
+                yield tx
+
+def _merge_chunk(store, chunk):
+    """Append unseen txids and replace stored unconfirmed copies that are now confirmed"""
+    merged = store.append(chunk)
+    confirmed = {tx["txid"]: tx for tx in chunk if (tx.get("status") or {}).get("confirmed", False)}
+    upgraded = store.update([confirmed[txid] for txid in store.unconfirmed_of(confirmed)]) if confirmed else 0
+    return merged, upgraded
+
+def merge_spool_to_master(spool_dir=SPOOL_DIR, store=None, chunk_size=1000, cluster=True):
+    """Append spooled transactions the master store has not seen, then drop the spool.
+
+    Only the newest spooled copy of each txid is merged, and a confirmed copy
+    replaces an unconfirmed version the store already holds.
+
+    With `cluster`, the newly appended records are folded into the address
+    clusters right away (only the appended tail is read), so realtime data
+    gets Wallet.entity ids without waiting for the next loader run.
+    """
+    own_store = store is None
+    if own_store:
+        store = open_master_store()
+    try:
+        merged = upgraded = 0
+        chunk = []
+        for tx in iter_latest_spooled(spool_dir):
+            chunk.append(tx)
+            if len(chunk) >= chunk_size:
+                counts = _merge_chunk(store, chunk)
+                merged, upgraded = merged + counts[0], upgraded + counts[1]
+                chunk = []
+        if chunk:
+            counts = _merge_chunk(store, chunk)
+            merged, upgraded = merged + counts[0], upgraded + counts[1]
+
+        if merged or upgraded:
+            print(f"Merged {merged} new transactions into {store.path} ({upgraded} confirmed since stored)")
+        else:
+            print("No new transactions to merge.")
+        remove_segments(spool_dir)
+
+        if (merged or upgraded) and cluster:
+            from address_clustering import cluster_and_write
+            try:
+                cluster_and_write(store)
+            except Exception as e:
+                # The clusters keep their own store offset, so the next merge or loader run catches up
+                print(f"[CLUSTERS] Clustering after merge failed (will catch up next run): {e}")
+        return merged + upgraded
+    finally:
+        if own_store:
+            store.close()
+
+def check_merge(records_between=1500):
+    """Spool an unconfirmed tx, more than one merge chunk of other records, then its confirmed copy,
+    and check that the merged master store holds the confirmed version; returns the number of failures"""
+    import tempfile
+    from spool import SpoolWriter
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        spool_dir = f"{tmp}/spool"
+        target = f"{0xc0ffee:064x}"
+        writer = SpoolWriter(spool_dir)
+        writer.append({"txid": target, "status": {"confirmed": False}})
+        for i in range(records_between):
+            writer.append({"txid": f"{i:064x}", "status": {"confirmed": False}})
+        writer.append({"txid": target, "status": {"confirmed": True, "block_height": 1}})
+        writer.close()
+
+        store = MasterStore(f"{tmp}/master.jsonl")
+        try:
+            merge_spool_to_master(spool_dir, store=store, cluster=False)
+            if not (store.get(target) or {}).get("status", {}).get("confirmed"):
+                failures += 1
+                print("[MASTER STORE] FAILED: the later confirmed copy was not merged")
+
+            # A confirmed copy in a later merge replaces the unconfirmed version already stored
+            writer = SpoolWriter(spool_dir)
+            writer.append({"txid": f"{0:064x}", "status": {"confirmed": True, "block_height": 2}})
+            writer.close()
+            merge_spool_to_master(spool_dir, store=store, cluster=False)
+            if not store.get(f"{0:064x}")["status"].get("confirmed") or f"{0:064x}" in store.unconfirmed_txids():
+                failures += 1
+                print("[MASTER STORE] FAILED: a confirmation spooled after the first merge was dropped")
+        finally:
+            store.close()
+    print(f"[MASTER STORE] Merge check finished with {failures} failures")
+    return failures
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "check":
+        sys.exit(1 if check_merge() else 0)
+    store = open_master_store()
+    try:
+        if command == "export":
+            out_path = sys.argv[2] if len(sys.argv) > 2 else LEGACY_BACKUP_PATH
+            print(f"Exported {store.export_json(out_path)} transactions to {out_path}")
+        elif command == "import-json" and len(sys.argv) > 2:
+            print(f"Imported {import_legacy_json(store, sys.argv[2])} transactions from {sys.argv[2]}")
+        elif command == "merge":
+            merge_spool_to_master(store=store)
+        else:
+            print("Usage: python master_store.py [export [PATH] | import-json PATH | merge | check]")
+            sys.exit(1)
+    finally:
+        store.close()
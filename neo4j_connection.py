@@ -0,0 +1,73 @@
+import atexit
+import threading
+from neo4j import GraphDatabase
+from config import (
+    NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, NEO4J_DATABASE,
+    NEO4J_MAX_POOL_SIZE, NEO4J_ACQUISITION_TIMEOUT, NEO4J_REFRESH_SCHEMA, NEO4J_MAX_RETRY_TIME
+)
+
+# Process-wide connection state, created lazily on first use
+_lock = threading.Lock()
+_driver = None
+_graph = None
+
+def _driver_config():
+    return {
+        "max_connection_pool_size": NEO4J_MAX_POOL_SIZE,
+        "connection_acquisition_timeout": NEO4J_ACQUISITION_TIMEOUT,
+        "max_transaction_retry_time": NEO4J_MAX_RETRY_TIME
+    }
+
+def get_driver():
+    """Return the shared, pooled Neo4j driver (created on first call)"""
+    global _driver
+    if _driver is None:
+        with _lock:
+            if _driver is None:
+                driver = GraphDatabase.driver(
+                    NEO4J_URI,
+                    auth=(NEO4J_USERNAME, NEO4J_PASSWORD),
+                    **_driver_config()
+                )
+                driver.verify_connectivity()
+                _driver = driver
+    return _driver
+
+def get_session(**kwargs):
+    """Open a session on the shared driver against the configured database"""
+    return get_driver().session(database=NEO4J_DATABASE, **kwargs)
+
+def get_graph(refresh_schema=None):
+    """Return the shared LangChain Neo4jGraph; schema refresh is opt-in"""
+    global _graph
+    if refresh_schema is None:
+        refresh_schema = NEO4J_REFRESH_SCHEMA
+    if _graph is None:
+        with _lock:
+            if _graph is None:
+                from langchain_neo4j import Neo4jGraph
+                _graph = Neo4jGraph(
+                    url=NEO4J_URI,
+                    username=NEO4J_USERNAME,
+                    password=NEO4J_PASSWORD,
+                    database=NEO4J_DATABASE,
+                    refresh_schema=refresh_schema,
+                    driver_config=_driver_config()
+                )
+                return _graph
+    if refresh_schema:
+        _graph.refresh_schema()
+    return _graph
+
+def close_connections():
+    """Close the shared driver and graph; safe to call more than once"""
+    global _driver, _graph
+    with _lock:
+        if _graph is not None:
+            _graph.close()
+            _graph = None
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+atexit.register(close_connections)
@@ -1,7 +1,7 @@
-from langchain_neo4j import Neo4jGraph
-from config import NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, smurfing_query, high_value_query
+from config import smurfing_query, high_value_query
 import os
-from graph_utils import connection_to_graph, query_Neo4j_database
+from graph_utils import query_Neo4j_database
+from peel_chains import peel_chain_results
 from langchain_community.llms import Ollama
 from langchain.chains.summarize import load_summarize_chain
 from langchain_core.documents import Document
@@ -296,3 +296,63 @@ Transaction IDs: {', '.join(pattern['transaction_ids'][:5])}... (showing first 5
         final_summary = chunk_summaries[0]
     
     return final_summary
+
+
+def analyze_peel_chains(llm):
+    # Extend the cached chains with new blocks, then take the best-scoring ones
+    print("Detecting peel chains...")
+    chains = peel_chain_results()
+    print(f"Found {len(chains)} peel chains")
+
+    if not chains:
+        print("No peel chains detected.")
+        return "No peel chains detected in the database."
+
+    map_prompt = ChatPromptTemplate.from_messages([
+        ("system", """
+You are a financial crime analyst. Analyze this Bitcoin peel chain: a sequence of transactions where
+each one spends the previous change output, sends a small amount away and keeps the large remainder.
+Focus on the chain's length, pace, how much value was peeled off and potential money laundering indicators.
+"""),
+        ("human", "{text}")
+    ])
+
+    reduce_prompt = ChatPromptTemplate.from_messages([
+        ("system", """
+Create a comprehensive summary of these detected peel chains in the Bitcoin blockchain.
+Include overall patterns, key statistics, notable recipients of peeled value, and potential money laundering implications.
+"""),
+        ("human", "{text}")
+    ])
+
+    documents = []
+    print("Formatting peel chains for analysis...")
+    for chain in chains:
+        text = f"""
+Potential Peel Chain:
+Start Transaction: {chain['start_txid']}
+Length: {chain['length']} transactions
+Blocks: {chain['first_block']} to {chain['last_block']}
+Start Value: {chain['start_value'] / 100000000:.8f} BTC ({chain['start_value']} satoshis)
+Remaining Change: {chain['end_value'] / 100000000:.8f} BTC ({chain['end_value']} satoshis)
+Total Peeled: {chain['total_peeled'] / 100000000:.8f} BTC ({chain['total_peeled']} satoshis)
+Peel Recipients: {', '.join(chain['peel_addresses'][:5])}... (showing first 5 of {len(chain['peel_addresses'])})
+Score: {chain['score']}
+"""
+        documents.append(Document(page_content=text))
+
+    chain = load_summarize_chain(
+        llm,
+        chain_type="map_reduce",
+        map_prompt=map_prompt,
+        combine_prompt=reduce_prompt
+    )
+
+    print("Generating peel chain narrative...")
+    summary = chain.invoke(documents)
+
+    if isinstance(summary, dict):
+        if "output_text" in summary:
+            return summary["output_text"]
+        return str(summary)
+    return summary
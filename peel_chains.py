@@ -0,0 +1,213 @@
+import json
+import math
+import os
+import sys
+from config import (
+    PEEL_CACHE_PATH, PEEL_MAX_PEEL_RATIO, PEEL_MAX_GAP_BLOCKS, PEEL_MIN_LENGTH,
+    PEEL_WINDOW_BLOCKS, PEEL_BLOCK_BATCH, PEEL_SETTLE_BLOCKS, PEEL_TOP_K
+)
+
+# One input address and two output addresses, inside a block-height range
+CYPHER_PEEL_CANDIDATES = """
+    MATCH (t:Transaction)
+    WHERE t.block_height >= $min_height AND t.block_height <= $max_height
+    MATCH (s:Wallet)-[:SENT]->(t)
+    WITH t, collect(s.address) AS senders
+    WHERE size(senders) = 1
+    MATCH (t)-[r:RECEIVED]->(w:Wallet)
+    WITH t, senders[0] AS sender, collect({address: w.address, value: r.value}) AS outputs
+    WHERE size(outputs) = 2
+    RETURN t.txid AS txid, t.block_height AS height, sender, outputs
+    ORDER BY height, txid
+"""
+
+CYPHER_TIP_HEIGHT = """
+    MATCH (t:Transaction) WHERE t.block_height IS NOT NULL
+    RETURN t.block_height AS height ORDER BY t.block_height DESC LIMIT 1
+"""
+
+def split_peel(row, max_ratio=PEEL_MAX_PEEL_RATIO):
+    """(change, peel) outputs of a 1-in/2-out transaction, or None if it does not look like a peel"""
+    outputs = row["outputs"]
+    if any(o["value"] is None or o["value"] <= 0 for o in outputs) or outputs[0]["address"] == outputs[1]["address"]:
+        return None
+    change, peel = sorted(outputs, key=lambda o: (-o["value"], o["address"]))
+    if peel["value"] > max_ratio * change["value"]:
+        return None
+    return change, peel
+
+def _block_order(rows):
+    """Order one block's candidates so a transaction comes after the one whose change it spends"""
+    produced = {}
+    for row in rows:
+        produced.setdefault(row["change"]["address"], []).append(row)
+    children = {}
+    roots = []
+    for row in rows:
+        parents = [p for p in produced.get(row["sender"], ()) if p is not row]
+        if parents:
+            children.setdefault(parents[0]["txid"], []).append(row)
+        else:
+            roots.append(row)
+    ordered, seen = [], set()
+    stack = list(reversed(roots))
+    while stack:
+        row = stack.pop()
+        if row["txid"] in seen:
+            continue
+        seen.add(row["txid"])
+        ordered.append(row)
+        stack.extend(reversed(children.get(row["txid"], ())))
+    # Change-address loops inside one block have no root; keep them in txid order
+    ordered.extend(row for row in rows if row["txid"] not in seen)
+    return ordered
+
+def chain_score(chain):
+    """Longer chains that peel off more value score higher: hops * log10(1 + peeled satoshis)"""
+    return len(chain["txids"]) * math.log10(1 + sum(chain["peeled"]))
+
+class PeelChainDetector:
+    """Peel chains built in one pass over 1-in/2-out transactions in block order.
+
+    Each transaction either extends the open chain whose change address it
+    spends, or starts a new chain; `open` maps a chain's current change
+    address to the chain, so every transaction costs one dict lookup. State
+    is cached with the processed block range, so later runs only read new
+    blocks and keep extending the chains that are still open.
+    """
+
+    def __init__(self, path=PEEL_CACHE_PATH):
+        self.path = path
+        self.min_height = None
+        self.max_height = None
+        self.chains = []
+        self.open = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.min_height = state["min_height"]
+            self.max_height = state["max_height"]
+            self.chains = state["chains"]
+            for chain in sorted(self.chains, key=lambda c: c["heights"][-1]):
+                if self._is_open(chain):
+                    self.open[chain["change_address"]] = chain
+
+    def _is_open(self, chain, height=None):
+        height = self.max_height if height is None else height
+        return height is None or chain["heights"][-1] >= height - PEEL_MAX_GAP_BLOCKS
+
+    def add_block(self, rows):
+        """Feed one block's candidate rows (already filtered by `split_peel`)"""
+        for row in _block_order(rows):
+            change, peel = row["change"], row["peel"]
+            chain = self.open.pop(row["sender"], None)
+            if chain is None or not self._is_open(chain, row["height"]):
+                chain = {"txids": [], "heights": [], "peeled": [], "peel_addresses": [], "change_addresses": [],
+                         "start_value": change["value"] + peel["value"]}
+                self.chains.append(chain)
+            chain["txids"].append(row["txid"])
+            chain["heights"].append(row["height"])
+            chain["peeled"].append(peel["value"])
+            chain["peel_addresses"].append(peel["address"])
+            chain["change_addresses"].append(change["address"])
+            chain["change_address"] = change["address"]
+            chain["end_value"] = change["value"]
+            self.open[change["address"]] = chain
+
+    def add_rows(self, rows, max_ratio=PEEL_MAX_PEEL_RATIO):
+        """Feed candidate rows ordered by height (as CYPHER_PEEL_CANDIDATES returns them)"""
+        block, height = [], None
+        for row in rows:
+            split = split_peel(row, max_ratio)
+            if split is None:
+                continue
+            if row["height"] != height and block:
+                self.add_block(block)
+                block = []
+            height = row["height"]
+            block.append(dict(row, change=split[0], peel=split[1]))
+        if block:
+            self.add_block(block)
+
+    def prune(self):
+        """Close chains that went quiet for PEEL_MAX_GAP_BLOCKS and drop the closed short ones"""
+        self.open = {address: chain for address, chain in self.open.items() if self._is_open(chain)}
+        open_ids = {id(chain) for chain in self.open.values()}
+        self.chains = [chain for chain in self.chains
+                       if len(chain["txids"]) >= PEEL_MIN_LENGTH or id(chain) in open_ids]
+
+    def save(self):
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"min_height": self.min_height, "max_height": self.max_height, "chains": self.chains}, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def top(self, k=PEEL_TOP_K, min_length=PEEL_MIN_LENGTH):
+        chains = [chain for chain in self.chains if len(chain["txids"]) >= min_length]
+        chains.sort(key=chain_score, reverse=True)
+        return [chain_record(chain) for chain in chains[:k]]
+
+def chain_record(chain):
+    return {
+        "start_txid": chain["txids"][0],
+        "txids": chain["txids"],
+        "length": len(chain["txids"]),
+        "first_block": chain["heights"][0],
+        "last_block": chain["heights"][-1],
+        "start_value": chain["start_value"],
+        "end_value": chain["end_value"],
+        "total_peeled": sum(chain["peeled"]),
+        "peeled": chain["peeled"],
+        "peel_addresses": chain["peel_addresses"],
+        "change_addresses": chain["change_addresses"],
+        "score": round(chain_score(chain), 2),
+    }
+
+def update_peel_chains(path=PEEL_CACHE_PATH):
+    """Extend the cached chains with blocks confirmed since the last run (first run: the last PEEL_WINDOW_BLOCKS)"""
+    from graph_utils import query_Neo4j_database
+    detector = PeelChainDetector(path)
+    rows = query_Neo4j_database(CYPHER_TIP_HEIGHT)
+    if not rows:
+        return detector
+    # Stay a few blocks behind the tip so late confirmations land before a block is read
+    end = rows[0]["height"] - PEEL_SETTLE_BLOCKS
+    if detector.max_height is not None and detector.max_height > rows[0]["height"]:
+        print("[PEEL] Cached range is ahead of the graph; rebuilding peel chains")
+        os.remove(path)
+        detector = PeelChainDetector(path)
+    if detector.max_height is None:
+        detector.min_height = detector.max_height = end - PEEL_WINDOW_BLOCKS
+
+    start = detector.max_height + 1
+    for low in range(start, end + 1, PEEL_BLOCK_BATCH):
+        high = min(low + PEEL_BLOCK_BATCH - 1, end)
+        detector.add_rows(query_Neo4j_database(CYPHER_PEEL_CANDIDATES, {"min_height": low, "max_height": high}))
+        detector.max_height = high
+    detector.prune()
+    detector.save()
+    if end >= start:
+        print(f"[PEEL] Processed blocks {start}-{end}; {len(detector.chains)} chains kept, {len(detector.open)} open")
+    return detector
+
+def peel_chain_results(k=PEEL_TOP_K):
+    """Top-k peel chains by score, after catching up with new blocks"""
+    return update_peel_chains().top(k)
+
+if __name__ == "__main__":
+    usage = "Usage: python peel_chains.py [update|rebuild|top [K]]"
+    command = sys.argv[1] if len(sys.argv) > 1 else "update"
+    if command not in ("update", "rebuild", "top"):
+        print(usage)
+        sys.exit(1)
+    from neo4j_connection import close_connections
+    try:
+        if command == "rebuild" and os.path.exists(PEEL_CACHE_PATH):
+            os.remove(PEEL_CACHE_PATH)
+        detector = update_peel_chains()
+        if command == "top":
+            for record in detector.top(int(sys.argv[2]) if len(sys.argv) > 2 else PEEL_TOP_K):
+                print(f"{record['score']:>8} {record['length']:>4} hops, blocks {record['first_block']}-"
+                      f"{record['last_block']}, peeled {record['total_peeled']} of {record['start_value']} sat "
+                      f"from {record['start_txid']}")
+    finally:
+        close_connections()
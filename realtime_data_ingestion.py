@@ -1,17 +1,33 @@
 import json
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from websocket import WebSocketApp
-from graph_utils import  insert_transaction
-from config import BLOCKCHAIN_WS_URL
-import os
-
-FINAL_JSON_PATH = "bitcoin_transactions_backup.json"
-
-TMP_JSONL_PATH = "bitcoin_transactions_realtime_tmp.jsonl"
+from neo4j_connection import close_connections
+from graph_utils import confirm_transactions_in_block, ensure_leaderboards, virtual_size
+from block_resolver import BlockConfirmationResolver
+from graph_schema import ensure_schema
+from ingest_pipeline import IngestPipeline
+from spool import SpoolWriter, list_segments, iter_segment, load_index, read_at
+from dedup_filter import SeenTxidFilter
+from fee_analytics import update_block_fee_stats, update_mempool_fee_stats
+from master_store import merge_spool_to_master
+from config import (
+    BLOCKCHAIN_WS_URL, INGEST_QUEUE_SIZE, INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL,
+    INGEST_WORKERS, INGEST_OVERFLOW_POLICY, INGEST_SPILL_PATH, INGEST_METRICS_INTERVAL,
+    INGEST_RETRY_BACKOFF, INGEST_MAX_RETRY_BACKOFF,
+    SPOOL_DIR, SPOOL_SEGMENT_BYTES, SPOOL_FLUSH_INTERVAL, SPOOL_FLUSH_BYTES, SPOOL_FSYNC,
+    DEDUP_CAPACITY, DEDUP_FP_RATE
+)
 
 
 def format_unconfirmed_tx(tx_raw):
     return {
         "txid": tx_raw.get("hash"),
+        "size": tx_raw.get("size"),
+        "vsize": virtual_size(tx_raw.get("weight"), tx_raw.get("size")),
+        "seen_time": tx_raw.get("time"),
         "status": {
             "confirmed": False,
             "block_height": None,
@@ -34,73 +50,189 @@ def format_unconfirmed_tx(tx_raw):
         ]
     }
 
-def handle_message(message):
+class BlockConfirmer:
+    """Confirm spooled mempool transactions as block announcements arrive.
+
+    Keeps txid -> spool location for every spooled transaction. For each new
+    block its txid list is fetched once, intersected with that map, and the
+    matches are confirmed with one graph write; the confirmed versions are
+    appended to the spool. Blocks are handled on a single background thread
+    so the websocket receive path never waits on HTTP or Neo4j.
+    """
+
+    def __init__(self, spool, pipeline, spool_dir=SPOOL_DIR, resolver=None, locations=None):
+        self.spool = spool
+        self.pipeline = pipeline
+        self.spool_dir = spool_dir
+        self.resolver = resolver or BlockConfirmationResolver()
+        self._pending = locations if locations is not None else {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="block-confirmer")
+
+    def track(self, txid, location):
+        with self._lock:
+            self._pending[txid] = location
+
+    def on_block(self, block):
+        self._executor.submit(self._confirm, block)
+        self._executor.submit(self._update_fee_stats)
+
+    def _update_fee_stats(self):
+        # A new block settles the one before it and changes what is still waiting in the mempool
+        try:
+            update_block_fee_stats()
+            update_mempool_fee_stats()
+        except Exception as e:
+            print(f"[FEES] Fee stats update failed: {e}")
+
+    def _confirm(self, block):
+        try:
+            height = block["height"]
+            block_txids = self.resolver.block_txids(block["hash"])
+            with self._lock:
+                matches = {txid: self._pending.pop(txid) for txid in block_txids if txid in self._pending}
+            if not matches:
+                print(f"[BLOCK] Block {height}: no spooled transactions included")
+                return
+
+            # Make sure buffered records are on disk before reading them back
+            self.spool.flush()
+            status = {
+                "confirmed": True,
+                "block_height": height,
+                "block_hash": block["hash"],
+                "block_time": block.get("time")
+            }
+            confirmed = []
+            for txid, (segment, offset) in matches.items():
+                tx = read_at(self.spool_dir, segment, offset)
+                if tx.get("status", {}).get("confirmed", False):
+                    continue
+                tx["status"] = status
+                self.spool.append(tx)
+                confirmed.append(tx)
+
+            updated = set(confirm_transactions_in_block(block, [tx["txid"] for tx in confirmed]))
+            # Transactions still queued for their first write go through the pipeline
+            # behind the unconfirmed version, so the confirmed one lands last
+            for tx in confirmed:
+                if tx["txid"] not in updated:
+                    self.pipeline.submit(tx)
+            print(f"[BLOCK] Block {height}: {len(confirmed)} spooled transactions confirmed "
+                  f"({len(updated)} updated in place, {len(confirmed) - len(updated)} queued)")
+        except Exception as e:
+            print(f"Error confirming block {block.get('height')}: {e}")
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+def block_from_message(block_raw):
+    return {
+        "height": block_raw.get("height"),
+        "hash": block_raw.get("hash"),
+        "time": block_raw.get("time")
+    }
+
+def handle_message(message, pipeline, spool, seen, confirmer):
+    """Receive path: parse, spool and enqueue; graph writes happen on the pipeline's writer threads"""
     try:
         data = json.loads(message)
+        if data.get("op") == "block":
+            confirmer.on_block(block_from_message(data.get("x", {})))
+            return
         tx_raw = data.get("x", {})
+        # Redeliveries after a reconnect are dropped before any spool or graph I/O
+        if seen.seen_before(tx_raw.get("hash")):
+            return
         tx_data = format_unconfirmed_tx(tx_raw)
-        # Write each tx as a line to a temp JSONL file
-        with open(TMP_JSONL_PATH, "a", encoding="utf-8") as f:
-            f.write(json.dumps(tx_data) + "\n")
-        insert_transaction(tx_data)
-        print(f"Ingested TX: {tx_data['txid']} | Confirmed: {tx_data['status']['confirmed']}")
+        # Buffered append to the current spool segment
+        location = spool.append(tx_data)
+        confirmer.track(tx_data["txid"], location)
+        pipeline.submit(tx_data)
     except Exception as e:
         print(f"Error processing message: {e}")
 
 def on_open(ws):
-    print("Subscribed to unconfirmed transactions")
+    print("Subscribed to unconfirmed transactions and new blocks")
     ws.send(json.dumps({"op": "unconfirmed_sub"}))
+    ws.send(json.dumps({"op": "blocks_sub"}))
 
-def merge_jsonl_to_master(jsonl_path, master_path):
-    # Load existing master file (list of dicts)
-    if os.path.exists(master_path):
-        with open(master_path, "r", encoding="utf-8") as f:
-            try:
-                master_list = json.load(f)
-            except Exception:
-                master_list = []
-    else:
-        master_list = []
-    master_txids = set(tx["txid"] for tx in master_list if "txid" in tx)
-
-    # Read all new transactions from the temp JSONL file
-    new_txs = []
-    if os.path.exists(jsonl_path):
-        with open(jsonl_path, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    tx = json.loads(line)
-                    if tx.get("txid") not in master_txids:
-                        new_txs.append(tx)
-                        master_txids.add(tx.get("txid"))
-                except Exception:
-                    continue
-
-    # Merge and save
-    if new_txs:
-        master_list.extend(new_txs)
-        with open(master_path, "w", encoding="utf-8") as f:
-            json.dump(master_list, f, indent=2)
-        print(f"Merged {len(new_txs)} new transactions into {master_path}")
-    else:
-        print("No new transactions to merge.")
+def replay_spool(spool_dir, pipeline):
+    """Re-send each spooled txid once (its latest spooled version) through the graph writers"""
+    latest = load_index(spool_dir)
+    count = skipped = 0
+    for segment in list_segments(spool_dir):
+        for offset, tx in iter_segment(spool_dir, segment):
+            # Records missing from the index (e.g. a torn .idx tail) are always replayed
+            location = latest.get(tx.get("txid"))
+            if location is not None and location != (segment, offset):
+                skipped += 1
+                continue
+            pipeline.submit(tx)
+            count += 1
+    print(f"Replayed {count} spooled transactions ({skipped} superseded or duplicate copies skipped)")
 
-    # Remove temp file
-    if os.path.exists(jsonl_path):
-        os.remove(jsonl_path)
+def warm_seen_filter(spool_index):
+    """Seed the seen-set with every txid already in the spool"""
+    seen = SeenTxidFilter(capacity=DEDUP_CAPACITY, fp_rate=DEDUP_FP_RATE)
+    loaded = seen.warm_start(spool_index)
+    print(f"Seen-txid filter warm-started with {loaded} spooled txids")
+    return seen
 
 if __name__ == "__main__":
     print("Starting real-time Bitcoin transaction ingestion...")
+    ensure_schema()
+    ensure_leaderboards()
+    pipeline = IngestPipeline(
+        workers=INGEST_WORKERS,
+        batch_size=INGEST_BATCH_SIZE,
+        flush_interval=INGEST_FLUSH_INTERVAL,
+        max_queue=INGEST_QUEUE_SIZE,
+        overflow=INGEST_OVERFLOW_POLICY,
+        spill_path=INGEST_SPILL_PATH,
+        retry_backoff=INGEST_RETRY_BACKOFF,
+        max_retry_backoff=INGEST_MAX_RETRY_BACKOFF
+    ).start()
+    if "--replay" in sys.argv:
+        replay_spool(SPOOL_DIR, pipeline)
+        pipeline.stop()
+        pipeline.report()
+        close_connections()
+        sys.exit(0)
+
+    spool_index = load_index(SPOOL_DIR)
+    seen = warm_seen_filter(spool_index)
+    spool = SpoolWriter(
+        SPOOL_DIR,
+        segment_bytes=SPOOL_SEGMENT_BYTES,
+        flush_interval=SPOOL_FLUSH_INTERVAL,
+        flush_bytes=SPOOL_FLUSH_BYTES,
+        fsync=SPOOL_FSYNC
+    )
+    confirmer = BlockConfirmer(spool, pipeline, SPOOL_DIR, locations=spool_index)
+    pipeline.start_reporter(INGEST_METRICS_INTERVAL, extra_reports=[seen.report])
     ws = WebSocketApp(
         BLOCKCHAIN_WS_URL,
         on_open=on_open,
-        on_message=lambda ws, msg: handle_message(msg),
+        on_message=lambda ws, msg: handle_message(msg, pipeline, spool, seen, confirmer),
         on_error=lambda ws, err: print(f"WebSocket error: {err}"),
         on_close=lambda ws, code, msg: print("WebSocket closed")
     )
+    # The Streamlit app stops us with SIGTERM; close the socket so queued writes still drain
+    signal.signal(signal.SIGTERM, lambda signum, frame: ws.close())
     try:
         ws.run_forever()
     except KeyboardInterrupt:
-        print("\nInterrupted! Merging session transactions into master file...")
-        merge_jsonl_to_master(TMP_JSONL_PATH, FINAL_JSON_PATH)
-        print("Safe exit. All transactions are now in the master JSON list.")
\ No newline at end of file
+        print("\nInterrupted! Merging session transactions into master store...")
+        confirmer.close()
+        spool.close()
+        merge_spool_to_master(SPOOL_DIR)
+        print("Safe exit. All transactions are now in the master store.")
+    finally:
+        confirmer.close()
+        spool.close()
+        print("Draining queued transactions into Neo4j...")
+        pipeline.stop()
+        pipeline.report()
+        seen.report()
+        close_connections()
\ No newline at end of file
@@ -0,0 +1,207 @@
+import json
+import os
+import re
+import threading
+
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{6})\.jsonl$")
+
+def segment_path(directory, segment):
+    return os.path.join(directory, f"segment-{segment:06d}.jsonl")
+
+def index_path(directory, segment):
+    return os.path.join(directory, f"segment-{segment:06d}.idx")
+
+def list_segments(directory):
+    """Segment numbers present in the spool directory, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    segments = []
+    for name in os.listdir(directory):
+        match = SEGMENT_PATTERN.match(name)
+        if match:
+            segments.append(int(match.group(1)))
+    return sorted(segments)
+
+def _drop_torn_tail(path, block_size=64 * 1024):
+    """Cut a partial last line left by a crash; returns True if anything was cut"""
+    with open(path, "r+b") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - block_size)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            print(f"[SPOOL] Dropping {end - position} bytes of a torn last record in {path}")
+            f.truncate(position)
+            return True
+    return False
+
+def _count_lines(path, block_size=1024 * 1024):
+    with open(path, "rb") as f:
+        return sum(block.count(b"\n") for block in iter(lambda: f.read(block_size), b""))
+
+def repair_segment(directory, segment):
+    """Make a segment safe to append to after a crash.
+
+    A torn last record is truncated, and the `.idx` sidecar is rebuilt from the
+    data whenever it no longer lists exactly the segment's records (torn index
+    line, entries for cut records, or records the index never got).
+    """
+    data = segment_path(directory, segment)
+    if not os.path.exists(data):
+        return
+    truncated = _drop_torn_tail(data)
+    size = os.path.getsize(data)
+    idx = index_path(directory, segment)
+    entries = 0
+    consistent = os.path.exists(idx)
+    if consistent:
+        with open(idx, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if not line.endswith("\n") or len(parts) != 2 or not parts[1].isdigit() or int(parts[1]) >= size:
+                    consistent = False
+                    break
+                entries += 1
+    if truncated or not consistent or entries != _count_lines(data):
+        with open(idx + ".tmp", "w", encoding="utf-8") as f:
+            for offset, tx in iter_segment(directory, segment):
+                f.write(f"{tx.get('txid')}\t{offset}\n")
+        os.replace(idx + ".tmp", idx)
+        print(f"[SPOOL] Rebuilt the index of segment {segment}")
+
+class SpoolWriter:
+    """Long-lived, buffered writer for the realtime JSONL spool.
+
+    Records go to size-bounded segment files. Each segment has a sidecar
+    `.idx` file with one `txid<TAB>offset` line per record. Buffers are
+    flushed (and optionally fsynced) once `flush_bytes` are pending or every
+    `flush_interval` seconds, whichever comes first.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, flush_interval=1.0,
+                 flush_bytes=1024 * 1024, fsync=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._closed = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+
+        # Continue the newest segment if it still has room (after repairing a crash-torn tail)
+        segments = list_segments(directory)
+        self.segment = segments[-1] if segments else 1
+        repair_segment(directory, self.segment)
+        self._open_segment()
+        if self._offset >= self.segment_bytes:
+            self._rotate()
+
+        self._flusher = threading.Thread(target=self._flush_periodically, name="spool-flusher", daemon=True)
+        self._flusher.start()
+
+    def _open_segment(self):
+        self._data = open(segment_path(self.directory, self.segment), "ab", buffering=self.flush_bytes)
+        self._index = open(index_path(self.directory, self.segment), "a", encoding="utf-8")
+        self._offset = self._data.tell()
+
+    def _close_segment(self):
+        self._flush_locked()
+        self._data.close()
+        self._index.close()
+
+    def _rotate(self):
+        self._close_segment()
+        self.segment += 1
+        self._open_segment()
+
+    def _flush_locked(self):
+        self._data.flush()
+        self._index.flush()
+        if self.fsync:
+            os.fsync(self._data.fileno())
+            os.fsync(self._index.fileno())
+        self._pending = 0
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            with self._lock:
+                if self._pending and not self._closed.is_set():
+                    self._flush_locked()
+
+    def append(self, tx):
+        """Append one transaction and return its (segment, offset)"""
+        line = (json.dumps(tx) + "\n").encode("utf-8")
+        with self._lock:
+            if self._offset and self._offset + len(line) > self.segment_bytes:
+                self._rotate()
+            location = (self.segment, self._offset)
+            self._data.write(line)
+            self._index.write(f"{tx.get('txid')}\t{self._offset}\n")
+            self._offset += len(line)
+            self._pending += len(line)
+            if self._pending >= self.flush_bytes:
+                self._flush_locked()
+        return location
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            if self._closed.is_set():
+                return
+            self._closed.set()
+            self._close_segment()
+
+def iter_segment(directory, segment):
+    """Yield (offset, transaction) pairs from one segment, skipping a torn final line"""
+    with open(segment_path(directory, segment), "rb") as f:
+        offset = 0
+        for line in f:
+            try:
+                yield offset, json.loads(line)
+            except ValueError:
+                pass
+            offset += len(line)
+
+def iter_spool(directory):
+    """Yield every spooled transaction, reading segments sequentially"""
+    for segment in list_segments(directory):
+        for _, tx in iter_segment(directory, segment):
+            yield tx
+
+def load_index(directory):
+    """Map txid -> (segment, offset) from the sidecar index files"""
+    index = {}
+    for segment in list_segments(directory):
+        path = index_path(directory, segment)
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) == 2 and parts[1].isdigit():
+                    index[parts[0]] = (segment, int(parts[1]))
+    return index
+
+def read_at(directory, segment, offset):
+    """Read the single transaction stored at (segment, offset)"""
+    with open(segment_path(directory, segment), "rb") as f:
+        f.seek(offset)
+        return json.loads(f.readline())
+
+def remove_segments(directory, segments=None):
+    """Delete segment and index files once their contents have been merged"""
+    for segment in list_segments(directory) if segments is None else segments:
+        for path in (segment_path(directory, segment), index_path(directory, segment)):
+            if os.path.exists(path):
+                os.remove(path)
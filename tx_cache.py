@@ -0,0 +1,123 @@
+import json
+import sqlite3
+import threading
+import time
+from config import TX_CACHE_PATH, TX_CACHE_MAX_ENTRIES, TX_CACHE_UNCONFIRMED_TTL, TX_CACHE_NEGATIVE_TTL
+
+# Returned by get() when nothing usable is cached (None is a cached negative result)
+MISS = object()
+
+class TxCache:
+    """Persistent, size-bounded SQLite cache of Blockstream /tx lookups.
+
+    Confirmed transactions never change and are kept without expiry.
+    Unconfirmed documents and negative results (404 or failed lookups) expire
+    after a short TTL so a transient error is never pinned. When the table
+    grows past `max_entries`, expired rows go first, then the least recently
+    used ones.
+    """
+
+    def __init__(self, path=TX_CACHE_PATH, max_entries=TX_CACHE_MAX_ENTRIES,
+                 unconfirmed_ttl=TX_CACHE_UNCONFIRMED_TTL, negative_ttl=TX_CACHE_NEGATIVE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.unconfirmed_ttl = unconfirmed_ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes_since_evict = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS tx_cache (
+                txid TEXT PRIMARY KEY,
+                payload TEXT,
+                confirmed INTEGER NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS tx_cache_accessed ON tx_cache (accessed_at)")
+        self._db.commit()
+
+    def get(self, txid):
+        """Cached document, None for a cached negative result, or MISS"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT payload, expires_at FROM tx_cache WHERE txid = ?", (txid,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                self.misses += 1
+                return MISS
+            self._db.execute("UPDATE tx_cache SET accessed_at = ? WHERE txid = ?", (now, txid))
+            self._db.commit()
+            self.hits += 1
+        return json.loads(row[0]) if row[0] is not None else None
+
+    def put(self, txid, tx):
+        now = time.time()
+        confirmed = bool(tx and tx.get("status", {}).get("confirmed", False))
+        if confirmed:
+            expires_at = None
+        elif tx is None:
+            expires_at = now + self.negative_ttl
+        else:
+            expires_at = now + self.unconfirmed_ttl
+        payload = json.dumps(tx) if tx is not None else None
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tx_cache (txid, payload, confirmed, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (txid, payload, int(confirmed), expires_at, now)
+            )
+            self._db.commit()
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= 1000:
+                self._evict_locked()
+
+    def _evict_locked(self):
+        self._writes_since_evict = 0
+        removed = self._db.execute(
+            "DELETE FROM tx_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        ).rowcount
+        overflow = self._db.execute("SELECT count(*) FROM tx_cache").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            removed += self._db.execute(
+                "DELETE FROM tx_cache WHERE txid IN "
+                "(SELECT txid FROM tx_cache ORDER BY accessed_at LIMIT ?)", (overflow,)
+            ).rowcount
+        self._db.commit()
+        self.evictions += removed
+
+    def evict(self):
+        with self._lock:
+            self._evict_locked()
+
+    def stats(self):
+        with self._lock:
+            size = self._db.execute("SELECT count(*) FROM tx_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def close(self):
+        self.evict()
+        with self._lock:
+            self._db.close()
+
+_default_cache = None
+
+def get_tx_cache():
+    """Process-wide cache instance, opened on first use"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = TxCache()
+    return _default_cache